@@ -1,26 +1,173 @@
-# Import key functions from the submodules to make them available at the package level
-from .utils import voxelise_tractogram, calculate_surface_volume, calculate_surface_area, calculate_end_surface_area, calculate_radius, calculate_irregularity
-from .calculations import calculate_length, calculate_span, calculate_curl, calculate_tract_statistics
-from .tractogram_processing import preprocess_tractogram, load_tractogram_file, calculate_voxel_spacing, determine_surface_end, cluster_endpoints
-from .data_aggregation import aggregate_results_to_dataframe, save_to_excel
+import importlib
+
+# Public objects of the package and the submodule defining each. The submodules (and with them dipy,
+# scikit-learn, scipy, nibabel and pandas) are only imported when one of their objects is first used,
+# so that importing the package, running the CLI --help or importing a single helper stays fast.
+_EXPORTS = {
+    "voxelise_tractogram": "utils",
+    "voxelise_streamlines": "utils",
+    "voxelise_tractogram_tckmap": "utils",
+    "compute_track_density": "utils",
+    "accumulate_track_density": "utils",
+    "sparse_track_density": "utils",
+    "merge_sparse_density": "utils",
+    "compute_voxel_grid": "utils",
+    "VoxelGrid": "utils",
+    "calculate_surface_volume": "utils",
+    "calculate_surface_area": "utils",
+    "calculate_end_surface_area": "utils",
+    "calculate_radius": "utils",
+    "calculate_irregularity": "utils",
+    "flatten_streamlines": "calculations",
+    "streamline_lengths": "calculations",
+    "streamline_spans": "calculations",
+    "calculate_length": "calculations",
+    "calculate_span": "calculations",
+    "calculate_curl": "calculations",
+    "calculate_tract_statistics": "calculations",
+    "calculate_tract_statistics_from_summary": "calculations",
+    "preprocess_tractogram": "tractogram_processing",
+    "load_tractogram_file": "tractogram_processing",
+    "MappedTractogram": "tractogram_processing",
+    "calculate_voxel_spacing": "tractogram_processing",
+    "determine_surface_end": "tractogram_processing",
+    "cluster_endpoints": "tractogram_processing",
+    "cluster_endpoint_array": "tractogram_processing",
+    "two_means_labels": "tractogram_processing",
+    "streamline_endpoints": "tractogram_processing",
+    "ReferenceImage": "reference_registry",
+    "ReferenceRegistry": "reference_registry",
+    "get_reference": "reference_registry",
+    "TractContext": "tract_context",
+    "TractBatch": "tract_batch",
+    "grouped_mean": "tract_batch",
+    "iter_tck_chunks": "streaming",
+    "StreamingTractAccumulator": "streaming",
+    "stream_tract_statistics": "streaming",
+    "ResultCache": "result_cache",
+    "scan_files": "file_discovery",
+    "match_tract_files": "file_discovery",
+    "ResultWriter": "result_writers",
+    "CsvResultWriter": "result_writers",
+    "ParquetResultWriter": "result_writers",
+    "FeatherResultWriter": "result_writers",
+    "ExcelResultWriter": "result_writers",
+    "get_result_writer": "result_writers",
+    "tidy_rows": "result_writers",
+    "rows_to_dataframes": "result_writers",
+    "read_tidy_rows": "result_writers",
+    "JobJournal": "job_journal",
+    "shard_jobs": "sharding",
+    "merge_shards": "sharding",
+    "configure_streamline_cache": "streamline_cache",
+    "set_precision": "precision",
+    "get_precision": "precision",
+    "use_precision": "precision",
+    "iter_prefetched": "prefetch",
+    "resample_streamlines": "tract_profiles",
+    "tract_profile": "tract_profiles",
+    "approximate_tract_statistics": "approximate",
+    "TractDaemon": "daemon",
+    "DaemonClient": "daemon",
+    "watch_results": "watch",
+    "read_streamline_cache": "streamline_cache",
+    "write_streamline_cache": "streamline_cache",
+    "Profiler": "profiling",
+    "profiled": "profiling",
+    "active_profiler": "profiling",
+    "aggregate_results_to_dataframe": "data_aggregation",
+    "save_to_excel": "data_aggregation",
+    "write_results": "data_aggregation"
+}
+
 
 # Define the list of all public objects of the package
 __all__ = [
     "voxelise_tractogram",
+    "voxelise_streamlines",
+    "voxelise_tractogram_tckmap",
+    "compute_track_density",
+    "accumulate_track_density",
+    "sparse_track_density",
+    "merge_sparse_density",
+    "compute_voxel_grid",
+    "VoxelGrid",
     "calculate_surface_volume",
     "calculate_surface_area",
     "calculate_end_surface_area",
     "calculate_radius",
     "calculate_irregularity",
+    "flatten_streamlines",
+    "streamline_lengths",
+    "streamline_spans",
     "calculate_length",
     "calculate_span",
     "calculate_curl",
     "calculate_tract_statistics",
+    "calculate_tract_statistics_from_summary",
     "preprocess_tractogram",
     "load_tractogram_file",
+    "MappedTractogram",
     "calculate_voxel_spacing",
     "determine_surface_end",
     "cluster_endpoints",
+    "cluster_endpoint_array",
+    "two_means_labels",
+    "streamline_endpoints",
+    "ReferenceImage",
+    "ReferenceRegistry",
+    "get_reference",
+    "TractContext",
+    "TractBatch",
+    "grouped_mean",
+    "iter_tck_chunks",
+    "StreamingTractAccumulator",
+    "stream_tract_statistics",
+    "ResultCache",
+    "scan_files",
+    "match_tract_files",
+    "ResultWriter",
+    "CsvResultWriter",
+    "ParquetResultWriter",
+    "FeatherResultWriter",
+    "ExcelResultWriter",
+    "get_result_writer",
+    "tidy_rows",
+    "rows_to_dataframes",
+    "read_tidy_rows",
     "aggregate_results_to_dataframe",
-    "save_to_excel"
+    "save_to_excel",
+    "write_results",
+    "JobJournal",
+    "shard_jobs",
+    "merge_shards",
+    "configure_streamline_cache",
+    "read_streamline_cache",
+    "write_streamline_cache",
+    "set_precision",
+    "get_precision",
+    "use_precision",
+    "iter_prefetched",
+    "resample_streamlines",
+    "tract_profile",
+    "approximate_tract_statistics",
+    "TractDaemon",
+    "DaemonClient",
+    "watch_results",
+    "Profiler",
+    "profiled",
+    "active_profiler"
 ]
+
+
+def __getattr__(name):
+    # PEP 562: import the submodule of a public object on first access and cache the object
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
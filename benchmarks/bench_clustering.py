@@ -0,0 +1,67 @@
+import argparse
+import time
+import numpy as np
+from tract_analysis.tractogram_processing import two_means_labels
+from sklearn.cluster import KMeans
+
+
+def synthetic_endpoints(n_streamlines, seed=0):
+    """
+    Generate the endpoints of a synthetic bundle: two elongated, partly overlapping end regions.
+
+    Parameters:
+        n_streamlines (int): Number of streamlines.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        endpoints (ndarray): (2 * n_streamlines, 3) float32 array of endpoint coordinates.
+    """
+    rng = np.random.default_rng(seed)
+    first = rng.normal([-35, 0, 10], [4, 8, 6], (n_streamlines, 3))
+    last = rng.normal([30, -10, 0], [6, 5, 8], (n_streamlines, 3))
+    return np.vstack((first, last)).astype(np.float32)
+
+
+def label_agreement(labels, reference_labels):
+    """
+    Fraction of points on which two 2-cluster labelings agree, up to swapping the labels.
+    """
+    same = np.mean(labels == reference_labels)
+    return max(same, 1 - same)
+
+
+def timed(function, *args, repeat=3, **kwargs):
+    # Best wall time of several runs, to factor out first-touch page faults
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    """
+    Benchmark two_means_labels against scikit-learn KMeans on synthetic endpoints.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark endpoint clustering engines.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Numbers of streamlines to benchmark.')
+    parser.add_argument('--sample_size', type=int, default=20000,
+                        help='Subsample size of the subsample-then-assign mode.')
+    args = parser.parse_args()
+
+    print(f"{'streamlines':>12} {'kmeans s':>10} {'2-means s':>10} {'speedup':>8} {'agree':>7} "
+          f"{'sub s':>8} {'sub agree':>9}")
+    for n_streamlines in args.sizes:
+        endpoints = synthetic_endpoints(n_streamlines)
+        kmeans, kmeans_time = timed(KMeans(n_clusters=2).fit, endpoints)
+        labels, two_means_time = timed(two_means_labels, endpoints)
+        sub_labels, sub_time = timed(two_means_labels, endpoints, sample_size=args.sample_size)
+        print(f"{n_streamlines:>12} {kmeans_time:>10.3f} {two_means_time:>10.3f} "
+              f"{kmeans_time / two_means_time:>7.1f}x {label_agreement(labels, kmeans.labels_):>7.4f} "
+              f"{sub_time:>8.3f} {label_agreement(sub_labels, kmeans.labels_):>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+import numpy as np
+from tract_analysis.approximate import approximate_tract_statistics
+from tract_analysis.benchmarks.synthetic import synthetic_bundle, write_tck, write_reference, write_cohort, \
+    BUNDLE_SHAPES
+from tract_analysis.calculations import streamline_lengths, streamline_spans, calculate_surface_area
+from tract_analysis.data_aggregation import aggregate_results_to_dataframe
+from tract_analysis.reference_registry import ReferenceImage
+from tract_analysis.streaming import stream_tract_statistics
+from tract_analysis.tract_context import TractContext
+from tract_analysis.tractogram_processing import load_tractogram_file, cluster_endpoints
+from tract_analysis.utils import compute_voxel_grid, voxelise_tractogram, voxelise_tractogram_tckmap
+
+STAGES = ("load", "lengths", "spans", "cluster", "voxelise", "voxelise_file", "tckmap", "surface_area",
+          "tract_statistics", "approximate", "streaming")
+
+
+def measure(function, repeat=3):
+    """
+    Measure the best wall time of a function over several runs and its peak traced memory.
+
+    The timed runs are made without tracemalloc, whose allocation hooks would
+    slow them down; the peak memory comes from one extra traced run.
+
+    Parameters:
+        function (callable): Function called without arguments.
+        repeat (int): Number of timed runs.
+
+    Returns:
+        seconds (float): Best wall time in seconds.
+        peak_bytes (int): Peak memory allocated by Python and numpy during the traced run.
+    """
+    seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak_bytes
+
+
+def bundle_stages(tract_path, reference):
+    """
+    Build the benchmarked stages of a single bundle.
+
+    Each stage gets its inputs precomputed so that it is timed on its own.
+
+    Parameters:
+        tract_path (str): Path to the .tck file of the bundle.
+        reference (ReferenceImage): Reference image of the bundle.
+
+    Returns:
+        stages (dict): Stage name -> function called without arguments.
+    """
+    streamlines = load_tractogram_file(tract_path, reference).streamlines
+    grid = compute_voxel_grid(streamlines, reference)
+    return {
+        "load": lambda: load_tractogram_file(tract_path, reference),
+        "lengths": lambda: streamline_lengths(streamlines),
+        "spans": lambda: streamline_spans(streamlines),
+        "cluster": lambda: cluster_endpoints(streamlines),
+        "voxelise": lambda: compute_voxel_grid(streamlines, reference),
+        # Loading plus voxelising a file, the work tckmap does, for comparing throughputs
+        "voxelise_file": lambda: voxelise_tractogram(tract_path, reference, cropped=True),
+        "tckmap": lambda: voxelise_tractogram_tckmap(tract_path, reference),
+        "surface_area": lambda: calculate_surface_area(grid.data, reference.zooms),
+        "tract_statistics": lambda: TractContext(tract_path, reference).tract_statistics(),
+        # Loading plus a 20% sample preview, against the exact tract_statistics
+        "approximate": lambda: approximate_tract_statistics(load_tractogram_file(tract_path, reference).streamlines,
+                                                            reference, 0.2),
+        "streaming": lambda: stream_tract_statistics(tract_path, reference, chunk_size=100000),
+    }
+
+
+def run_bundle_benchmarks(sizes, work_dir, n_points=50, repeat=3, stages=STAGES, shape="arc",
+                          grid_shape=(96, 114, 96)):
+    """
+    Benchmark the per-bundle stages on synthetic bundles of several sizes.
+
+    Parameters:
+        sizes (list): Numbers of streamlines to benchmark.
+        work_dir (str): Directory to write the synthetic files to.
+        n_points (int): Number of points per streamline.
+        repeat (int): Number of timed runs per stage.
+        stages (tuple): Names of the stages to run.
+        shape (str): Bundle shape, one of BUNDLE_SHAPES.
+        grid_shape (tuple): Shape of the reference grid.
+
+    Returns:
+        results (list): One dict per size and stage with the seconds, streamlines per second and peak memory.
+    """
+    reference_path = os.path.join(work_dir, "reference.nii.gz")
+    write_reference(reference_path, grid_shape)
+    reference = ReferenceImage(reference_path)
+
+    results = []
+    for n_streamlines in sizes:
+        tract_path = os.path.join(work_dir, f"bundle_{n_streamlines}.tck")
+        data, lengths, _ = synthetic_bundle(n_streamlines, n_points, shape, grid_shape)
+        write_tck(tract_path, data, lengths)
+        functions = bundle_stages(tract_path, reference)
+        for stage in stages:
+            if stage == "tckmap" and shutil.which("tckmap") is None:
+                print(f"{stage:>24} skipped: tckmap (MRtrix3) is not on PATH")
+                continue
+            seconds, peak_bytes = measure(functions[stage], repeat)
+            results.append({"stage": stage, "streamlines": n_streamlines, "seconds": seconds,
+                            "streamlines_per_second": n_streamlines / seconds, "peak_mb": peak_bytes / 2 ** 20})
+            print_result(results[-1])
+
+        timings = {result["stage"]: result["seconds"] for result in results if result["streamlines"] == n_streamlines}
+        if "voxelise_file" in timings and "tckmap" in timings:
+            print(f"{'':>24} voxelise_file is {timings['tckmap'] / timings['voxelise_file']:.2f}x the "
+                  f"throughput of tckmap")
+        if "tract_statistics" in timings and "approximate" in timings:
+            print(f"{'':>24} approximate takes {timings['approximate'] / timings['tract_statistics']:.2f}x the "
+                  f"time of tract_statistics")
+    return results
+
+
+def run_cohort_benchmark(n_subjects, n_tracts, n_streamlines, work_dir, workers=1, repeat=1, n_points=50,
+                         grid_shape=(96, 114, 96)):
+    """
+    Benchmark the whole aggregation loop on a synthetic cohort.
+
+    Parameters:
+        n_subjects (int): Number of subjects.
+        n_tracts (int): Number of tracts per subject.
+        n_streamlines (int): Number of streamlines per tract.
+        work_dir (str): Directory to write the cohort to.
+        workers (int): Number of worker processes of the aggregation.
+        repeat (int): Number of timed runs.
+        n_points (int): Number of points per streamline.
+        grid_shape (tuple): Shape of the reference grid.
+
+    Returns:
+        result (dict): Seconds, streamlines per second and peak memory of the aggregation.
+    """
+    tract_names = [f"tract_{t + 1}.tck" for t in range(n_tracts)]
+    reference_image = write_cohort(work_dir, n_subjects, tract_names, n_streamlines, n_points, grid_shape)
+
+    def aggregate():
+        with redirect_stdout(io.StringIO()):
+            aggregate_results_to_dataframe(work_dir, tract_names, reference_image, workers=workers)
+
+    total = n_subjects * n_tracts * n_streamlines
+    seconds, peak_bytes = measure(aggregate, repeat)
+    result = {"stage": f"aggregate_{n_subjects}x{n_tracts}_j{workers}", "streamlines": total, "seconds": seconds,
+              "streamlines_per_second": total / seconds, "peak_mb": peak_bytes / 2 ** 20}
+    print_result(result)
+    return result
+
+
+def environment_info():
+    """
+    Describe the code and environment a benchmark ran on, so that saved results can be compared.
+
+    Returns:
+        info (dict): Commit, timestamp and versions.
+    """
+    import nibabel
+    import dipy
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__, "nibabel": nibabel.__version__,
+            "dipy": dipy.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+def print_result(result, baseline=None):
+    line = (f"{result['stage']:>24} {result['streamlines']:>10} {result['seconds']:>10.4f} "
+            f"{result['streamlines_per_second']:>14.0f} {result['peak_mb']:>10.1f}")
+    if baseline is not None:
+        line += f" {baseline['seconds'] / result['seconds']:>8.2f}x"
+    print(line)
+
+
+def compare(results, baseline_file):
+    """
+    Print the speedup of each result over a previously saved benchmark run.
+
+    Parameters:
+        results (list): Results of the current run.
+        baseline_file (str): Path to the JSON file of an earlier run.
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    previous = {(r["stage"], r["streamlines"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline['environment'].get('commit') or baseline_file}:")
+    for result in results:
+        old = previous.get((result["stage"], result["streamlines"]))
+        if old is not None:
+            print_result(result, old)
+
+
+def main():
+    """
+    Benchmark the pipeline stages at several scales and save the results as JSON.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the tract analysis pipeline on synthetic data.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Numbers of streamlines per bundle to benchmark.')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES),
+                        help='Per-bundle stages to benchmark.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs per stage.')
+    parser.add_argument('--shape', choices=BUNDLE_SHAPES, default="arc", help='Shape of the synthetic bundles.')
+    parser.add_argument('--points', type=int, default=50, help='Number of points per synthetic streamline.')
+    parser.add_argument('--grid', type=int, nargs=3, default=[96, 114, 96], metavar=('X', 'Y', 'Z'),
+                        help='Shape of the synthetic reference grid (2 mm voxels).')
+    parser.add_argument('--cohort', type=int, nargs=3, default=[4, 3, 10000],
+                        metavar=('SUBJECTS', 'TRACTS', 'STREAMLINES'),
+                        help='Size of the synthetic cohort of the aggregation benchmark; 0 subjects skips it.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes of the aggregation.')
+    parser.add_argument('-o', '--output', help='Path to the JSON file to save the results to.')
+    parser.add_argument('--compare', help='Path to the JSON results of an earlier run to compare against.')
+    args = parser.parse_args()
+
+    print(f"{'stage':>24} {'streamlines':>10} {'seconds':>10} {'streamlines/s':>14} {'peak MB':>10}")
+    work_dir = tempfile.mkdtemp(prefix="tract_bench_")
+    try:
+        results = run_bundle_benchmarks(args.sizes, work_dir, n_points=args.points, repeat=args.repeat,
+                                        stages=args.stages, shape=args.shape, grid_shape=tuple(args.grid))
+        if args.cohort[0] > 0:
+            cohort_dir = os.path.join(work_dir, "cohort")
+            os.makedirs(cohort_dir)
+            results.append(run_cohort_benchmark(*args.cohort, cohort_dir, workers=args.jobs, n_points=args.points,
+                                                grid_shape=tuple(args.grid)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment_info(), "argv": sys.argv[1:], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
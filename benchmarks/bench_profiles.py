@@ -0,0 +1,66 @@
+import argparse
+import time
+import numpy as np
+from dipy.tracking.streamline import set_number_of_points
+from tract_analysis.benchmarks.synthetic import synthetic_bundle
+from tract_analysis.precision import use_precision
+from tract_analysis.streaming import make_array_sequence
+from tract_analysis.tract_profiles import resample_streamlines
+
+
+def variable_bundle(n_streamlines, seed=0):
+    """
+    Generate a synthetic arc bundle whose streamlines are cut to between 2 and 80 points.
+
+    Parameters:
+        n_streamlines (int): Number of streamlines.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        streamlines (ArraySequence): Streamlines of varying point counts.
+    """
+    data, lengths, _ = synthetic_bundle(n_streamlines, n_points=80, seed=seed)
+    counts = np.random.default_rng(seed).integers(2, 81, n_streamlines)
+    keep = np.arange(80) < counts[:, None]
+    return make_array_sequence(data[keep.ravel()], counts)
+
+
+def timed(function, *args, repeat=3, **kwargs):
+    # Best wall time of several runs, to factor out first-touch page faults
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    """
+    Benchmark resample_streamlines against dipy's set_number_of_points on synthetic bundles.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark along-tract resampling engines.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                        help='Numbers of streamlines to benchmark.')
+    parser.add_argument('--n_points', type=int, default=21,
+                        help='Number of points of the resampled streamlines.')
+    args = parser.parse_args()
+
+    print(f"{'streamlines':>12} {'loop s':>8} {'bulk s':>8} {'vector s':>9} {'vs loop':>8} "
+          f"{'float32 s':>10} {'max diff':>9}")
+    for n_streamlines in args.sizes:
+        streamlines = variable_bundle(n_streamlines)
+        reference, loop_time = timed(lambda: [set_number_of_points(s, args.n_points) for s in streamlines])
+        _, bulk_time = timed(set_number_of_points, streamlines, args.n_points)
+        resampled, vector_time = timed(resample_streamlines, streamlines, args.n_points)
+        with use_precision("float32"):
+            _, single_time = timed(resample_streamlines, streamlines, args.n_points)
+        # Deviation from dipy run on float64 points, which resamples exactly like the float64 policy
+        exact = [set_number_of_points(s.astype(np.float64), args.n_points) for s in streamlines]
+        max_diff = np.abs(resampled - np.asarray(exact)).max()
+        print(f"{n_streamlines:>12} {loop_time:>8.3f} {bulk_time:>8.3f} {vector_time:>9.3f} "
+              f"{loop_time / vector_time:>7.1f}x {single_time:>10.3f} {max_diff:>9.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import numpy as np
+import nibabel as nib
+
+BUNDLE_SHAPES = ("arc", "straight", "fan")
+
+
+def synthetic_bundle(n_streamlines, n_points=50, shape="arc", grid_shape=(96, 114, 96), voxel_size=2.0, seed=0):
+    """
+    Generate a deterministic synthetic bundle as a flat point buffer.
+
+    The streamlines follow a common centre curve ("arc": half circle,
+    "straight": line, "fan": line whose far end spreads out) displaced by a
+    per-streamline offset, and fit inside the central part of the grid.
+
+    Parameters:
+        n_streamlines (int): Number of streamlines.
+        n_points (int): Number of points per streamline.
+        shape (str): Bundle shape, one of BUNDLE_SHAPES.
+        grid_shape (tuple): Shape of the reference grid.
+        voxel_size (float): Isotropic voxel size of the reference grid in mm.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        data (ndarray): (n_streamlines * n_points, 3) float32 points in world (mm) coordinates.
+        lengths (ndarray): Number of points of each streamline.
+        affine (ndarray): 4x4 voxel-to-world affine of the reference grid.
+    """
+    if shape not in BUNDLE_SHAPES:
+        raise ValueError(f"Unknown bundle shape: {shape}; use one of {BUNDLE_SHAPES}.")
+    rng = np.random.default_rng(seed)
+    extent = np.array(grid_shape, dtype=np.float64) * voxel_size
+    center = extent / 2
+    radius = 0.3 * extent.min()
+    t = np.linspace(0, 1, n_points)
+
+    if shape == "arc":
+        curve = np.column_stack((radius * np.cos(np.pi * t), radius * (np.sin(np.pi * t) - 0.5), 0 * t))
+    else:
+        curve = np.column_stack((radius * (2 * t - 1), 0 * t, 0 * t))
+
+    # Per-streamline offsets, clipped so that every bundle stays inside the grid; the fan spreads
+    # its transverse (y, z) offsets towards the far end
+    sigma = 0.08 * radius
+    offsets = np.clip(rng.normal(0, sigma, (n_streamlines, 1, 3)), -3 * sigma, 3 * sigma)
+    profile = np.ones((1, n_points, 3))
+    if shape == "fan":
+        profile[..., 1:] = (1 + 2 * t)[None, :, None]
+    points = center + curve[None] + offsets * profile
+    points += rng.normal(0, 0.01 * radius, points.shape)
+
+    affine = np.diag([voxel_size, voxel_size, voxel_size, 1.0])
+    lengths = np.full(n_streamlines, n_points, dtype=np.intp)
+    return points.reshape(-1, 3).astype(np.float32), lengths, affine
+
+
+def write_tck(path, data, lengths):
+    """
+    Write a flat point buffer to a .tck file in a single pass.
+
+    Parameters:
+        path (str): Path to the output .tck file.
+        data (ndarray): (n_points, 3) points in world (mm) coordinates.
+        lengths (ndarray): Number of points of each streamline.
+    """
+    lengths = np.asarray(lengths, dtype=np.intp)
+    n_streamlines = len(lengths)
+
+    # Each streamline is followed by a NaN delimiter, and the data ends with an Inf triplet
+    payload = np.full((len(data) + n_streamlines + 1, 3), np.nan, dtype="<f4")
+    rows = np.arange(len(data)) + np.repeat(np.arange(n_streamlines), lengths)
+    payload[rows] = data
+    payload[-1] = np.inf
+
+    # The data offset is part of the header, so grow it until it accounts for its own digits
+    header = f"mrtrix tracks\ndatatype: Float32LE\ncount: {n_streamlines}\nfile: . {{}}\nEND\n"
+    offset = len(header.format(0))
+    while len(header.format(offset)) != offset:
+        offset = len(header.format(offset))
+    with open(path, "wb") as f:
+        f.write(header.format(offset).encode("ascii"))
+        f.write(payload.tobytes())
+
+
+def write_reference(path, grid_shape=(96, 114, 96), voxel_size=2.0):
+    """
+    Write an empty NIfTI reference image.
+
+    Parameters:
+        path (str): Path to the output NIfTI file.
+        grid_shape (tuple): Shape of the reference grid.
+        voxel_size (float): Isotropic voxel size in mm.
+    """
+    affine = np.diag([voxel_size, voxel_size, voxel_size, 1.0])
+    nib.save(nib.Nifti1Image(np.zeros(grid_shape, dtype=np.uint8), affine), path)
+
+
+def write_cohort(root_directory, n_subjects, tract_names, n_streamlines, n_points=50,
+                 grid_shape=(96, 114, 96), voxel_size=2.0, seed=0):
+    """
+    Write a synthetic cohort: a reference image and one bundle per subject and tract name.
+
+    Parameters:
+        root_directory (str): Directory to create the subject directories in.
+        n_subjects (int): Number of subjects.
+        tract_names (list): File names of the tracts of each subject.
+        n_streamlines (int): Number of streamlines per bundle.
+        n_points (int): Number of points per streamline.
+        grid_shape (tuple): Shape of the reference grid.
+        voxel_size (float): Isotropic voxel size in mm.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        reference_image (str): Path to the written reference image.
+    """
+    reference_image = os.path.join(root_directory, "reference.nii.gz")
+    write_reference(reference_image, grid_shape, voxel_size)
+    for s in range(n_subjects):
+        subject_dir = os.path.join(root_directory, f"sub-{s + 1:03d}")
+        os.makedirs(subject_dir, exist_ok=True)
+        for t, tract_name in enumerate(tract_names):
+            shape = BUNDLE_SHAPES[t % len(BUNDLE_SHAPES)]
+            data, lengths, _ = synthetic_bundle(n_streamlines, n_points, shape, grid_shape, voxel_size,
+                                                seed=seed + 1000 * s + t)
+            write_tck(os.path.join(subject_dir, tract_name), data, lengths)
+    return reference_image
@@ -1,5 +1,98 @@
 import numpy as np
-from scipy.ndimage import binary_erosion
+from tract_analysis.precision import as_compute
+from tract_analysis.profiling import profiled
+
+# Version of the metric definitions; bump whenever a change alters computed values
+METRICS_VERSION = 3
+
+
+def flatten_streamlines(streamlines):
+    """
+    Get the flat point buffer, offsets and lengths of the streamlines.
+
+    ArraySequence/Streamlines objects are used as-is when their buffer is
+    packed (sliced views are packed with a copy); any other sequence of
+    (n, 3) arrays is concatenated.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines of the tract.
+
+    Returns:
+        data (ndarray): (n_points, 3) array of all points.
+        offsets (ndarray): Index of the first point of each streamline.
+        lengths (ndarray): Number of points of each streamline.
+    """
+    if hasattr(streamlines, "_data") and hasattr(streamlines, "_offsets"):
+        offsets = np.asarray(streamlines._offsets, dtype=np.intp)
+        lengths = np.asarray(streamlines._lengths, dtype=np.intp)
+        packed_offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.intp)
+        if len(lengths) and not np.array_equal(offsets, packed_offsets):
+            streamlines = streamlines.copy()
+            offsets = np.asarray(streamlines._offsets, dtype=np.intp)
+        data = streamlines._data[:int(lengths.sum())]
+        return data, offsets, lengths
+
+    arrays = [np.asarray(streamline).reshape(-1, 3) for streamline in streamlines]
+    lengths = np.array([len(streamline) for streamline in arrays], dtype=np.intp)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.intp)
+    data = np.concatenate(arrays) if arrays else np.empty((0, 3))
+    return data, offsets[:len(lengths)], lengths
+
+
+@profiled("lengths")
+def streamline_lengths(streamlines):
+    """
+    Calculate the length of each streamline in one pass over the flat buffer.
+
+    Segment vectors are computed for the whole point buffer at once, the
+    segments joining two consecutive streamlines are zeroed, and the
+    remaining norms are summed per streamline with ``np.add.reduceat``.
+    The norms are computed in the dtype of the precision policy and summed
+    in float64.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines of the tract.
+
+    Returns:
+        lengths (ndarray): Lengths of each streamline (float64).
+    """
+    data, offsets, counts = flatten_streamlines(streamlines)
+    lengths = np.zeros(len(counts), dtype=np.float64)
+    if len(data) < 2:
+        return lengths
+
+    segments = np.diff(as_compute(data), axis=0)
+    norms = np.sqrt(np.einsum("ij,ij->i", segments, segments))
+
+    # The segment starting at the last point of a streamline joins it to the next one
+    last_points = (offsets + counts - 1)[(counts > 0) & (offsets + counts - 1 < len(norms))]
+    norms[last_points] = 0.0
+
+    has_segments = counts > 1
+    if np.any(has_segments):
+        lengths[has_segments] = np.add.reduceat(norms, offsets[has_segments], dtype=np.float64)
+    return lengths
+
+
+@profiled("spans")
+def streamline_spans(streamlines):
+    """
+    Calculate the span of each streamline by indexing its endpoints in the flat buffer.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines of the tract.
+
+    Returns:
+        spans (ndarray): Spans of each streamline (float64), 0 for empty streamlines.
+    """
+    data, offsets, counts = flatten_streamlines(streamlines)
+    spans = np.zeros(len(counts), dtype=np.float64)
+    nonempty = counts > 0
+    if np.any(nonempty):
+        first = as_compute(data[offsets[nonempty]])
+        last = as_compute(data[offsets[nonempty] + counts[nonempty] - 1])
+        spans[nonempty] = np.linalg.norm(first - last, axis=1)
+    return spans
 
 
 def calculate_length(streamlines):
@@ -12,8 +105,7 @@ def calculate_length(streamlines):
     Returns:
         lengths (list): Lengths of each streamline.
     """
-    lengths = [np.sum(np.linalg.norm(np.diff(streamline, axis=0), axis=1)) for streamline in streamlines]
-    return lengths
+    return streamline_lengths(streamlines).tolist()
 
 
 def calculate_span(streamlines):
@@ -26,8 +118,7 @@ def calculate_span(streamlines):
     Returns:
         spans (list): Spans of each streamline.
     """
-    spans = [np.linalg.norm(streamline[0] - streamline[-1]) for streamline in streamlines]
-    return spans
+    return streamline_spans(streamlines).tolist()
 
 
 def calculate_curl(lengths, spans):
@@ -41,8 +132,8 @@ def calculate_curl(lengths, spans):
     Returns:
         curl (float): Curl of the bundle.
     """
-    avg_length = np.mean(lengths)
-    avg_span = np.mean(spans)
+    avg_length = np.mean(lengths, dtype=np.float64)
+    avg_span = np.mean(spans, dtype=np.float64)
     curl = (avg_length / avg_span) * 2
     return curl
 
@@ -61,6 +152,7 @@ def calculate_surface_volume(N, voxel_volume):
     return N * voxel_volume
 
 
+@profiled("surface_area")
 def calculate_surface_area(voxels_data, voxel_spacing):
     """
     Calculate the surface area of the tractogram.
@@ -72,6 +164,8 @@ def calculate_surface_area(voxels_data, voxel_spacing):
     Returns:
         surface_area (float): Surface area of the tractogram.
     """
+    from scipy.ndimage import binary_erosion
+
     voxels_binary = voxels_data > 0
     surface_voxels = voxels_binary & ~binary_erosion(voxels_binary)
     surface_voxel_count = np.count_nonzero(surface_voxels)
@@ -120,6 +214,43 @@ def calculate_irregularity(area, radius):
     return (np.pi * radius * radius) / area
 
 
+def calculate_end_radius(endpoints):
+    """
+    Calculate the radius of an end region as 1.5 times the mean distance of its endpoints from their centroid.
+
+    Parameters:
+        endpoints (ndarray): (n, 3) endpoints of the end region.
+
+    Returns:
+        radius (float): Radius of the end region.
+    """
+    endpoints = np.asarray(endpoints, dtype=np.float64)
+    return 1.5 * np.mean(np.linalg.norm(endpoints - endpoints.mean(axis=0), axis=1))
+
+
+def calculate_end_statistics(E1, E2, end_voxel_counts, voxel_spacing):
+    """
+    Calculate the area, radius and irregularity of the two end regions of the tract.
+
+    Parameters:
+        E1 (ndarray): Endpoints of the first end region, see determine_surface_end.
+        E2 (ndarray): Endpoints of the second end region.
+        end_voxel_counts (tuple): Number of voxels covered by the endpoints of each end region.
+        voxel_spacing (tuple): Spacing of the voxels in x, y, and z directions.
+
+    Returns:
+        end_stats (dict): "End Surface Area", "End Radius" and "End Irregularity" of each end region.
+    """
+    end_stats = {}
+    for end, (endpoints, voxel_count) in enumerate(zip((E1, E2), end_voxel_counts), start=1):
+        area = calculate_end_surface_area(voxel_count, voxel_spacing)
+        radius = calculate_end_radius(endpoints)
+        end_stats[f"End Surface Area {end}"] = float(area)
+        end_stats[f"End Radius {end}"] = float(radius)
+        end_stats[f"End Irregularity {end}"] = float(calculate_irregularity(area, radius)) if area > 0 else np.nan
+    return end_stats
+
+
 def calculate_diameter(surface_volume, mean_length):
     """
     Calculate the diameter of the tractogram.
@@ -162,17 +293,36 @@ def calculate_tract_statistics(lengths, spans, voxel_spacing, N, voxels_data):
     Returns:
         tract_stats (dict): Dictionary containing the computed statistics.
     """
-    curl = calculate_curl(lengths, spans)
+    return calculate_tract_statistics_from_summary(np.mean(lengths, dtype=np.float64), np.mean(spans, dtype=np.float64),
+                                                   voxel_spacing, N, voxels_data)
+
+
+@profiled("tract_statistics")
+def calculate_tract_statistics_from_summary(mean_length, mean_span, voxel_spacing, N, voxels_data):
+    """
+    Calculate various tract statistics from the mean streamline length and span.
+
+    Parameters:
+        mean_length (float): Mean length of the streamlines.
+        mean_span (float): Mean span of the streamlines.
+        voxel_spacing (tuple): Spacing of the voxels in x, y, and z directions.
+        N (int): Number of non-zero voxels.
+        voxels_data (ndarray): Voxel data of the tractogram.
+
+    Returns:
+        tract_stats (dict): Dictionary containing the computed statistics.
+    """
+    curl = calculate_curl(mean_length, mean_span)
     voxel_volume = np.prod(voxel_spacing)
     surface_volume = calculate_surface_volume(N, voxel_volume)
     surface_area = calculate_surface_area(voxels_data, voxel_spacing)
-    diameter = calculate_diameter(surface_volume, np.mean(lengths))
-    elongation = calculate_elongation(np.mean(lengths), diameter)
-    irregularity = surface_area / (np.pi * diameter * np.mean(lengths))
+    diameter = calculate_diameter(surface_volume, mean_length)
+    elongation = calculate_elongation(mean_length, diameter)
+    irregularity = surface_area / (np.pi * diameter * mean_length)
 
     tract_stats = {
-        "Mean Length": float(np.mean(lengths)),
-        "Mean Span": float(np.mean(spans) / 2),
+        "Mean Length": float(mean_length),
+        "Mean Span": float(mean_span / 2),
         "Curl": float(curl),
         "Diameter": float(diameter),
         "Elongation": float(elongation),
@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import argparse
+import tempfile
+import threading
+import traceback
+import socketserver
+
+# Only the standard library is imported at module level: the client side of this module (DaemonClient,
+# "submit") must start quickly, while the daemon imports the processing stack once when it starts
+
+
+def default_socket_path():
+    """
+    Socket path used when none is given: $TRACT_ANALYSIS_SOCKET, or a per-user socket in the runtime directory.
+
+    Returns:
+        socket_path (str): Path to the UNIX socket of the daemon.
+    """
+    if os.environ.get("TRACT_ANALYSIS_SOCKET"):
+        return os.environ["TRACT_ANALYSIS_SOCKET"]
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"tract_analysis-{os.getuid()}.sock")
+
+
+def subject_of(tract_path, root_directory=None):
+    """
+    Subject of a tractography file: its top directory below root_directory, or its parent directory's name.
+
+    Parameters:
+        tract_path (str): Path to the tractography file.
+        root_directory (str): Root directory containing the subject directories, as in discover_jobs.
+
+    Returns:
+        subject_id (str): Subject the file belongs to.
+    """
+    if root_directory is not None:
+        relative = os.path.relpath(os.path.abspath(tract_path), os.path.abspath(root_directory))
+        if not relative.startswith(os.pardir) and os.sep in relative:
+            return relative.split(os.sep)[0]
+    return os.path.basename(os.path.dirname(os.path.abspath(tract_path)))
+
+
+class TractDaemon:
+    """
+    Long-running tract analysis service answering job requests on a local UNIX socket.
+
+    The processing stack (dipy, scikit-learn, scipy, nibabel, pandas) is
+    imported once when the daemon starts, reference headers stay in a
+    ReferenceRegistry, and the result and streamline caches stay open, so a
+    job only pays for loading its tractography file and computing its
+    statistics. Every job runs through data_aggregation.process_tract_file
+    (or the result cache) exactly as in a batch run.
+
+    Requests and responses are JSON objects, one per line; a connection may
+    send any number of requests. Jobs run one at a time in arrival order,
+    while "status" and "shutdown" are answered immediately. Commands:
+    "process" (subject_id, tract_path, reference_image, options) answers
+    with the subject_id, tract_path, stats and error of process_tract_file;
+    "status" answers with the daemon's pid, uptime, job count and cached
+    references; "shutdown" stops the daemon.
+
+    Parameters:
+        socket_path (str): Path to the UNIX socket; default_socket_path() if None.
+        cache (ResultCache): Optional result cache; unchanged files are not recomputed.
+        reference_image (str): Optional reference image whose header is loaded at start.
+    """
+
+    def __init__(self, socket_path=None, cache=None, reference_image=None):
+        # Import the processing stack now rather than on the first job
+        from tract_analysis import data_aggregation
+        from tract_analysis.precision import DEFAULT_PRECISION
+        from tract_analysis.reference_registry import ReferenceRegistry
+
+        self._data_aggregation = data_aggregation
+        self._default_precision = DEFAULT_PRECISION
+        self.socket_path = socket_path or default_socket_path()
+        self.cache = cache
+        self.registry = ReferenceRegistry()
+        if reference_image is not None:
+            self.registry.get(reference_image)
+        self.started = time.time()
+        self.n_jobs = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def process(self, subject_id, tract_path, reference_image, options=None):
+        """
+        Run one tract job with the resident references and caches.
+
+        Parameters:
+            subject_id (str): Subject the file belongs to.
+            tract_path (str): Path to the tractography file.
+            reference_image (str): Path to the reference image file.
+            options (dict): Processing options of the job, see process_tract_file.
+
+        Returns:
+            result (tuple): (subject_id, tract_path, tract_stats, error) as returned by process_tract_file.
+        """
+        options = dict(options or {})
+        # Options at their default value are left out, as in aggregate_results_to_dataframe, so that
+        # the jobs share their result cache entries with batch runs
+        if options.get("precision") == self._default_precision:
+            del options["precision"]
+        options = {name: value for name, value in options.items() if value}
+        options.setdefault("stream_chunk_size", None)
+
+        with self._lock:
+            try:
+                reference = self.registry.get(reference_image)
+            except Exception:
+                return subject_id, tract_path, None, traceback.format_exc()
+            job = (subject_id, tract_path, reference, options)
+            if self.cache is None:
+                result = self._data_aggregation.process_tract_file(job)
+            else:
+                result = self._data_aggregation.run_cached_jobs([job], self.cache)[0]
+            self.n_jobs += 1
+        return result
+
+    def status(self):
+        """
+        Describe the running daemon.
+
+        Returns:
+            status (dict): pid, socket path, uptime in seconds, number of jobs run and cached reference images.
+        """
+        return {"pid": os.getpid(), "socket": self.socket_path, "uptime": time.time() - self.started,
+                "jobs": self.n_jobs, "references": len(self.registry)}
+
+    def handle(self, request):
+        """
+        Answer one request.
+
+        Parameters:
+            request (dict): Decoded request, with its "command".
+
+        Returns:
+            response (dict): Response sent back to the client.
+        """
+        command = request.get("command")
+        if command == "process":
+            subject_id, tract_path, tract_stats, error = self.process(
+                request.get("subject_id"), request["tract_path"], request["reference_image"],
+                request.get("options"))
+            return {"subject_id": subject_id, "tract_path": tract_path, "stats": tract_stats, "error": error}
+        if command == "status":
+            return self.status()
+        if command == "shutdown":
+            self.shutdown()
+            return {"stopping": True}
+        raise ValueError(f"Unknown command: {command!r}")
+
+    def serve_forever(self):
+        """
+        Listen on the socket and answer requests until shutdown() is called or SIGTERM/SIGINT is received.
+
+        A socket file left behind by a daemon that died is replaced; a live
+        daemon on the same socket is an error.
+        """
+        if os.path.exists(self.socket_path):
+            if is_daemon_running(self.socket_path):
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+
+        self._server = _DaemonServer(self.socket_path, _RequestHandler)
+        self._server.tract_daemon = self
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda signum, frame: self.shutdown())
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            if self.cache is not None:
+                self.cache.save_index()
+
+    def shutdown(self):
+        """
+        Stop serve_forever; it returns once the current request is answered.
+        """
+        if self._server is not None:
+            # BaseServer.shutdown waits for the serving loop, which may be running this very thread
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.tract_daemon.handle(json.loads(line))
+            except Exception:
+                response = {"error": traceback.format_exc()}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class DaemonClient:
+    """
+    Connection to a running TractDaemon.
+
+    Only the standard library is needed, so submitting a job costs a
+    connection and the job itself, not the imports of the processing stack.
+
+    Parameters:
+        socket_path (str): Path to the UNIX socket of the daemon; default_socket_path() if None.
+        timeout (float): Timeout in seconds of every request; None waits for as long as a job takes.
+    """
+
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = socket_path or default_socket_path()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(self.socket_path)
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, request):
+        """
+        Send one request and wait for its response.
+
+        Parameters:
+            request (dict): Request with its "command", see TractDaemon.
+
+        Returns:
+            response (dict): Decoded response.
+        """
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError(f"The daemon on {self.socket_path} closed the connection")
+        return json.loads(line)
+
+    def process(self, tract_path, reference_image, subject_id=None, options=None):
+        """
+        Compute the statistics of a tractography file on the daemon.
+
+        Parameters:
+            tract_path (str): Path to the tractography file; made absolute for the daemon.
+            reference_image (str): Path to the reference image file.
+            subject_id (str): Subject the file belongs to; its parent directory's name if None.
+            options (dict): Processing options, see process_tract_file.
+
+        Returns:
+            subject_id (str): Subject the file belongs to.
+            tract_path (str): Absolute path to the tractography file.
+            tract_stats (dict or None): Computed statistics, None if processing failed.
+            error (str or None): Formatted traceback if processing failed.
+        """
+        tract_path = os.path.abspath(tract_path)
+        response = self.request({"command": "process", "tract_path": tract_path,
+                                 "reference_image": os.path.abspath(reference_image),
+                                 "subject_id": subject_id or subject_of(tract_path), "options": options or {}})
+        if "stats" not in response:
+            raise RuntimeError(response.get("error"))
+        return response["subject_id"], response["tract_path"], response["stats"], response["error"]
+
+    def status(self):
+        """
+        Get the status of the daemon, see TractDaemon.status.
+
+        Returns:
+            status (dict): Status of the daemon.
+        """
+        return self.request({"command": "status"})
+
+    def shutdown(self):
+        """
+        Ask the daemon to stop.
+        """
+        self.request({"command": "shutdown"})
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def is_daemon_running(socket_path=None):
+    """
+    Check whether a daemon answers on a socket.
+
+    Parameters:
+        socket_path (str): Path to the UNIX socket; default_socket_path() if None.
+
+    Returns:
+        running (bool): True if a daemon answered a status request.
+    """
+    try:
+        with DaemonClient(socket_path, timeout=5) as client:
+            client.status()
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def serve(argv=None):
+    """
+    Start a daemon in the foreground, see TractDaemon.
+
+    Parameters:
+        argv (list): Command-line arguments of the serve subcommand.
+    """
+    parser = argparse.ArgumentParser(prog="daemon.py serve",
+                                     description="Keep the tract analysis stack, reference headers and caches "
+                                                 "resident and process the jobs sent by \"daemon.py submit\".")
+    parser.add_argument('-s', '--socket', type=str, help='Path to the UNIX socket (default: %(default)s).',
+                        default=default_socket_path())
+    parser.add_argument('-i', '--reference_image', type=str,
+                        help='Reference image whose header is loaded at start.')
+    parser.add_argument('--cache_dir', type=str,
+                        help='Directory of a persistent result cache; unchanged files are not recomputed.')
+    parser.add_argument('--streamline_cache', action='store_true',
+                        help='Convert every tractography file into a memory-mapped streamline cache the first '
+                             'time it is loaded, see main.py --streamline_cache.')
+    parser.add_argument('--streamline_cache_dir', type=str,
+                        help='Directory of the streamline caches.')
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache_dir:
+        from tract_analysis.result_cache import ResultCache
+        cache = ResultCache(args.cache_dir)
+    if args.streamline_cache or args.streamline_cache_dir:
+        from tract_analysis.streamline_cache import configure_streamline_cache
+        configure_streamline_cache(args.streamline_cache_dir, write=args.streamline_cache)
+
+    daemon = TractDaemon(args.socket, cache, args.reference_image)
+    try:
+        print(f"Listening on {daemon.socket_path} (pid {os.getpid()})", flush=True)
+        daemon.serve_forever()
+    except RuntimeError as e:
+        parser.exit(1, f"Error: {e}\n")
+    print(f"Stopped after {daemon.n_jobs} jobs.")
+
+
+def submit(argv=None):
+    """
+    Send tractography files to a running daemon and print or write their statistics.
+
+    Parameters:
+        argv (list): Command-line arguments of the submit subcommand.
+
+    Returns:
+        status (int): 1 if any file failed, 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(prog="daemon.py submit",
+                                     description="Compute the statistics of tractography files on a running "
+                                                 "daemon. Without -o, one JSON object per file is printed.")
+    parser.add_argument('tract_paths', nargs='+', help='Tractography files to process.')
+    parser.add_argument('-i', '--reference_image', type=str, required=True,
+                        help='Path to the reference image file.')
+    parser.add_argument('-s', '--socket', type=str, help='Path to the UNIX socket of the daemon.')
+    parser.add_argument('--subject', type=str,
+                        help='Subject of the files; by default their top directory below --root_directory, or '
+                             'their parent directory.')
+    parser.add_argument('-r', '--root_directory', type=str,
+                        help='Root directory containing the subject directories.')
+    parser.add_argument('-o', '--output_file', type=str,
+                        help='Write the long/tidy rows to this file (.csv, .parquet, .feather or .xlsx).')
+    parser.add_argument('--stream_chunk_size', type=int,
+                        help='Read .tck files in chunks of this many streamlines.')
+    parser.add_argument('--precision', type=str, help='Numeric precision policy, "float64" or "float32".')
+    parser.add_argument('--profile_segments', type=int, metavar='N',
+                        help='Add the along-tract profile with N segments.')
+    parser.add_argument('--approximate', type=float, metavar='FRACTION',
+                        help='Estimate the statistics from a sample of the streamlines, with 95%% confidence '
+                             'intervals.')
+    args = parser.parse_args(argv)
+
+    options = {"stream_chunk_size": args.stream_chunk_size, "precision": args.precision,
+               "profile_segments": args.profile_segments, "approximate": args.approximate}
+    try:
+        with DaemonClient(args.socket) as client:
+            results = [client.process(tract_path, args.reference_image,
+                                      args.subject or subject_of(tract_path, args.root_directory), options)
+                       for tract_path in args.tract_paths]
+    except OSError as e:
+        parser.exit(1, f"Error: no daemon on {args.socket or default_socket_path()} ({e})\n")
+
+    if args.output_file:
+        from tract_analysis.result_writers import get_result_writer, tidy_rows
+        with get_result_writer(args.output_file) as writer:
+            for subject_id, tract_path, tract_stats, error in results:
+                if error is None:
+                    writer.write(tidy_rows(subject_id, tract_path, tract_stats, os.path.abspath(args.reference_image)))
+    else:
+        for subject_id, tract_path, tract_stats, error in results:
+            print(json.dumps({"subject_id": subject_id, "tract_path": tract_path, "stats": tract_stats}))
+
+    for subject_id, tract_path, tract_stats, error in results:
+        if error is not None:
+            print(f"Error processing file {tract_path}: {error.strip().splitlines()[-1]}", file=sys.stderr)
+    return int(any(error is not None for *_, error in results))
+
+
+def main(argv=None):
+    """
+    Run the serve, submit, status or stop subcommand.
+
+    Parameters:
+        argv (list): Command-line arguments; sys.argv[1:] if None.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog="daemon.py",
+                                     description="Resident tract analysis service. \"serve\" starts the daemon, "
+                                                 "\"submit\" sends it tractography files, \"status\" and \"stop\" "
+                                                 "query and stop it.")
+    parser.add_argument('command', choices=["serve", "submit", "status", "stop"])
+    args = parser.parse_args(argv[:1])
+    if args.command == "serve":
+        serve(argv[1:])
+    elif args.command == "submit":
+        sys.exit(submit(argv[1:]))
+    else:
+        control = argparse.ArgumentParser(prog=f"daemon.py {args.command}")
+        control.add_argument('-s', '--socket', type=str, help='Path to the UNIX socket of the daemon.')
+        socket_path = control.parse_args(argv[1:]).socket
+        try:
+            with DaemonClient(socket_path, timeout=10) as client:
+                if args.command == "status":
+                    print(json.dumps(client.status()))
+                else:
+                    client.shutdown()
+        except OSError as e:
+            control.exit(1, f"Error: no daemon on {socket_path or default_socket_path()} ({e})\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,406 @@
 import os
+import traceback
 import pandas as pd
 from collections import defaultdict
-from tract_analysis.calculations import calculate_tract_statistics, calculate_length, calculate_span
-from tract_analysis.tractogram_processing import preprocess_tractogram, voxelise_tractogram
+from concurrent.futures import ProcessPoolExecutor
+from tract_analysis import profiling
+from tract_analysis.approximate import approximate_tract_statistics
+from tract_analysis.file_discovery import scan_files, match_tract_files
+from tract_analysis.precision import DEFAULT_PRECISION, get_precision, set_precision, use_precision
+from tract_analysis.prefetch import iter_prefetched
+from tract_analysis.reference_registry import ReferenceRegistry
+from tract_analysis.tract_context import TractContext
+from tract_analysis.streaming import stream_tract_statistics
+from tract_analysis.streamline_cache import configure_streamline_cache, streamline_cache_settings
+from tract_analysis.tract_batch import TractBatch
+from tract_analysis.tract_profiles import tract_profile, profile_statistics
+from tract_analysis.tractogram_processing import load_tractogram_file
+from tract_analysis.result_writers import tidy_rows
+from tract_analysis.sharding import assign_shards, shard_jobs, write_shard_manifest
 
 
-def aggregate_results_to_dataframe(root_directory, file_paths, reference_image):
+def process_tract_file(job, tractogram=None):
     """
-    Aggregate results from multiple tractography files into dataframes.
+    Compute the statistics of a single tractography file.
 
     Parameters:
-        root_directory (str): Path to the root directory containing subject directories.
-        file_paths (list): List of file paths to tractography files to be analyzed.
-        reference_image (str): Path to the reference image file.
+        job (tuple): (subject_id, tract_path, reference, options), where reference is a reference
+            image path or a cached ReferenceImage and options is a dict of processing options:
+            "stream_chunk_size" (int) reads .tck files in chunks of that many streamlines,
+            "batch_tracts" (bool) processes the files of a subject together, see process_tract_batch,
+            "precision" (str) selects the precision policy, see precision.set_precision,
+            "profile_segments" (int) adds the along-tract profile with that many segments
+            (see tract_profiles.tract_profile; not computed for streamed .tck files), and
+            "approximate" (float) estimates the statistics from a sample of the streamlines,
+            see approximate.approximate_tract_statistics.
+        tractogram (StatefulTractogram): The file already loaded (e.g. prefetched), instead of loading it.
 
     Returns:
-        dfs (dict): Dictionary of dataframes containing aggregated statistics.
+        subject_id (str): Subject the file belongs to.
+        tract_path (str): Path to the tractography file.
+        tract_stats (dict or None): Computed statistics, None if processing failed.
+        error (str or None): Formatted traceback if processing failed.
     """
-    # Initialize a dictionary to hold dataframes for each statistic
-    dfs = defaultdict(pd.DataFrame)
+    subject_id, tract_path, reference, options = job
+    try:
+        with profiling.job(subject_id, tract_path), use_precision(options.get("precision")):
+            if _is_streamed(job):
+                # Read the tractogram in chunks with memory bounded by the chunk size
+                tract_stats, _ = stream_tract_statistics(tract_path, reference, options["stream_chunk_size"])
+                return subject_id, tract_path, tract_stats, None
+
+            # Load the tractogram once and share it across all stages
+            context = TractContext(tract_path, reference, tractogram)
+
+            # Calculate various tract statistics
+            if options.get("approximate"):
+                tract_stats = approximate_tract_statistics(context.streamlines, context.reference,
+                                                           options["approximate"])
+            else:
+                tract_stats = context.tract_statistics()
+            if options.get("profile_segments"):
+                tract_stats.update(profile_statistics(context.tract_profile(options["profile_segments"])))
+            return subject_id, tract_path, tract_stats, None
+    except Exception:
+        return subject_id, tract_path, None, traceback.format_exc()
+
+
+def _is_streamed(job):
+    # Streamed .tck jobs read their file in chunks instead of loading it whole; approximate jobs sample
+    # the streamlines of the loaded file
+    options = job[3]
+    return bool(options.get("stream_chunk_size")) and not options.get("approximate") \
+        and str(job[1]).endswith(".tck")
+
+
+def _load_job(job):
+    # Load the tractogram of a job on a prefetching thread
+    subject_id, tract_path, reference, options = job
+    if _is_streamed(job):
+        return None
+    with profiling.labelled(subject_id, tract_path):
+        return load_tractogram_file(tract_path, reference)
+
+
+def iter_prefetched_jobs(jobs, threads=1, depth=None):
+    """
+    Run tract jobs in the current process while background threads load the next tractograms.
+
+    Reading a file (often from networked storage) overlaps with the
+    computation of the previous ones; at most ``depth`` loaded tractograms
+    are held at a time, see prefetch.iter_prefetched.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        threads (int): Number of loader threads.
+        depth (int): Maximum number of loaded tractograms held at a time; threads + 1 if None.
+
+    Yields:
+        result (tuple): One process_tract_file result per job, in job order.
+    """
+    for job, tractogram, error in iter_prefetched(jobs, _load_job, threads, depth):
+        if error is not None:
+            yield job[0], job[1], None, error
+        else:
+            yield process_tract_file(job, tractogram)
+
+
+def process_tract_batch(jobs):
+    """
+    Compute the statistics of several tractography files of one subject in a single batched pass.
+
+    The tracts are concatenated into one TractBatch, so the lengths, spans and
+    their per-tract means are computed once for all of them. Files that fail to
+    load or to process get their own error; streamed .tck and approximate jobs
+    are processed one by one.
+
+    Parameters:
+        jobs (list): (subject_id, tract_path, reference, options) tuples sharing one reference.
+
+    Returns:
+        results (list): One process_tract_file result per job, in job order.
+    """
+    results = [None] * len(jobs)
+    loaded = []
+    with profiling.job(jobs[0][0], f"{len(jobs)} tracts"), use_precision(jobs[0][3].get("precision")):
+        for position, job in enumerate(jobs):
+            subject_id, tract_path, reference, options = job
+            if _is_streamed(job) or options.get("approximate"):
+                results[position] = process_tract_file(job)
+                continue
+            try:
+                loaded.append((position, load_tractogram_file(tract_path, reference).streamlines))
+            except Exception:
+                results[position] = (subject_id, tract_path, None, traceback.format_exc())
+
+        if loaded:
+            try:
+                batch = TractBatch.from_streamlines([streamlines for _, streamlines in loaded],
+                                                    reference_image=jobs[loaded[0][0]][2])
+            except Exception:
+                error = traceback.format_exc()
+                for position, _ in loaded:
+                    results[position] = (jobs[position][0], jobs[position][1], None, error)
+                return results
+            n_segments = jobs[0][3].get("profile_segments")
+            for tract, (position, streamlines) in enumerate(loaded):
+                subject_id, tract_path = jobs[position][:2]
+                try:
+                    tract_stats = batch.tract_statistics_of(tract)
+                    if n_segments:
+                        profile = tract_profile(streamlines, n_segments, *batch.surface_endpoints(tract))
+                        tract_stats.update(profile_statistics(profile))
+                    results[position] = (subject_id, tract_path, tract_stats, None)
+                except Exception:
+                    results[position] = (subject_id, tract_path, None, traceback.format_exc())
+    return results
+
+
+def group_subject_jobs(jobs):
+    """
+    Group consecutive jobs of the same subject and reference image.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+
+    Returns:
+        groups (list): Lists of jobs, in job order.
+    """
+    groups = []
+    for job in jobs:
+        if groups and groups[-1][0][0] == job[0] and groups[-1][0][2] == job[2]:
+            groups[-1].append(job)
+        else:
+            groups.append([job])
+    return groups
+
+
+def iter_jobs(jobs, workers=1, chunk_size=None, prefetch=0, prefetch_depth=None):
+    """
+    Run tract jobs serially or on a process pool, yielding each result as soon as it is available.
+
+    Results are yielded in the order of the jobs regardless of which worker
+    finishes first, so parallel runs aggregate identically to serial runs.
+    Prefetching applies to jobs run in the current process, one file at a
+    time (not to worker processes or batched tracts).
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        workers (int): Number of worker processes; 1 runs in the current process.
+        chunk_size (int): Number of jobs dispatched to a worker at a time.
+            Defaults to spreading the jobs over about four chunks per worker.
+        prefetch (int): Number of threads loading the next tractograms while one is processed
+            (see iter_prefetched_jobs); 0 loads each file when its job runs.
+        prefetch_depth (int): Maximum number of loaded tractograms held at a time; prefetch + 1 if None.
+
+    Yields:
+        result (tuple): One process_tract_file result per job, in job order.
+    """
+    if any(options.get("batch_tracts") for *_, options in jobs):
+        # One task per subject, flattened back into one result per job
+        for results in _map_tasks(process_tract_batch, group_subject_jobs(jobs), workers, chunk_size):
+            yield from results
+        return
+
+    if prefetch and (workers is None or workers <= 1):
+        yield from iter_prefetched_jobs(jobs, prefetch, prefetch_depth)
+        return
+
+    yield from _map_tasks(process_tract_file, jobs, workers, chunk_size)
+
+
+def _map_tasks(function, tasks, workers, chunk_size):
+    # Apply function to every task serially or on a process pool, yielding the results in task order
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+
+    if chunk_size is None:
+        chunk_size = max(1, len(tasks) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers, **worker_pool_options()) as executor:
+        yield from executor.map(function, tasks, chunksize=chunk_size)
+
+
+def worker_pool_options():
+    """
+    ProcessPoolExecutor keyword arguments that give every worker the settings of this process.
+
+    Workers started with the spawn or forkserver methods do not inherit the
+    module state of the parent, so the precision policy and the streamline
+    cache configuration are passed to them explicitly, and worker processes
+    spool their stage events to the active profiler, if any.
+
+    Returns:
+        options (dict): initializer and initargs keyword arguments.
+    """
+    profiler = profiling.active_profiler()
+    profiler_options = profiler.worker_options() if profiler is not None else {}
+    return {"initializer": _init_worker,
+            "initargs": (get_precision(), streamline_cache_settings(), profiler_options.get("initializer"),
+                         profiler_options.get("initargs", ()))}
+
+
+def _init_worker(precision, streamline_cache, initializer=None, initargs=()):
+    # Restore the parent's settings in a worker process, then run the profiler's initializer
+    set_precision(precision)
+    configure_streamline_cache(*streamline_cache)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def run_jobs(jobs, workers=1, chunk_size=None):
+    """
+    Run tract jobs serially or on a process pool.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        workers (int): Number of worker processes; 1 runs in the current process.
+        chunk_size (int): Number of jobs dispatched to a worker at a time.
+
+    Returns:
+        results (list): One process_tract_file result per job, in job order.
+    """
+    return list(iter_jobs(jobs, workers, chunk_size))
+
+
+def iter_cached_jobs(jobs, cache, workers=1, chunk_size=None, prefetch=0, prefetch_depth=None):
+    """
+    Run tract jobs, reusing cached statistics for files that have not changed.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        cache (ResultCache): Result cache; successful results of the executed jobs are stored in it.
+        workers (int): Number of worker processes; 1 runs in the current process.
+        chunk_size (int): Number of jobs dispatched to a worker at a time.
+        prefetch (int): Number of prefetching loader threads, see iter_jobs.
+        prefetch_depth (int): Maximum number of loaded tractograms held at a time.
+
+    Yields:
+        result (tuple): One process_tract_file result per job, in job order.
+    """
+    cached = [None] * len(jobs)
+    keys = {}
+    for position, (subject_id, tract_path, reference, options) in enumerate(jobs):
+        if not isinstance(tract_path, str) or not os.path.isfile(tract_path):
+            continue
+        keys[position] = cache.key(tract_path, reference, options)
+        tract_stats = cache.get(keys[position])
+        if tract_stats is not None:
+            cached[position] = (subject_id, tract_path, tract_stats, None)
+
+    pending = iter_jobs([job for job, result in zip(jobs, cached) if result is None], workers, chunk_size,
+                        prefetch, prefetch_depth)
+    for position, result in enumerate(cached):
+        if result is None:
+            result = next(pending)
+            if result[3] is None and position in keys:
+                cache.put(keys[position], result[2])
+        yield result
+
+    cache.save_index()
+
+
+def run_cached_jobs(jobs, cache, workers=1, chunk_size=None):
+    """
+    Run tract jobs, reusing cached statistics for files that have not changed.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        cache (ResultCache): Result cache; successful results of the executed jobs are stored in it.
+        workers (int): Number of worker processes; 1 runs in the current process.
+        chunk_size (int): Number of jobs dispatched to a worker at a time.
 
+    Returns:
+        results (list): One process_tract_file result per job, in job order.
+    """
+    return list(iter_cached_jobs(jobs, cache, workers, chunk_size))
+
+
+def iter_journaled_jobs(jobs, journal, workers=1, chunk_size=None, cache=None, prefetch=0, prefetch_depth=None):
+    """
+    Run tract jobs, recording each result in a job journal and reusing the results it already holds.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        journal (JobJournal): Journal of finished jobs.
+        workers (int): Number of worker processes; 1 runs in the current process.
+        chunk_size (int): Number of jobs dispatched to a worker at a time.
+        cache (ResultCache): Optional result cache.
+        prefetch (int): Number of prefetching loader threads, see iter_jobs.
+        prefetch_depth (int): Maximum number of loaded tractograms held at a time.
+
+    Yields:
+        result (tuple): One process_tract_file result per job, in job order.
+    """
+    recorded = [journal.result(job) for job in jobs]
+    pending_jobs = [job for job, result in zip(jobs, recorded) if result is None]
+    if len(pending_jobs) < len(jobs):
+        print(f"Resuming: {len(jobs) - len(pending_jobs)} of {len(jobs)} jobs are already in the journal.")
+
+    pending = iter_results(pending_jobs, workers, chunk_size, cache, prefetch=prefetch, prefetch_depth=prefetch_depth)
+    for job, result in zip(jobs, recorded):
+        if result is None:
+            result = next(pending)
+            journal.record(job, result)
+        yield result
+    # Let the inner iterator finish (cache eviction and report)
+    for _ in pending:
+        pass
+
+
+def iter_results(jobs, workers=1, chunk_size=None, cache=None, journal=None, prefetch=0, prefetch_depth=None):
+    """
+    Yield the result of every job, through the job journal and the result cache if they are given.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        workers (int): Number of worker processes; 1 runs in the current process.
+        chunk_size (int): Number of jobs dispatched to a worker at a time.
+        cache (ResultCache): Optional result cache.
+        journal (JobJournal): Optional journal recording every finished job.
+        prefetch (int): Number of prefetching loader threads, see iter_jobs.
+        prefetch_depth (int): Maximum number of loaded tractograms held at a time.
+
+    Yields:
+        result (tuple): One process_tract_file result per job, in job order.
+    """
+    if journal is not None:
+        yield from iter_journaled_jobs(jobs, journal, workers, chunk_size, cache, prefetch, prefetch_depth)
+        return
+
+    if cache is None:
+        yield from iter_jobs(jobs, workers, chunk_size, prefetch, prefetch_depth)
+        return
+
+    yield from iter_cached_jobs(jobs, cache, workers, chunk_size, prefetch, prefetch_depth)
+    cache.evict()
+    print(cache.report())
+
+
+def discover_jobs(root_directory, file_paths, reference_image=None, reference_pattern=None, options=None):
+    """
+    Find the tractography files of every subject and build one job per subject and file.
+
+    Parameters:
+        root_directory (str): Path to the root directory containing subject directories.
+        file_paths (list): List of tractography file names (or patterns) to be analyzed.
+        reference_image (str): Path to the reference image file, used for every subject
+            (or for subjects where reference_pattern matches nothing).
+        reference_pattern (str): Filename glob used to find each subject's own reference image.
+        options (dict): Processing options attached to every job.
+
+    Returns:
+        result_df (DataFrame): Path of each tractography file, one row per subject.
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+    """
     # List to hold dataframes for individual subject data
     spans_data = []
 
-    # Check if the root directory exists
-    if not os.path.isdir(root_directory):
-        print("Error: Root directory does not exist.")
-        return dfs
+    # Reference image of each subject, each header loaded once
+    registry = ReferenceRegistry(pattern=reference_pattern, default=reference_image)
+    subject_references = {}
 
     # Iterate over each subject directory in the root directory
     for subject_dir in os.listdir(root_directory):
@@ -35,54 +409,143 @@ def aggregate_results_to_dataframe(root_directory, file_paths, reference_image):
         if os.path.isdir(subject_path):
             subject_data = {}  # Dictionary to hold file paths for each subject
 
-            # Find the tractography files for each subject
-            for file_path in file_paths:
-                found_file = False
-                for root, _, files in os.walk(subject_path):
-                    for file in files:
-                        if file == os.path.basename(file_path):
-                            subject_data[os.path.basename(file_path)] = os.path.join(root, file)
-                            found_file = True
-                            break
-                    if found_file:
-                        break
+            # Index the subject's files once and resolve every requested tract against it
+            file_index = scan_files(subject_path)
+            matches, missing, ambiguous = match_tract_files(file_index, file_paths)
+            subject_data.update(matches)
+            if missing:
+                print(f"Warning: no file matching {', '.join(missing)} for subject {subject_dir}.")
+            for name, candidates in ambiguous.items():
+                print(f"Warning: {len(candidates)} files named {name} for subject {subject_dir} "
+                      f"({', '.join(candidates)}), skipping it.")
 
             # Create a dataframe for the current subject
             df = pd.DataFrame(subject_data, index=[subject_dir])
             spans_data.append(df)
 
+            try:
+                subject_references[subject_dir] = registry.resolve(subject_path, file_index)
+            except Exception as e:
+                print(f"Error resolving reference image for subject {subject_dir}: {e}")
+
     # Concatenate all subject dataframes into a single dataframe
     if spans_data:
         result_df = pd.concat(spans_data)
     else:
         result_df = pd.DataFrame()
 
+    # Build one job per subject and tractography file
+    options = options or {}
+    jobs = []
+    for index, row in result_df.iterrows():
+        if index not in subject_references:
+            continue
+        for tract_path in row:
+            if isinstance(tract_path, str):
+                jobs.append((index, tract_path, subject_references[index], options))
+
+    return result_df, jobs
+
+
+def job_options(stream_chunk_size=None, batch_tracts=False, precision=None, profile_segments=None,
+                approximate=None):
+    """
+    Build the processing options attached to every job, see process_tract_file.
+
+    Options at their default value are left out, so that they do not change
+    the result cache and journal keys of the jobs.
+
+    Parameters:
+        stream_chunk_size (int): Chunk size of streamed .tck files, see aggregate_results_to_dataframe.
+        batch_tracts (bool): Process all files of a subject in one batched pass.
+        precision (str): Precision policy; the current policy if None.
+        profile_segments (int): Number of along-tract profile segments.
+        approximate (float): Sampled fraction or number of streamlines.
+
+    Returns:
+        options (dict): Processing options of the jobs.
+    """
+    options = {"stream_chunk_size": stream_chunk_size}
+    if batch_tracts:
+        options["batch_tracts"] = True
+    precision = precision or get_precision()
+    if precision != DEFAULT_PRECISION:
+        options["precision"] = precision
+    if profile_segments:
+        options["profile_segments"] = profile_segments
+    if approximate:
+        options["approximate"] = approximate
+    return options
+
+
+def aggregate_results_to_dataframe(root_directory, file_paths, reference_image=None, workers=1, chunk_size=None,
+                                   reference_pattern=None, stream_chunk_size=None, cache=None, batch_tracts=False,
+                                   journal=None, shard=None, precision=None, prefetch=0, prefetch_depth=None,
+                                   profile_segments=None, approximate=None):
+    """
+    Aggregate results from multiple tractography files into dataframes.
+
+    Parameters:
+        root_directory (str): Path to the root directory containing subject directories.
+        file_paths (list): List of file paths to tractography files to be analyzed.
+        reference_image (str): Path to the reference image file, used for every subject
+            (or for subjects where reference_pattern matches nothing).
+        workers (int): Number of worker processes used to process the files.
+        chunk_size (int): Number of files dispatched to a worker at a time.
+        reference_pattern (str): Filename glob used to find each subject's own reference image
+            inside its directory (e.g. "*_T1w.nii.gz").
+        stream_chunk_size (int): If set, .tck files are read and processed in chunks of this many
+            streamlines so that memory is bounded by the chunk size instead of the file size.
+        cache (ResultCache): If set, files whose content, reference and options are unchanged reuse
+            the cached statistics instead of being processed again.
+        batch_tracts (bool): Process all files of a subject in one batched pass (see process_tract_batch).
+        journal (JobJournal): If set, every finished job is recorded in this journal, and jobs it already
+            holds (when resuming) are not run again.
+        shard (tuple): (index, count) to only process the jobs of one shard, see sharding.shard_jobs.
+        precision (str): Precision policy, "float64" or "float32" (see precision.set_precision);
+            the current policy if None.
+        prefetch (int): Number of threads loading the next tractograms while one is processed
+            (see iter_prefetched_jobs); 0 loads each file when its job runs.
+        prefetch_depth (int): Maximum number of loaded tractograms held at a time; prefetch + 1 if None.
+        profile_segments (int): If set, the along-tract profile of each file is added with this many
+            segments, one statistic per metric and segment (e.g. "Diameter Profile 01", numbered from
+            the E1 end); see tract_profiles.tract_profile. Streamed .tck files have no profile.
+        approximate (float): If set, a quick preview: the statistics are estimated from a reproducible
+            sample of this fraction of the streamlines (or of this many streamlines if 1 or more), with
+            "<statistic> CI Low"/"CI High" confidence bounds, see approximate.approximate_tract_statistics.
+            Approximate jobs load their files whole, even with stream_chunk_size.
+
+    Returns:
+        dfs (dict): Dictionary of dataframes containing aggregated statistics.
+    """
+    # Initialize a dictionary to hold dataframes for each statistic
+    dfs = defaultdict(pd.DataFrame)
+
+    # Check if the root directory exists
+    if not os.path.isdir(root_directory):
+        print("Error: Root directory does not exist.")
+        return dfs
+
+    options = job_options(stream_chunk_size, batch_tracts, precision, profile_segments, approximate)
+    result_df, jobs = discover_jobs(root_directory, file_paths, reference_image, reference_pattern, options)
+    if shard is not None:
+        jobs = shard_jobs(jobs, *shard)
+
     # Store the dataframe of file paths in the dfs dictionary
     dfs['file_paths'] = result_df
 
     # Dictionary to hold statistics for all subjects and files
     all_statistics = defaultdict(list)
 
-    # Iterate over each subject and their corresponding tractography files
-    for index, row in result_df.iterrows():
-        for i, file_path in enumerate(file_paths):
-            tract_path = row.iloc[i]
+    results = iter_results(jobs, workers, chunk_size, cache, journal, prefetch, prefetch_depth)
+    for index, tract_path, tract_stats_dict, error in results:
+        if error is not None:
+            print(f"Error processing file {tract_path}: {error.strip().splitlines()[-1]}")
+            continue
 
-            try:
-                # Preprocess the tractogram and calculate necessary parameters
-                tractogram, voxel_spacing, E1, E2 = preprocess_tractogram(tract_path, reference_image)
-                lengths = calculate_length(tractogram.streamlines)
-                spans = calculate_span(tractogram.streamlines)
-                N, voxels_data = voxelise_tractogram(tract_path, reference_image)
-
-                # Calculate various tract statistics
-                tract_stats_dict = calculate_tract_statistics(lengths, spans, voxel_spacing, N, voxels_data)
-
-                # Append the statistics to the all_statistics dictionary
-                for stat_name, stat_value in tract_stats_dict.items():
-                    all_statistics[stat_name].append((index, tract_path, stat_value))
-            except Exception as e:
-                print(f"Error processing file {tract_path}: {e}")
+        # Append the statistics to the all_statistics dictionary
+        for stat_name, stat_value in tract_stats_dict.items():
+            all_statistics[stat_name].append((index, tract_path, stat_value))
 
     # Convert the collected statistics into dataframes
     for stat_name, stat_list in all_statistics.items():
@@ -104,6 +567,70 @@ def aggregate_results_to_dataframe(root_directory, file_paths, reference_image):
     return dfs
 
 
+def write_results(root_directory, file_paths, writer, reference_image=None, workers=1, chunk_size=None,
+                  reference_pattern=None, stream_chunk_size=None, cache=None, batch_tracts=False, journal=None,
+                  shard=None, precision=None, prefetch=0, prefetch_depth=None, profile_segments=None,
+                  approximate=None):
+    """
+    Process every tractography file and pass its statistics to a writer as soon as it is done.
+
+    Unlike aggregate_results_to_dataframe, the results are never held in
+    memory all at once.
+
+    Parameters:
+        root_directory (str): Path to the root directory containing subject directories.
+        file_paths (list): List of tractography file names (or patterns) to be analyzed.
+        writer (ResultWriter): Writer receiving the long/tidy rows of each file.
+        reference_image (str): Path to the reference image file.
+        workers (int): Number of worker processes used to process the files.
+        chunk_size (int): Number of files dispatched to a worker at a time.
+        reference_pattern (str): Filename glob used to find each subject's own reference image.
+        stream_chunk_size (int): If set, .tck files are read in chunks of this many streamlines.
+        cache (ResultCache): Optional result cache.
+        batch_tracts (bool): Process all files of a subject in one batched pass.
+        journal (JobJournal): Optional journal recording every finished job, see aggregate_results_to_dataframe.
+        shard (tuple): (index, count) to only process the jobs of one shard. A shard manifest listing
+            its jobs and row count is then written next to the writer's output file once all rows are
+            passed to the writer, for merging with sharding.merge_shards.
+        precision (str): Precision policy, see aggregate_results_to_dataframe.
+        prefetch (int): Number of prefetching loader threads, see aggregate_results_to_dataframe.
+        prefetch_depth (int): Maximum number of loaded tractograms held at a time.
+        profile_segments (int): Number of along-tract profile segments, see aggregate_results_to_dataframe.
+        approximate (float): Sampled fraction or number of streamlines, see aggregate_results_to_dataframe.
+
+    Returns:
+        errors (list): (subject_id, tract_path, traceback) of every file that failed.
+    """
+    if not os.path.isdir(root_directory):
+        raise FileNotFoundError(f"Root directory does not exist: {root_directory}")
+
+    options = job_options(stream_chunk_size, batch_tracts, precision, profile_segments, approximate)
+    result_df, all_jobs = discover_jobs(root_directory, file_paths, reference_image, reference_pattern, options)
+    jobs, assignment = all_jobs, None
+    if shard is not None:
+        # Computed once, so the manifest records the split this shard actually ran
+        assignment = assign_shards(all_jobs, shard[1])
+        jobs = shard_jobs(all_jobs, *shard, assignment)
+
+    errors = []
+    n_rows = 0
+    results = iter_results(jobs, workers, chunk_size, cache, journal, prefetch, prefetch_depth)
+    for (index, tract_path, tract_stats_dict, error), job in zip(results, jobs):
+        if error is not None:
+            print(f"Error processing file {tract_path}: {error.strip().splitlines()[-1]}")
+            errors.append((index, tract_path, error))
+            continue
+        rows = tidy_rows(index, tract_path, tract_stats_dict, getattr(job[2], "path", job[2]))
+        with profiling.stage("write", category="writer", subject=str(index)):
+            writer.write(rows)
+        n_rows += len(rows)
+
+    if shard is not None:
+        write_shard_manifest(writer.output_file, *shard, all_jobs, jobs, result_df, n_rows, errors, assignment)
+    return errors
+
+
+@profiling.profiled("write_excel")
 def save_to_excel(dfs, output_file):
     """
     Save the aggregated dataframes to an Excel file.
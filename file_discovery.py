@@ -0,0 +1,80 @@
+import os
+import re
+import fnmatch
+from tract_analysis.streamline_cache import SIDECAR_DIRNAME
+
+
+def scan_files(directory):
+    """
+    Index every file below a directory by its base name, in a single scandir pass.
+
+    Streamline cache directories (see streamline_cache) are skipped.
+
+    Parameters:
+        directory (str): Path to the directory to scan.
+
+    Returns:
+        index (dict): Base name -> sorted list of paths of the files with that name.
+    """
+    index = {}
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name != SIDECAR_DIRNAME:
+                    stack.append(entry.path)
+            elif entry.is_file():
+                index.setdefault(entry.name, []).append(entry.path)
+    for paths in index.values():
+        paths.sort()
+    return index
+
+
+def _name_matcher(file_path):
+    # "re:<regex>" is a regular expression, a name with glob characters is a glob, anything else is literal
+    name = os.path.basename(file_path)
+    if file_path.startswith("re:"):
+        pattern = re.compile(file_path[3:])
+        return lambda candidate: pattern.fullmatch(candidate) is not None
+    if any(char in name for char in "*?["):
+        return lambda candidate: fnmatch.fnmatchcase(candidate, name)
+    return None
+
+
+def match_tract_files(index, file_paths):
+    """
+    Resolve the requested tract file names against a file index.
+
+    Parameters:
+        index (dict): Base name -> list of paths, as returned by scan_files.
+        file_paths (list): Requested tract file names. Names containing glob characters are matched as
+            globs, and names prefixed with "re:" as regular expressions on the base name.
+
+    Returns:
+        matches (dict): Base name -> path of the matched file, in request order. A pattern contributes one
+            entry per matching base name. Base names found at several paths are left out.
+        missing (list): Requested names without any match.
+        ambiguous (dict): Base name -> all paths with that name, for names found at more than one path.
+    """
+    matches, missing, ambiguous = {}, [], {}
+    for file_path in file_paths:
+        matcher = _name_matcher(file_path)
+        if matcher is None:
+            names = [os.path.basename(file_path)] if os.path.basename(file_path) in index else []
+        else:
+            names = sorted(name for name in index if matcher(name))
+
+        if not names:
+            missing.append(file_path)
+        for name in names:
+            paths = index[name]
+            if len(paths) > 1:
+                ambiguous[name] = paths
+            else:
+                matches[name] = paths[0]
+    return matches, missing, ambiguous
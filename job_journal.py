@@ -0,0 +1,153 @@
+import os
+import json
+import time
+
+
+def job_key(job):
+    """
+    Identify a tract job by its subject, file, reference image and options.
+
+    Parameters:
+        job (tuple): (subject_id, tract_path, reference, options) tuple.
+
+    Returns:
+        key (str): JSON key of the job.
+    """
+    subject_id, tract_path, reference, options = job
+    return json.dumps([str(subject_id), os.path.abspath(tract_path), str(getattr(reference, "path", reference)),
+                       options or {}], sort_keys=True, default=str)
+
+
+def _file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _drop_partial_line(path):
+    # Truncate a journal back to its last complete line, so that records appended after an interrupted
+    # write do not land on the same line as the partial record
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(end - 65536, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+
+
+class JobJournal:
+    """
+    Append-only journal of finished tract jobs, used to resume interrupted runs.
+
+    Every finished job is appended as one JSON line, written with a single
+    write() on a file opened in append mode and synced to disk, so a run that
+    is killed leaves at most a truncated last line, which is ignored on load
+    and cut off when the journal is resumed.
+    Successful jobs are stored with their statistics and failed jobs with
+    their traceback. A record only counts for a job if the tractography file
+    still has the size and mtime it had when the job ran.
+
+    Parameters:
+        path (str): Path to the journal file.
+        resume (bool): Keep the records of an earlier run; otherwise the journal is started afresh.
+        retry_failed (bool): When resuming, run the jobs that failed before again instead of
+            reusing their recorded failure.
+        sync (bool): fsync the journal after every record.
+    """
+
+    def __init__(self, path, resume=False, retry_failed=True, sync=True):
+        self.path = path
+        self.retry_failed = retry_failed
+        self.sync = sync
+        self.records = {}
+        if resume and os.path.isfile(path):
+            self.records = self.load(path)
+            _drop_partial_line(path)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | (0 if resume else os.O_TRUNC), 0o644)
+
+    @staticmethod
+    def load(path):
+        """
+        Read the records of a journal file, the last record of each job winning.
+
+        Parameters:
+            path (str): Path to the journal file.
+
+        Returns:
+            records (dict): Job key -> record.
+        """
+        records = {}
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Truncated by an interrupted write
+                records[record["key"]] = record
+        return records
+
+    def record(self, job, result):
+        """
+        Append the result of a finished job to the journal.
+
+        Parameters:
+            job (tuple): (subject_id, tract_path, reference, options) tuple.
+            result (tuple): (subject_id, tract_path, tract_stats, error) result of the job.
+        """
+        _, tract_path, tract_stats, error = result
+        record = {"key": job_key(job), "subject": str(job[0]), "tract_path": tract_path,
+                  "status": "failed" if error is not None else "done", "tract_stats": tract_stats,
+                  "error": error, "file_stat": _file_stat(tract_path), "time": time.time()}
+        os.write(self._fd, (json.dumps(record) + "\n").encode())
+        if self.sync:
+            os.fsync(self._fd)
+        self.records[record["key"]] = record
+
+    def result(self, job):
+        """
+        Get the recorded result of a job if it does not need to run again.
+
+        Parameters:
+            job (tuple): (subject_id, tract_path, reference, options) tuple.
+
+        Returns:
+            result (tuple or None): Recorded (subject_id, tract_path, tract_stats, error), or None if the
+                job has no usable record.
+        """
+        record = self.records.get(job_key(job))
+        if record is None or record["file_stat"] != _file_stat(job[1]):
+            return None
+        if record["status"] == "failed" and self.retry_failed:
+            return None
+        return job[0], job[1], record["tract_stats"], record["error"]
+
+    def failed(self):
+        """
+        Records of the jobs whose last run failed.
+
+        Returns:
+            records (list): Failed records, with their "subject", "tract_path" and "error" traceback.
+        """
+        return [record for record in self.records.values() if record["status"] == "failed"]
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
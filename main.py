@@ -1,28 +1,228 @@
+import os
+import sys
 import argparse
-from tract_analysis.data_aggregation import aggregate_results_to_dataframe, save_to_excel
+from tract_analysis.job_journal import JobJournal
+from tract_analysis.precision import PRECISIONS, DEFAULT_PRECISION
+from tract_analysis.profiling import Profiler
+from tract_analysis.result_writers import WRITERS, infer_format, get_result_writer, rows_to_dataframes
+from tract_analysis.sharding import parse_shard
+from tract_analysis.streamline_cache import configure_streamline_cache
 
+# The processing modules (dipy, nibabel, pandas, ...) are imported when a run starts, not for --help
 
-def main():
+
+def shard_argument(text):
+    # argparse type of --shard, reporting the reason of an invalid value
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
     """
-    Main function to aggregate tractography statistics and save to an Excel file.
+    Main function to aggregate tractography statistics and save them to an Excel, CSV, Parquet or Feather file.
+
+    Parameters:
+        argv (list): Command-line arguments; sys.argv[1:] if None. "merge" as the first argument runs merge().
     """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "merge":
+        merge(argv[1:])
+        return
+
     # Parse command-line arguments
-    parser = argparse.ArgumentParser(description="Aggregate tractography statistics and save to an Excel file.")
+    parser = argparse.ArgumentParser(description="Aggregate tractography statistics and save to an Excel, CSV, "
+                                                 "Parquet or Feather file.",
+                                     epilog='Run "main.py merge --help" to combine the outputs of --shard runs, '
+                                            'and "python -m tract_analysis.daemon --help" for the resident '
+                                            'daemon mode.')
 
     parser.add_argument('-r', '--root_directory', type=str, required=True,
                         help='Path to the root directory containing subject directories.')
     parser.add_argument('-f', '--file_paths', nargs='+', required=True,
                         help='List of tractography file names to be processed.')
-    parser.add_argument('-i', '--reference_image', type=str, required=True,
+    parser.add_argument('-i', '--reference_image', type=str,
                         help='Path to the reference image file.')
+    parser.add_argument('-p', '--reference_pattern', type=str,
+                        help='Filename pattern of the per-subject reference image (e.g. "*_T1w.nii.gz"), '
+                             'searched in each subject directory. Falls back to --reference_image.')
     parser.add_argument('-o', '--output_file', type=str, required=True,
-                        help='Path to the output Excel file.')
+                        help='Path to the output file (.xlsx, .csv, .parquet or .feather).')
+    parser.add_argument('--format', choices=sorted(WRITERS),
+                        help='Output format; inferred from the output file extension by default. '
+                             'CSV, Parquet and Feather are written incrementally in long/tidy form.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes used to process the tractography files.')
+    parser.add_argument('--prefetch', type=int, default=0, metavar='THREADS',
+                        help='Load the next tractography files on this many background threads while the current '
+                             'one is processed (with -j 1), overlapping reading with computation.')
+    parser.add_argument('--prefetch_depth', type=int,
+                        help='Maximum number of loaded tractograms held in memory with --prefetch; defaults to '
+                             'the number of prefetch threads plus one.')
+    parser.add_argument('--stream_chunk_size', type=int,
+                        help='Read .tck files in chunks of this many streamlines to bound memory use.')
+    parser.add_argument('--batch_tracts', action='store_true',
+                        help='Process all tracts of a subject together in one batched pass.')
+    parser.add_argument('--cache_dir', type=str,
+                        help='Directory of a persistent result cache; unchanged files are not recomputed.')
+    parser.add_argument('--cache_max_size', type=float,
+                        help='Maximum size of the result cache in megabytes.')
+    parser.add_argument('--cache_max_age', type=float,
+                        help='Maximum age in days of unused result cache entries.')
+    parser.add_argument('--precision', choices=sorted(PRECISIONS), default=DEFAULT_PRECISION,
+                        help='Numeric precision policy: "float64" computes in double precision, "float32" keeps the '
+                             'float32 streamline points and only accumulates sums and means in float64, halving '
+                             'memory traffic (relative error of lengths and spans below about 1e-6).')
+    parser.add_argument('--profile_segments', type=int, metavar='N',
+                        help='Add the along-tract profile of each tract: span, diameter and curvature of N '
+                             'segments from the E1 to the E2 end.')
+    parser.add_argument('--approximate', type=float, metavar='FRACTION',
+                        help='Quick preview: estimate the statistics from a reproducible sample of this fraction '
+                             'of the streamlines of each tract (or of this many streamlines if 1 or more), '
+                             'with 95%% confidence intervals.')
+    parser.add_argument('--streamline_cache', action='store_true',
+                        help='Convert every tractography file into a memory-mapped streamline cache (.npy) the '
+                             'first time it is loaded; later runs read the cache while it is up to date.')
+    parser.add_argument('--streamline_cache_dir', type=str,
+                        help='Directory of the streamline caches; by default they are kept in a '
+                             '".streamline_cache" directory next to each tractography file.')
+    parser.add_argument('--profile', nargs='?', const='', metavar='PREFIX',
+                        help='Record the wall time, CPU time, bytes read and peak RSS of every stage and job, and '
+                             'write them to PREFIX.jsonl and PREFIX.trace.json (Chrome trace format). PREFIX '
+                             'defaults to the output file name without extension followed by "_profile".')
+    parser.add_argument('--journal', type=str,
+                        help='Record every finished (subject, tract) job in a job journal at this path, so an '
+                             'interrupted run can be resumed. Without --journal or --resume no journal is kept.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip the jobs completed in the journal of an earlier, interrupted run and '
+                             'rebuild the results from it. Failed jobs are run again. The journal defaults to the '
+                             'output file name without extension followed by ".journal.jsonl".')
+    parser.add_argument('--skip_failed', action='store_true',
+                        help='With --resume, keep the recorded failures instead of running the failed jobs again.')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and update the output file as new or modified tractography files '
+                             'appear under the root directory (inotify where available, polling otherwise). '
+                             'Stop with Ctrl+C.')
+    parser.add_argument('--watch_interval', type=float, default=2.0, metavar='SECONDS',
+                        help='Seconds between checks for changes with --watch (default: %(default)s).')
+    parser.add_argument('--settle', type=float, default=5.0, metavar='SECONDS',
+                        help='With --watch, only process files whose size and modification time stayed unchanged '
+                             'for this many seconds, so half-written files are skipped (default: %(default)s).')
+    parser.add_argument('--poll', action='store_true',
+                        help='With --watch, rescan the root directory at every interval instead of using inotify '
+                             '(e.g. on network file systems).')
+    parser.add_argument('--shard', type=shard_argument, metavar='INDEX/COUNT',
+                        help='Only process shard INDEX (0-based) of COUNT shards of the jobs, balanced by file size '
+                             '(e.g. --shard $SLURM_ARRAY_TASK_ID/100). Needs a CSV, Parquet or Feather output; '
+                             'combine the shard outputs with "main.py merge".')
+
+    args = parser.parse_args(argv)
+    if args.reference_image is None and args.reference_pattern is None:
+        parser.error("one of --reference_image or --reference_pattern is required")
+
+    cache = None
+    if args.cache_dir:
+        from tract_analysis.result_cache import ResultCache
+        cache = ResultCache(args.cache_dir,
+                            max_bytes=args.cache_max_size * 1024 ** 2 if args.cache_max_size else None,
+                            max_age=args.cache_max_age * 86400 if args.cache_max_age else None)
+
+    try:
+        output_format = args.format or infer_format(args.output_file)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.shard is not None and output_format == "excel":
+        parser.error("--shard needs a CSV, Parquet or Feather output file")
+    if args.watch and args.shard is not None:
+        parser.error("--watch cannot be combined with --shard")
+
+    if args.streamline_cache or args.streamline_cache_dir:
+        configure_streamline_cache(args.streamline_cache_dir, write=args.streamline_cache)
+
+    if args.profile is None:
+        run(args, output_format, cache)
+        return
+
+    profile_prefix = args.profile or os.path.splitext(args.output_file)[0] + "_profile"
+    with Profiler() as profiler:
+        run(args, output_format, cache)
+    profiler.write_jsonl(profile_prefix + ".jsonl")
+    profiler.write_chrome_trace(profile_prefix + ".trace.json")
+    print(profiler.format_summary())
+    print(f"Profile written to {profile_prefix}.jsonl and {profile_prefix}.trace.json")
+
+
+def run(args, output_format, cache=None):
+    """
+    Process the tractography files selected by the command-line arguments and save the results.
+
+    Parameters:
+        args (Namespace): Parsed command-line arguments.
+        output_format (str): Output format, one of the WRITERS keys.
+        cache (ResultCache): Optional result cache.
+    """
+    if args.journal is None and not args.resume:
+        write_output(args, output_format, cache)
+        return
+
+    journal_path = args.journal or os.path.splitext(args.output_file)[0] + ".journal.jsonl"
+    with JobJournal(journal_path, resume=args.resume, retry_failed=not args.skip_failed) as journal:
+        write_output(args, output_format, cache, journal)
 
-    args = parser.parse_args()
+    failed = journal.failed()
+    if failed:
+        print(f"{len(failed)} jobs failed; their tracebacks are recorded in {journal_path}. "
+              f"Rerun with --resume to retry only those.")
+
+
+def write_output(args, output_format, cache=None, journal=None):
+    """
+    Process the tractography files and write the output file in the requested format.
+
+    Parameters:
+        args (Namespace): Parsed command-line arguments.
+        output_format (str): Output format, one of the WRITERS keys.
+        cache (ResultCache): Optional result cache.
+        journal (JobJournal): Optional journal of finished jobs.
+    """
+    from tract_analysis.data_aggregation import aggregate_results_to_dataframe, save_to_excel, write_results
+
+    if args.watch:
+        # Keep the output up to date until interrupted
+        from tract_analysis.watch import watch_results
+        watch_results(args.root_directory, args.file_paths, args.output_file, args.reference_image,
+                      format=output_format, workers=args.jobs, reference_pattern=args.reference_pattern,
+                      stream_chunk_size=args.stream_chunk_size, cache=cache, batch_tracts=args.batch_tracts,
+                      journal=journal, precision=args.precision, profile_segments=args.profile_segments,
+                      approximate=args.approximate, prefetch=args.prefetch, prefetch_depth=args.prefetch_depth,
+                      settle=args.settle, interval=args.watch_interval, polling=args.poll)
+        return
+
+    if output_format != "excel":
+        # Write the results incrementally as the files are processed
+        print(f"Writing results from tractography files to {args.output_file}...")
+        with get_result_writer(args.output_file, output_format) as writer:
+            write_results(args.root_directory, args.file_paths, writer, args.reference_image, workers=args.jobs,
+                          reference_pattern=args.reference_pattern, stream_chunk_size=args.stream_chunk_size,
+                          cache=cache, batch_tracts=args.batch_tracts, journal=journal, shard=args.shard,
+                          precision=args.precision, prefetch=args.prefetch, prefetch_depth=args.prefetch_depth,
+                          profile_segments=args.profile_segments, approximate=args.approximate)
+        print("Process completed successfully.")
+        return
 
     # Aggregate results from the tractography files into dataframes
     print("Aggregating results from tractography files...")
-    statistical_dataframes = aggregate_results_to_dataframe(args.root_directory, args.file_paths, args.reference_image)
+    statistical_dataframes = aggregate_results_to_dataframe(args.root_directory, args.file_paths, args.reference_image,
+                                                            workers=args.jobs,
+                                                            reference_pattern=args.reference_pattern,
+                                                            stream_chunk_size=args.stream_chunk_size,
+                                                            cache=cache, batch_tracts=args.batch_tracts,
+                                                            journal=journal, precision=args.precision,
+                                                            prefetch=args.prefetch,
+                                                            prefetch_depth=args.prefetch_depth,
+                                                            profile_segments=args.profile_segments,
+                                                            approximate=args.approximate)
 
     # Save the aggregated dataframes to an Excel file
     print(f"Saving aggregated results to {args.output_file}...")
@@ -31,5 +231,45 @@ def main():
     print("Process completed successfully.")
 
 
+def merge(argv=None):
+    """
+    Combine the outputs of the shards of a --shard run into the output of a single-node run.
+
+    Parameters:
+        argv (list): Command-line arguments of the merge subcommand.
+    """
+    parser = argparse.ArgumentParser(prog="main.py merge",
+                                     description="Merge the outputs of all shards of a --shard run into one "
+                                                 "Excel, CSV, Parquet or Feather file.")
+    parser.add_argument('shard_files', nargs='+',
+                        help='Output files of the shards; each needs its .shard.json manifest next to it.')
+    parser.add_argument('-o', '--output_file', type=str, required=True,
+                        help='Path to the merged output file (.xlsx, .csv, .parquet or .feather).')
+    parser.add_argument('--format', choices=sorted(WRITERS),
+                        help='Output format; inferred from the output file extension by default.')
+    args = parser.parse_args(argv)
+
+    from tract_analysis.sharding import merge_shards
+
+    try:
+        output_format = args.format or infer_format(args.output_file)
+        rows, file_paths, errors = merge_shards(args.shard_files)
+    except ValueError as e:
+        parser.exit(1, f"Error: {e}\n")
+
+    if output_format == "excel":
+        from tract_analysis.data_aggregation import save_to_excel
+        dfs = rows_to_dataframes(rows)
+        dfs["file_paths"] = file_paths
+        save_to_excel(dfs, args.output_file)
+    else:
+        with get_result_writer(args.output_file, output_format) as writer:
+            writer.write(rows)
+
+    print(f"Merged {len(args.shard_files)} shards ({len(rows)} rows) into {args.output_file}.")
+    for subject_id, tract_path, error in errors:
+        print(f"Error processing file {tract_path}: {error.strip().splitlines()[-1]}")
+
+
 if __name__ == "__main__":
     main()
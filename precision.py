@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+import numpy as np
+
+# Precision policies: the dtype point arithmetic runs in; sums and means are always accumulated in float64
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+DEFAULT_PRECISION = "float64"
+
+# Set by set_precision() or use_precision(); passed on to worker processes, see data_aggregation._init_worker
+_precision = DEFAULT_PRECISION
+
+
+def set_precision(precision):
+    """
+    Select the numeric precision policy of the calculations.
+
+    "float64" converts the streamline points to float64 before any arithmetic.
+    "float32" keeps the float32 points of the tractography files (coordinate
+    transforms, segment vectors, norms and voxel densities run in float32)
+    and only accumulates sums and means in float64, which halves the memory
+    traffic of the hot paths. For coordinates below 1000 mm the relative error
+    of a streamline length, span or mean is then bounded by about 1e-6 (a few
+    float32 roundings per segment, never accumulated), and voxel indices can
+    only differ for samples within about 1e-4 voxel of a voxel boundary.
+
+    Parameters:
+        precision (str): "float64" or "float32".
+    """
+    global _precision
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'; choose from {sorted(PRECISIONS)}.")
+    _precision = precision
+
+
+def get_precision():
+    """
+    Get the current precision policy.
+
+    Returns:
+        precision (str): "float64" or "float32".
+    """
+    return _precision
+
+
+@contextmanager
+def use_precision(precision):
+    """
+    Use a precision policy within a with block, restoring the previous one afterwards.
+
+    Parameters:
+        precision (str): "float64" or "float32"; None keeps the current policy.
+    """
+    previous = _precision
+    if precision is not None:
+        set_precision(precision)
+    try:
+        yield
+    finally:
+        set_precision(previous)
+
+
+def compute_dtype():
+    """
+    Get the dtype point arithmetic runs in under the current policy.
+
+    Returns:
+        dtype (type): np.float64 or np.float32.
+    """
+    return PRECISIONS[_precision]
+
+
+def as_compute(array):
+    """
+    Convert an array to the compute dtype, without copying if it already has it.
+
+    Parameters:
+        array (ndarray): Array of point coordinates or values.
+
+    Returns:
+        array (ndarray): The array in the compute dtype.
+    """
+    return np.asarray(array, dtype=compute_dtype())
@@ -0,0 +1,52 @@
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def iter_prefetched(tasks, load, threads=1, depth=None):
+    """
+    Load tasks on background threads ahead of their consumer, yielding them in task order.
+
+    At most ``depth`` tasks, counting the one being consumed, are loading or
+    loaded at any time: the next task is only submitted once the consumer
+    asks for another one, so a slow consumer stalls the loaders instead of
+    filling memory.
+
+    Parameters:
+        tasks (iterable): Tasks to load.
+        load (callable): Function loading one task; it runs on the background threads.
+        threads (int): Number of loader threads.
+        depth (int): Maximum number of loaded tasks held at a time; one more than the number of
+            threads if None, which keeps every thread busy while a task is consumed.
+
+    Yields:
+        task: The task.
+        loaded: Return value of ``load(task)``, None if it raised.
+        error (str or None): Formatted traceback if ``load(task)`` raised.
+    """
+    threads = max(int(threads), 1)
+    depth = max(depth or threads + 1, 1)
+    tasks = iter(tasks)
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="prefetch")
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append((task, executor.submit(load, task)))
+            if len(pending) >= depth:
+                break
+
+        while pending:
+            task, future = pending.popleft()
+            try:
+                loaded, error = future.result(), None
+            except Exception:
+                loaded, error = None, traceback.format_exc()
+            yield task, loaded, error
+
+            # The consumed task frees its slot for the next one
+            for task in tasks:
+                pending.append((task, executor.submit(load, task)))
+                break
+    finally:
+        # A consumer stopping early cancels the tasks that have not started loading
+        executor.shutdown(wait=True, cancel_futures=True)
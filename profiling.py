@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import tempfile
+import threading
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Profiler recording the stages of this process; None when profiling is off
+_active = None
+
+
+class _NullStage:
+    """Do-nothing context manager returned by stage() and job() when profiling is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _bytes_read():
+    # Bytes read by read() system calls of this process, including reads served from the page cache
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    # Reset the resident set high-water mark (VmHWM) so that the peak of a job excludes earlier jobs
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    # Peak resident set size in bytes: VmHWM on Linux, the lifetime maximum elsewhere
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Stage:
+    """
+    Context manager timing one stage and recording it on exit.
+    """
+
+    def __init__(self, profiler, name, category, args):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        if self.category == "job":
+            _reset_peak_rss()
+        self.bytes_read = _bytes_read()
+        self.start = time.time()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        bytes_read = _bytes_read()
+        event = {"name": self.name, "category": self.category,
+                 "subject": self.profiler.labels.get("subject"), "tract": self.profiler.labels.get("tract"),
+                 "pid": os.getpid(), "tid": threading.get_ident(), "start": self.start, "wall": wall, "cpu": cpu,
+                 "bytes_read": None if bytes_read is None else bytes_read - self.bytes_read,
+                 "peak_rss": _peak_rss(), "failed": exc_type is not None}
+        if self.args:
+            event["args"] = self.args
+        self.profiler.record(event)
+        return False
+
+
+class _Job(_Stage):
+    """
+    Stage covering a whole (subject, tract) job; the stages inside it are labelled with the job.
+    """
+
+    def __init__(self, profiler, subject_id, tract_path):
+        super().__init__(profiler, "job", "job", None)
+        self.labels = {"subject": str(subject_id), "tract": os.path.basename(str(tract_path))}
+
+    def __enter__(self):
+        self.previous = self.profiler.labels
+        self.profiler.labels = self.labels
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        super().__exit__(exc_type, exc_value, tb)
+        self.profiler.labels = self.previous
+        return False
+
+
+class _Labels:
+    """
+    Context manager labelling the stages run inside it on the current thread, without recording an event.
+    """
+
+    def __init__(self, profiler, subject_id, tract_path):
+        self.profiler = profiler
+        self.labels = {"subject": str(subject_id), "tract": os.path.basename(str(tract_path))}
+
+    def __enter__(self):
+        self.previous = self.profiler.labels
+        self.profiler.labels = self.labels
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.profiler.labels = self.previous
+        return False
+
+
+class Profiler:
+    """
+    Record the wall time, CPU time, bytes read and peak RSS of each pipeline stage.
+
+    While started, the instrumented stages (see stage() and profiled()) of
+    this process record one event each; worker processes started by the
+    job runners spool their events to files that are collected on stop().
+    Events can be exported as JSON lines or in the Chrome trace format
+    (chrome://tracing, Perfetto).
+
+    Bytes read count the read() system calls of the process (including page
+    cache hits) and peak RSS is the resident set high-water mark, which is
+    reset at the start of each job on Linux. Both are None where the
+    platform does not provide them.
+
+    Parameters:
+        spool_file (str): If set, events are appended to this JSON lines file as they are recorded
+            instead of being kept in memory (used in worker processes).
+    """
+
+    def __init__(self, spool_file=None):
+        self.spool_file = spool_file
+        self.events = []
+        self._local = threading.local()
+        self.spool_dir = None
+
+    @property
+    def labels(self):
+        """Subject and tract labels of the job running on the current thread."""
+        return getattr(self._local, "labels", {})
+
+    @labels.setter
+    def labels(self, labels):
+        self._local.labels = labels
+
+    def record(self, event):
+        """
+        Record one stage event.
+
+        Parameters:
+            event (dict): Stage event.
+        """
+        if self.spool_file is None:
+            self.events.append(event)
+            return
+        with open(self.spool_file, "a") as f:
+            f.write(json.dumps(event) + "\n")
+
+    def stage(self, name, category="stage", **args):
+        return _Stage(self, name, category, args)
+
+    def job(self, subject_id, tract_path):
+        return _Job(self, subject_id, tract_path)
+
+    def start(self):
+        """
+        Make this the active profiler of the process.
+        """
+        global _active
+        self.spool_dir = tempfile.mkdtemp(prefix="tract_profile_")
+        _active = self
+        return self
+
+    def stop(self):
+        """
+        Deactivate the profiler and collect the events spooled by worker processes.
+        """
+        global _active
+        if _active is self:
+            _active = None
+        if self.spool_dir is not None:
+            for path in sorted(glob.glob(os.path.join(self.spool_dir, "*.jsonl"))):
+                with open(path) as f:
+                    self.events.extend(json.loads(line) for line in f if line.strip())
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+            self.spool_dir = None
+        self.events.sort(key=lambda event: event["start"])
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def worker_options(self):
+        """
+        ProcessPoolExecutor keyword arguments that start a spooling profiler in every worker.
+
+        Returns:
+            options (dict): initializer and initargs keyword arguments.
+        """
+        return {"initializer": _start_worker_profiler, "initargs": (self.spool_dir,)}
+
+    def write_jsonl(self, path):
+        """
+        Write the recorded events as JSON lines, one event per line.
+
+        Parameters:
+            path (str): Path to the output file.
+        """
+        with open(path, "w") as f:
+            for event in self.events:
+                f.write(json.dumps(event) + "\n")
+
+    def write_chrome_trace(self, path):
+        """
+        Write the recorded events in the Chrome trace event format.
+
+        Parameters:
+            path (str): Path to the output .json file.
+        """
+        trace_events = []
+        for event in self.events:
+            args = {key: event[key] for key in ("subject", "tract", "cpu", "bytes_read", "peak_rss", "failed")}
+            args.update(event.get("args", {}))
+            trace_events.append({"name": event["name"], "cat": event["category"], "ph": "X",
+                                 "ts": event["start"] * 1e6, "dur": event["wall"] * 1e6,
+                                 "pid": event["pid"], "tid": event["tid"], "args": args})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        """
+        Total the recorded events per stage.
+
+        Returns:
+            summary (dict): Stage name -> {"count", "wall", "cpu", "bytes_read"} totals.
+        """
+        totals = {}
+        for event in self.events:
+            total = totals.setdefault(event["name"], {"count": 0, "wall": 0.0, "cpu": 0.0, "bytes_read": 0})
+            total["count"] += 1
+            total["wall"] += event["wall"]
+            total["cpu"] += event["cpu"]
+            total["bytes_read"] += event["bytes_read"] or 0
+        return totals
+
+    def format_summary(self):
+        lines = [f"{'stage':>24} {'count':>7} {'wall s':>10} {'cpu s':>10} {'read MB':>10}"]
+        for name, total in sorted(self.summary().items(), key=lambda item: -item[1]["wall"]):
+            lines.append(f"{name:>24} {total['count']:>7} {total['wall']:>10.3f} {total['cpu']:>10.3f} "
+                         f"{total['bytes_read'] / 2 ** 20:>10.1f}")
+        return "\n".join(lines)
+
+
+def _start_worker_profiler(spool_dir):
+    global _active
+    _active = Profiler(spool_file=os.path.join(spool_dir, f"{os.getpid()}.jsonl"))
+
+
+def active_profiler():
+    """
+    Get the active profiler of this process.
+
+    Returns:
+        profiler (Profiler or None): Active profiler, None when profiling is off.
+    """
+    return _active
+
+
+def stage(name, category="stage", **args):
+    """
+    Context manager recording a pipeline stage on the active profiler; does nothing when profiling is off.
+
+    Parameters:
+        name (str): Name of the stage.
+        category (str): Category of the stage in the trace.
+        **args: Extra JSON-serializable values stored with the event.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name, category, **args)
+
+
+def job(subject_id, tract_path):
+    """
+    Context manager recording a (subject, tract) job and labelling the stages run inside it.
+
+    Parameters:
+        subject_id (str): Subject of the job.
+        tract_path (str): Path to the tractography file of the job.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _active.job(subject_id, tract_path)
+
+
+def labelled(subject_id, tract_path):
+    """
+    Context manager labelling the stages run inside it with a job, e.g. on a prefetching thread.
+
+    Parameters:
+        subject_id (str): Subject of the job.
+        tract_path (str): Path to the tractography file of the job.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _Labels(_active, subject_id, tract_path)
+
+
+def profiled(name):
+    """
+    Decorator recording every call of a function as a pipeline stage.
+
+    Parameters:
+        name (str): Name of the stage.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with _active.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,143 @@
+import os
+import fnmatch
+from collections import OrderedDict
+import nibabel as nib
+from dipy.io.utils import get_reference_info
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ReferenceImage:
+    """
+    Spatial attributes of a reference image, read from its header once.
+
+    Attributes:
+        path (str): Absolute path to the reference image file.
+        header (Nifti1Header): Header of the reference image, usable as a dipy reference.
+        affine (ndarray): 4x4 voxel-to-world affine.
+        shape (tuple): Shape of the first three image dimensions.
+        zooms (tuple): Spacing of the voxels in x, y, and z directions.
+        space_attributes (tuple): (affine, dimensions, voxel_sizes, voxel_order) as used by dipy.
+        signature (tuple): (size, mtime_ns) of the file when its header was read.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.signature = _file_signature(self.path)
+        img = nib.load(self.path)
+        self.header = img.header
+        self.affine = img.affine
+        self.shape = tuple(int(n) for n in img.shape[:3])
+        self.zooms = tuple(float(z) for z in img.header.get_zooms()[:3])
+        self.space_attributes = get_reference_info(img.header)
+
+    def __repr__(self):
+        return f"ReferenceImage({self.path!r})"
+
+
+class ReferenceRegistry:
+    """
+    Resolve and cache reference images, optionally one per subject directory.
+
+    A cached header is reloaded when the size or mtime of its file changes, so
+    long-running processes (daemon, watch mode) pick up replaced references.
+
+    Parameters:
+        pattern (str): Filename glob matched inside a subject directory to find its reference
+            (e.g. "*_T1w.nii.gz"). If None, the default reference is used for every subject.
+        default (str): Path to the reference image used when no pattern is given or nothing matches.
+        max_size (int): Maximum number of reference headers kept in the cache.
+    """
+
+    def __init__(self, pattern=None, default=None, max_size=64):
+        self.pattern = pattern
+        self.default = default
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    def get(self, path):
+        """
+        Get the cached reference image for a path, loading its header on first use or after the file changed.
+
+        Parameters:
+            path (str): Path to the reference image file.
+
+        Returns:
+            reference (ReferenceImage): Cached reference image.
+        """
+        key = os.path.abspath(path)
+        if key in self._cache and self._cache[key].signature == _file_signature(key):
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        reference = ReferenceImage(key)
+        self._cache[key] = reference
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return reference
+
+    def find(self, subject_path, file_index=None):
+        """
+        Find the reference image file of a subject directory.
+
+        Parameters:
+            subject_path (str): Path to the subject directory.
+            file_index (dict): Base name -> paths index of the subject directory, as returned by
+                file_discovery.scan_files. The directory is walked if not given.
+
+        Returns:
+            path (str): Path to the reference image of the subject.
+        """
+        if self.pattern is not None:
+            if file_index is None:
+                matches = sorted(os.path.join(root, file)
+                                 for root, _, files in os.walk(subject_path)
+                                 for file in fnmatch.filter(files, self.pattern))
+            else:
+                matches = sorted(path for name in fnmatch.filter(file_index, self.pattern)
+                                 for path in file_index[name])
+            if len(matches) > 1:
+                raise ValueError(f"Multiple reference images match '{self.pattern}' in {subject_path}: {matches}")
+            if matches:
+                return matches[0]
+
+        if self.default is None:
+            raise FileNotFoundError(f"No reference image matching '{self.pattern}' in {subject_path}.")
+        return self.default
+
+    def resolve(self, subject_path, file_index=None):
+        """
+        Get the cached reference image of a subject directory.
+
+        Parameters:
+            subject_path (str): Path to the subject directory.
+            file_index (dict): Optional base name -> paths index of the subject directory.
+
+        Returns:
+            reference (ReferenceImage): Cached reference image of the subject.
+        """
+        return self.get(self.find(subject_path, file_index))
+
+    def __len__(self):
+        return len(self._cache)
+
+
+_default_registry = ReferenceRegistry()
+
+
+def get_reference(reference_image):
+    """
+    Get the cached reference image for a path, or pass a ReferenceImage through.
+
+    Parameters:
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+
+    Returns:
+        reference (ReferenceImage): Cached reference image.
+    """
+    if isinstance(reference_image, ReferenceImage):
+        return reference_image
+    return _default_registry.get(reference_image)
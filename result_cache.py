@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+from tract_analysis.calculations import METRICS_VERSION
+from tract_analysis.reference_registry import get_reference
+
+
+def file_content_hash(path, block_size=1 << 20):
+    """
+    Calculate the SHA-256 hash of a file's content.
+
+    Parameters:
+        path (str): Path to the file.
+        block_size (int): Number of bytes read at a time.
+
+    Returns:
+        digest (str): Hexadecimal digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def reference_identity(reference_image):
+    """
+    Calculate a hash identifying the geometry of a reference image.
+
+    Parameters:
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+
+    Returns:
+        digest (str): Hexadecimal digest of the affine, shape and voxel sizes.
+    """
+    reference = get_reference(reference_image)
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(reference.affine, dtype=np.float64).tobytes())
+    digest.update(json.dumps([reference.shape, reference.zooms]).encode())
+    return digest.hexdigest()
+
+
+def _atomic_write(path, write):
+    # Write through a temporary file in the same directory and rename it into place
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ResultCache:
+    """
+    Persistent on-disk cache of per-file tract statistics.
+
+    Entries are keyed by the content hash of the tractography file, the
+    geometry of the reference image, METRICS_VERSION and the processing
+    options. The content hash of each path is remembered with the size and
+    mtime it was computed for, so an unchanged file is only hashed once.
+
+    Parameters:
+        cache_dir (str): Directory holding the cache.
+        max_bytes (int): Maximum total size of the cache entries, enforced by evict().
+        max_age (float): Maximum age in seconds of a cache entry since its last use, enforced by evict().
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, max_age=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(cache_dir, "entries"), exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "file_index.json")
+        self._file_index = {}
+        if os.path.isfile(self._index_path):
+            with open(self._index_path) as f:
+                # Absolute path -> [size, mtime_ns, digest]; entries in any other layout are dropped
+                self._file_index = {path: entry for path, entry in json.load(f).items() if isinstance(entry, list)}
+
+    def file_hash(self, path):
+        """
+        Get the content hash of a file, reusing the stored hash if its size and mtime are unchanged.
+
+        Parameters:
+            path (str): Path to the file.
+
+        Returns:
+            digest (str): Hexadecimal digest of the file content.
+        """
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        entry = self._file_index.get(path)
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            # Replaces the hash of an earlier version of the file
+            entry = self._file_index[path] = [stat.st_size, stat.st_mtime_ns, file_content_hash(path)]
+        return entry[2]
+
+    def key(self, tract_path, reference_image, options=None):
+        """
+        Calculate the cache key of a tract job.
+
+        Parameters:
+            tract_path (str): Path to the tractography file.
+            reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+            options (dict): Processing options of the job.
+
+        Returns:
+            key (str): Hexadecimal cache key.
+        """
+        identity = {
+            "tract": self.file_hash(tract_path),
+            "reference": reference_identity(reference_image),
+            "metrics_version": METRICS_VERSION,
+            "options": options or {},
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry_path(self, key, extension):
+        return os.path.join(self.cache_dir, "entries", f"{key}{extension}")
+
+    def get(self, key):
+        """
+        Get the cached statistics of a key, counting a hit or a miss.
+
+        Parameters:
+            key (str): Cache key.
+
+        Returns:
+            tract_stats (dict or None): Cached statistics, None on a miss.
+        """
+        path = self._entry_path(key, ".json")
+        try:
+            with open(path) as f:
+                tract_stats = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Refresh the access time used by age-based eviction
+        os.utime(path)
+        self.hits += 1
+        return tract_stats
+
+    def get_arrays(self, key):
+        """
+        Get the cached intermediate arrays of a key.
+
+        Parameters:
+            key (str): Cache key.
+
+        Returns:
+            arrays (dict or None): Cached arrays (e.g. "lengths", "spans"), None if not stored.
+        """
+        path = self._entry_path(key, ".npz")
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    def put(self, key, tract_stats, arrays=None):
+        """
+        Store the statistics, and optionally intermediate arrays, of a key.
+
+        Parameters:
+            key (str): Cache key.
+            tract_stats (dict): Statistics to store.
+            arrays (dict): Optional arrays to store alongside (e.g. "lengths", "spans").
+        """
+        if arrays:
+            _atomic_write(self._entry_path(key, ".npz"), lambda f: np.savez(f, **arrays))
+        _atomic_write(self._entry_path(key, ".json"), lambda f: f.write(json.dumps(tract_stats).encode()))
+
+    def save_index(self):
+        """
+        Persist the path to (size, mtime, content hash) index.
+        """
+        _atomic_write(self._index_path, lambda f: f.write(json.dumps(self._file_index).encode()))
+
+    def evict(self, max_bytes=None, max_age=None):
+        """
+        Remove entries older than max_age, then the least recently used entries until under max_bytes.
+
+        Files that no longer exist are also dropped from the content hash index.
+
+        Parameters:
+            max_bytes (int): Maximum total size of the entries; defaults to the cache setting.
+            max_age (float): Maximum age in seconds; defaults to the cache setting.
+
+        Returns:
+            removed (int): Number of removed entries.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        entries_dir = os.path.join(self.cache_dir, "entries")
+
+        entries = {}
+        for name in os.listdir(entries_dir):
+            key, extension = os.path.splitext(name)
+            if extension not in (".json", ".npz"):
+                continue
+            stat = os.stat(os.path.join(entries_dir, name))
+            last_used, size = entries.get(key, (0.0, 0))
+            entries[key] = (max(last_used, stat.st_mtime), size + stat.st_size)
+
+        now = time.time()
+        removed = []
+        by_age = sorted(entries.items(), key=lambda item: item[1][0])
+        total = sum(size for _, (_, size) in by_age)
+        for key, (last_used, size) in by_age:
+            too_old = max_age is not None and now - last_used > max_age
+            too_big = max_bytes is not None and total > max_bytes
+            if not (too_old or too_big):
+                continue
+            for extension in (".json", ".npz"):
+                if os.path.exists(self._entry_path(key, extension)):
+                    os.remove(self._entry_path(key, extension))
+            total -= size
+            removed.append(key)
+
+        gone = [path for path in self._file_index if not os.path.exists(path)]
+        for path in gone:
+            del self._file_index[path]
+        if gone:
+            self.save_index()
+        return len(removed)
+
+    def report(self):
+        """
+        Summarize the cache hits and misses of this run.
+
+        Returns:
+            report (str): Human-readable summary.
+        """
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"Result cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
@@ -0,0 +1,276 @@
+import os
+import csv
+from abc import ABC, abstractmethod
+from tract_analysis.calculations import METRICS_VERSION
+from tract_analysis.profiling import stage
+
+# Columns of the long/tidy result schema
+TIDY_COLUMNS = ["subject", "tract", "metric", "value", "tract_path", "reference_image", "metrics_version"]
+
+# Output file extensions of each writer format
+FORMAT_EXTENSIONS = {
+    "csv": (".csv",),
+    "parquet": (".parquet", ".pq"),
+    "feather": (".feather", ".arrow"),
+    "excel": (".xlsx", ".xls"),
+}
+
+
+def tidy_rows(subject_id, tract_path, tract_stats, reference_image=None):
+    """
+    Convert the statistics of one tractography file into long/tidy rows.
+
+    Parameters:
+        subject_id (str): Subject the file belongs to.
+        tract_path (str): Path to the tractography file.
+        tract_stats (dict): Statistics of the file.
+        reference_image (str): Path to the reference image the file was processed with.
+
+    Returns:
+        rows (list): One dict per metric, with the TIDY_COLUMNS keys.
+    """
+    tract = os.path.basename(tract_path)
+    return [{"subject": str(subject_id), "tract": tract, "metric": metric, "value": float(value),
+             "tract_path": str(tract_path), "reference_image": reference_image or "",
+             "metrics_version": METRICS_VERSION}
+            for metric, value in tract_stats.items()]
+
+
+def rows_to_dataframes(rows):
+    """
+    Pivot tidy rows into one subject x tract dataframe per metric, as returned by aggregate_results_to_dataframe.
+
+    Parameters:
+        rows (iterable): Tidy rows (dicts with the TIDY_COLUMNS keys).
+
+    Returns:
+        dfs (dict): Dictionary of dataframes; "file_paths" holds the path of each tractography file.
+    """
+    import pandas as pd
+
+    file_paths = {}
+    statistics = {}
+    for row in rows:
+        file_paths.setdefault(row["subject"], {})[row["tract"]] = row["tract_path"]
+        statistics.setdefault(row["metric"], {}).setdefault(row["subject"], {})[row["tract"]] = row["value"]
+
+    dfs = {"file_paths": pd.DataFrame(file_paths).T}
+    for metric, stat_dict in statistics.items():
+        dfs[metric] = pd.DataFrame(stat_dict).T
+    return dfs
+
+
+class ResultWriter(ABC):
+    """
+    Base class of the incremental result writers.
+
+    Rows are passed to write() as jobs finish, so that a writer never needs
+    all results at once. Writers are context managers; close() finalizes
+    the output file. Subclasses must implement write().
+
+    Parameters:
+        output_file (str): Path to the output file.
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+
+    @abstractmethod
+    def write(self, rows):
+        """
+        Write a batch of tidy rows.
+
+        Parameters:
+            rows (list): Tidy rows (dicts with the TIDY_COLUMNS keys).
+        """
+
+    def close(self):
+        """
+        Flush and finalize the output file.
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        with stage("close_writer", category="writer"):
+            self.close()
+
+
+class CsvResultWriter(ResultWriter):
+    """
+    Append tidy rows to a CSV file as they arrive.
+    """
+
+    def __init__(self, output_file):
+        super().__init__(output_file)
+        self._file = open(output_file, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=TIDY_COLUMNS)
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class _ArrowResultWriter(ResultWriter):
+    """
+    Buffer tidy rows into Arrow record batches of batch_size rows.
+
+    Subclasses implement _open_writer(), returning the pyarrow writer of the output file.
+    """
+
+    def __init__(self, output_file, batch_size=10000):
+        super().__init__(output_file)
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError(f"pyarrow is required to write {output_file}; install it or use CSV output.") from e
+        self._pa = pa
+        self.schema = pa.schema([("subject", pa.string()), ("tract", pa.string()), ("metric", pa.string()),
+                                 ("value", pa.float64()), ("tract_path", pa.string()),
+                                 ("reference_image", pa.string()), ("metrics_version", pa.int64())])
+        self.batch_size = batch_size
+        self._buffer = []
+        self._writer = self._open_writer()
+
+    @abstractmethod
+    def _open_writer(self):
+        """
+        Open the pyarrow writer of the output file.
+
+        Returns:
+            writer: Object with write_table() and close(), writing self.schema.
+        """
+
+    def _flush(self):
+        if self._buffer:
+            self._writer.write_table(self._pa.Table.from_pylist(self._buffer, schema=self.schema))
+            self._buffer = []
+
+    def write(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+
+class ParquetResultWriter(_ArrowResultWriter):
+    """
+    Write tidy rows to a Parquet file, one row group per batch.
+    """
+
+    def _open_writer(self):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.output_file, self.schema)
+
+
+class FeatherResultWriter(_ArrowResultWriter):
+    """
+    Write tidy rows to a Feather (Arrow IPC) file, one record batch per batch.
+    """
+
+    def _open_writer(self):
+        import pyarrow.ipc as ipc
+        return ipc.new_file(self.output_file, self.schema)
+
+
+class ExcelResultWriter(ResultWriter):
+    """
+    Export tidy rows as one Excel sheet per metric.
+
+    Excel files cannot be appended to, so the rows are kept until close().
+    """
+
+    def __init__(self, output_file):
+        super().__init__(output_file)
+        self._rows = []
+
+    def write(self, rows):
+        self._rows.extend(rows)
+
+    def close(self):
+        if self._rows is not None:
+            import pandas as pd
+            with pd.ExcelWriter(self.output_file) as writer:
+                for stat_name, df in rows_to_dataframes(self._rows).items():
+                    df.to_excel(writer, sheet_name=stat_name)
+            self._rows = None
+
+
+WRITERS = {
+    "csv": CsvResultWriter,
+    "parquet": ParquetResultWriter,
+    "feather": FeatherResultWriter,
+    "excel": ExcelResultWriter,
+}
+
+
+def infer_format(output_file):
+    """
+    Infer the writer format from the extension of the output file.
+
+    Parameters:
+        output_file (str): Path to the output file.
+
+    Returns:
+        format (str): One of the WRITERS keys.
+    """
+    extension = os.path.splitext(output_file)[1].lower()
+    for format_name, extensions in FORMAT_EXTENSIONS.items():
+        if extension in extensions:
+            return format_name
+    raise ValueError(f"Cannot infer the output format of {output_file}; use one of {sorted(WRITERS)}.")
+
+
+def read_tidy_rows(path, format=None):
+    """
+    Read the tidy rows of a CSV, Parquet or Feather result file.
+
+    Parameters:
+        path (str): Path to the result file.
+        format (str): File format; inferred from the file extension if None.
+
+    Returns:
+        rows (list): Tidy rows (dicts with the TIDY_COLUMNS keys), in file order.
+    """
+    import pandas as pd
+
+    format_name = format or infer_format(path)
+    if format_name == "csv":
+        df = pd.read_csv(path, dtype={"subject": str, "tract": str, "metric": str, "tract_path": str,
+                                      "reference_image": str}, keep_default_na=False, na_values={"value": ["nan", ""]},
+                         float_precision="round_trip")
+    elif format_name == "parquet":
+        df = pd.read_parquet(path)
+    elif format_name == "feather":
+        df = pd.read_feather(path)
+    else:
+        raise ValueError(f"Cannot read tidy rows from {format_name} files; use csv, parquet or feather.")
+    return df[TIDY_COLUMNS].to_dict(orient="records")
+
+
+def get_result_writer(output_file, format=None):
+    """
+    Create the result writer of an output file.
+
+    Parameters:
+        output_file (str): Path to the output file.
+        format (str): Writer format; inferred from the file extension if None.
+
+    Returns:
+        writer (ResultWriter): Writer for the output file.
+    """
+    format_name = format or infer_format(output_file)
+    if format_name not in WRITERS:
+        raise ValueError(f"Unknown output format: {format_name}; use one of {sorted(WRITERS)}.")
+    return WRITERS[format_name](output_file)
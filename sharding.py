@@ -0,0 +1,222 @@
+import os
+import json
+import heapq
+import hashlib
+
+
+def parse_shard(text):
+    """
+    Parse a shard specification of the form "INDEX/COUNT".
+
+    Parameters:
+        text (str): Shard specification; INDEX is 0-based (e.g. "0/10" to "9/10").
+
+    Returns:
+        index (int): Index of the shard.
+        count (int): Number of shards.
+    """
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{text}'; use INDEX/COUNT, e.g. 0/10.") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{text}'; INDEX must be in [0, COUNT).")
+    return index, count
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def assign_shards(jobs, count):
+    """
+    Assign every job to one of ``count`` shards, balancing the total file size of the shards.
+
+    Jobs are placed largest file first on the shard with the smallest total
+    so far (ties go to the lowest shard index), which only depends on the
+    job list and the file sizes, so every shard computes the same assignment.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        count (int): Number of shards.
+
+    Returns:
+        shards (list): Shard index of each job.
+    """
+    sizes = [_file_size(tract_path) for _, tract_path, _, _ in jobs]
+    order = sorted(range(len(jobs)), key=lambda position: (-sizes[position], str(jobs[position][0]),
+                                                           str(jobs[position][1])))
+    loads = [(0, shard) for shard in range(count)]
+    shards = [0] * len(jobs)
+    for position in order:
+        load, shard = heapq.heappop(loads)
+        shards[position] = shard
+        heapq.heappush(loads, (load + sizes[position], shard))
+    return shards
+
+
+def shard_jobs(jobs, index, count, assignment=None):
+    """
+    Select the jobs of one shard, in job order.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        index (int): Index of the shard.
+        count (int): Number of shards.
+        assignment (list): Shard index of each job, as returned by assign_shards; computed if None.
+
+    Returns:
+        jobs (list): Jobs assigned to the shard.
+    """
+    if assignment is None:
+        assignment = assign_shards(jobs, count)
+    return [job for job, shard in zip(jobs, assignment) if shard == index]
+
+
+def _job_id(job):
+    return [str(job[0]), str(job[1])]
+
+
+def cohort_fingerprint(jobs, assignment=None):
+    """
+    Hash the (subject, tract path) list of all jobs, to check that shards come from the same run.
+
+    Parameters:
+        jobs (list): List of (subject_id, tract_path, reference, options) tuples.
+        assignment (list): Shard index of each job. Including it makes the fingerprint differ
+            between shards that split the jobs differently, e.g. because file sizes changed between
+            their launches.
+
+    Returns:
+        digest (str): Hexadecimal digest.
+    """
+    identity = [_job_id(job) for job in jobs]
+    if assignment is not None:
+        identity = [job_id + [shard] for job_id, shard in zip(identity, assignment)]
+    return hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+
+def shard_manifest_path(output_file):
+    return output_file + ".shard.json"
+
+
+def write_shard_manifest(output_file, index, count, jobs, shard, file_paths_df, n_rows, errors, assignment=None):
+    """
+    Write the manifest describing a finished shard next to its output file.
+
+    Parameters:
+        output_file (str): Path to the tidy output file of the shard.
+        index (int): Index of the shard.
+        count (int): Number of shards.
+        jobs (list): All jobs of the run, in job order.
+        shard (list): Jobs of this shard.
+        file_paths_df (DataFrame): Path of each tractography file, one row per subject, as returned by
+            discover_jobs.
+        n_rows (int): Number of tidy rows written to the output file.
+        errors (list): (subject_id, tract_path, traceback) of every job that failed.
+        assignment (list): Shard index of each job the shard was selected with; recomputed if None.
+    """
+    if assignment is None:
+        assignment = assign_shards(jobs, count)
+    positions = {tuple(_job_id(job)): position for position, job in enumerate(jobs)}
+    manifest = {
+        "index": index,
+        "count": count,
+        "output_file": os.path.basename(output_file),
+        "cohort": cohort_fingerprint(jobs, assignment),
+        "n_jobs_total": len(jobs),
+        "jobs": [[*_job_id(job), positions[tuple(_job_id(job))]] for job in shard],
+        "n_rows": n_rows,
+        "errors": [[str(subject_id), str(tract_path), error] for subject_id, tract_path, error in errors],
+        "file_paths": json.loads(file_paths_df.to_json(orient="split")),
+    }
+    # Written last and renamed into place, so a manifest only exists for a finished shard
+    manifest_path = shard_manifest_path(output_file)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def load_shard_manifests(shard_files):
+    """
+    Load and check the manifests of the shard outputs of one run.
+
+    Parameters:
+        shard_files (list): Paths to the tidy output files of the shards.
+
+    Returns:
+        manifests (list): Manifest of each shard output, ordered by shard index.
+    """
+    manifests = []
+    for shard_file in shard_files:
+        manifest_path = shard_manifest_path(shard_file)
+        if not os.path.isfile(manifest_path):
+            raise ValueError(f"{shard_file} has no shard manifest ({manifest_path}); the shard did not finish.")
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest["path"] = shard_file
+        manifests.append(manifest)
+    if not manifests:
+        raise ValueError("No shard outputs to merge.")
+
+    count = manifests[0]["count"]
+    if any(manifest["count"] != count for manifest in manifests):
+        raise ValueError(f"Shard outputs come from runs with different shard counts: "
+                         f"{sorted({manifest['count'] for manifest in manifests})}.")
+    if len({manifest["cohort"] for manifest in manifests}) > 1:
+        raise ValueError("Shard outputs come from runs over different sets of files, or the files changed "
+                         "between shard launches so that the shards split the jobs differently.")
+
+    by_index = {}
+    for manifest in manifests:
+        by_index.setdefault(manifest["index"], []).append(manifest["path"])
+    duplicates = {index: paths for index, paths in by_index.items() if len(paths) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate shards: {duplicates}.")
+    missing = sorted(set(range(count)) - set(by_index))
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {count}.")
+
+    positions = [job[2] for manifest in manifests for job in manifest["jobs"]]
+    if len(set(positions)) != len(positions):
+        raise ValueError("Some jobs appear in more than one shard.")
+    if len(positions) != manifests[0]["n_jobs_total"]:
+        raise ValueError(f"The shards hold {len(positions)} of {manifests[0]['n_jobs_total']} jobs.")
+    return sorted(manifests, key=lambda manifest: manifest["index"])
+
+
+def merge_shards(shard_files, format=None):
+    """
+    Combine the tidy outputs of all shards of a run into the rows of a single-node run.
+
+    Parameters:
+        shard_files (list): Paths to the tidy output files of the shards.
+        format (str): Format of the shard outputs; inferred from their extensions if None.
+
+    Returns:
+        rows (list): Tidy rows of all shards, in the job order of a single-node run.
+        file_paths (DataFrame): Path of each tractography file, one row per subject.
+        errors (list): (subject_id, tract_path, traceback) of every job that failed in any shard.
+    """
+    import pandas as pd
+    from tract_analysis.result_writers import read_tidy_rows
+
+    manifests = load_shard_manifests(shard_files)
+    rows = []
+    for manifest in manifests:
+        shard_rows = read_tidy_rows(manifest["path"], format)
+        if len(shard_rows) != manifest["n_rows"]:
+            raise ValueError(f"{manifest['path']} holds {len(shard_rows)} rows, its manifest expects "
+                             f"{manifest['n_rows']}; the output is incomplete.")
+        positions = {(subject, tract_path): position for subject, tract_path, position in manifest["jobs"]}
+        rows.extend((positions[(row["subject"], row["tract_path"])], row) for row in shard_rows)
+
+    # A stable sort keeps the metric order within each job
+    rows = [row for _, row in sorted(rows, key=lambda item: item[0])]
+    split = manifests[0]["file_paths"]
+    file_paths = pd.DataFrame(split["data"], index=split["index"], columns=split["columns"])
+    errors = [tuple(error) for manifest in manifests for error in manifest["errors"]]
+    return rows, file_paths, errors
@@ -0,0 +1,209 @@
+import numpy as np
+from nibabel.streamlines.array_sequence import ArraySequence
+from nibabel.streamlines.tck import TckFile
+from tract_analysis.calculations import flatten_streamlines, streamline_lengths, streamline_spans, \
+    calculate_tract_statistics_from_summary, calculate_end_statistics
+from tract_analysis.profiling import profiled
+from tract_analysis.reference_registry import get_reference
+from tract_analysis.streamline_cache import load_cached_streamlines
+from tract_analysis.tractogram_processing import cluster_endpoint_array, determine_surface_end
+from tract_analysis.utils import sparse_track_density, merge_sparse_density, VoxelGrid
+
+
+def make_array_sequence(data, lengths):
+    """
+    Wrap a packed point buffer as an ArraySequence without copying it.
+
+    Parameters:
+        data (ndarray): (n_points, 3) array of all points.
+        lengths (ndarray): Number of points of each streamline.
+
+    Returns:
+        streamlines (ArraySequence): Streamlines viewing ``data``.
+    """
+    lengths = np.asarray(lengths, dtype=np.intp)
+    streamlines = ArraySequence()
+    streamlines._data = data
+    streamlines._lengths = lengths
+    streamlines._offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.intp)[:len(lengths)]
+    return streamlines
+
+
+def iter_tck_chunks(tract_path, chunk_size=100000, buffer_points=1000000):
+    """
+    Read a .tck file as successive chunks of at most ``chunk_size`` streamlines.
+
+    The binary payload is read ``buffer_points`` points at a time and split on
+    the NaN delimiters with array operations, so peak memory depends on the
+    chunk and buffer sizes rather than on the size of the file.
+
+    Parameters:
+        tract_path (str): Path to the .tck file.
+        chunk_size (int): Maximum number of streamlines per chunk.
+        buffer_points (int): Number of points read from disk at a time.
+
+    Yields:
+        streamlines (ArraySequence): Streamlines in world (RAS+ mm) coordinates.
+    """
+    header = TckFile._read_header(tract_path)
+    dtype = header["_dtype"]
+
+    pending_data, pending_lengths = [], []
+    pending_count = 0
+    partial = np.empty((0, 3), dtype=np.float32)
+
+    with open(tract_path, "rb") as f:
+        f.seek(header["_offset_data"])
+        finished = False
+        while not finished:
+            raw = np.fromfile(f, dtype=dtype, count=3 * buffer_points)
+            finished = len(raw) < 3 * buffer_points
+            points = np.concatenate((partial, raw[:len(raw) - len(raw) % 3].reshape(-1, 3).astype(np.float32)))
+
+            # An Inf triplet marks the end of the data
+            end = np.flatnonzero(np.isinf(points[:, 0]))
+            if len(end):
+                points = points[:end[0]]
+                finished = True
+
+            delimiters = np.flatnonzero(np.isnan(points[:, 0]))
+            if len(delimiters):
+                lengths = np.diff(np.concatenate(([-1], delimiters))) - 1
+                keep = np.ones(delimiters[-1], dtype=bool)
+                keep[delimiters[:-1]] = False
+                pending_data.append(points[:delimiters[-1]][keep])
+                pending_lengths.append(lengths)
+                pending_count += len(lengths)
+                partial = points[delimiters[-1] + 1:]
+            else:
+                partial = points
+
+            while pending_count >= chunk_size or (finished and pending_count):
+                data = np.concatenate(pending_data)
+                lengths = np.concatenate(pending_lengths)
+                n_points = int(lengths[:chunk_size].sum())
+                yield make_array_sequence(data[:n_points], lengths[:chunk_size])
+                pending_data, pending_lengths = [data[n_points:]], [lengths[chunk_size:]]
+                pending_count = len(pending_lengths[0])
+
+
+def iter_streamline_chunks(streamlines, chunk_size=100000):
+    """
+    Split packed streamlines into successive chunks of at most ``chunk_size`` streamlines, as views.
+
+    Parameters:
+        streamlines (ArraySequence): Packed streamlines, e.g. memory-mapped from a streamline cache.
+        chunk_size (int): Maximum number of streamlines per chunk.
+
+    Yields:
+        streamlines (ArraySequence): Streamlines viewing the buffer of ``streamlines``.
+    """
+    data, lengths = streamlines._data, np.asarray(streamlines._lengths, dtype=np.intp)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    for first in range(0, len(lengths), chunk_size):
+        last = min(first + chunk_size, len(lengths))
+        yield make_array_sequence(data[offsets[first]:offsets[last]], lengths[first:last])
+
+
+class StreamingTractAccumulator:
+    """
+    Running accumulators for the tract statistics of a tractogram read in chunks.
+
+    Only per-chunk arrays, the endpoints (two points per streamline) and the
+    sparse density of the occupied voxels are held in memory.
+
+    Parameters:
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+    """
+
+    def __init__(self, reference_image):
+        self.reference = get_reference(reference_image)
+        self.n_streamlines = 0
+        self.length_sum = 0.0
+        self.span_sum = 0.0
+        self.density = merge_sparse_density([])
+        self._first_points = []
+        self._last_points = []
+
+    def update(self, streamlines):
+        """
+        Add a chunk of streamlines to the accumulators.
+
+        Parameters:
+            streamlines (Streamlines): Chunk of streamlines in world (RAS+ mm) coordinates.
+        """
+        data, offsets, counts = flatten_streamlines(streamlines)
+        self.n_streamlines += len(counts)
+        self.length_sum += float(streamline_lengths(streamlines).sum())
+        self.span_sum += float(streamline_spans(streamlines).sum())
+        self._first_points.append(data[offsets].copy())
+        self._last_points.append(data[offsets + counts - 1].copy())
+        chunk_density = sparse_track_density(streamlines, self.reference.affine, self.reference.shape)
+        self.density = merge_sparse_density([self.density, chunk_density])
+
+    @property
+    def voxel_grid(self):
+        """Accumulated track density cropped to the bounding box of the bundle."""
+        return VoxelGrid.from_sparse(*self.density, self.reference.shape)
+
+    @property
+    def endpoints(self):
+        """(first, last) points of every streamline seen so far."""
+        return np.concatenate(self._first_points), np.concatenate(self._last_points)
+
+    def surface_endpoints(self):
+        """
+        Cluster the collected endpoints into the two surface ends.
+
+        Returns:
+            E1 (ndarray): First set of endpoints.
+            E2 (ndarray): Second set of endpoints.
+        """
+        first, last = self.endpoints
+        E1, E2 = cluster_endpoint_array(np.vstack((first, last)))
+        return determine_surface_end(E1, E2)
+
+    def tract_statistics(self):
+        """
+        Calculate the tract statistics from the accumulated values.
+
+        Returns:
+            tract_stats (dict): Dictionary containing the computed statistics.
+        """
+        if self.n_streamlines == 0:
+            raise ValueError("No streamlines were accumulated.")
+        grid = self.voxel_grid
+        tract_stats = calculate_tract_statistics_from_summary(self.length_sum / self.n_streamlines,
+                                                              self.span_sum / self.n_streamlines,
+                                                              self.reference.zooms, grid.voxel_count, grid.data)
+        E1, E2 = self.surface_endpoints()
+        end_voxel_counts = (grid.count_point_voxels(E1, self.reference.affine),
+                            grid.count_point_voxels(E2, self.reference.affine))
+        tract_stats.update(calculate_end_statistics(E1, E2, end_voxel_counts, self.reference.zooms))
+        return tract_stats
+
+
+@profiled("stream_tract_statistics")
+def stream_tract_statistics(tract_path, reference_image, chunk_size=100000):
+    """
+    Calculate the tract statistics of a .tck file with memory bounded by the chunk size.
+
+    An up-to-date streamline cache of the file is read chunk by chunk from its
+    memory map instead of parsing the file.
+
+    Parameters:
+        tract_path (str): Path to the .tck file.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+        chunk_size (int): Number of streamlines read and processed at a time.
+
+    Returns:
+        tract_stats (dict): Dictionary containing the computed statistics.
+        accumulator (StreamingTractAccumulator): Accumulator holding the endpoints and density.
+    """
+    reference = get_reference(reference_image)
+    accumulator = StreamingTractAccumulator(reference)
+    cached = load_cached_streamlines(tract_path, reference)
+    chunks = iter_tck_chunks(tract_path, chunk_size) if cached is None else iter_streamline_chunks(cached, chunk_size)
+    for streamlines in chunks:
+        accumulator.update(streamlines)
+    return accumulator.tract_statistics(), accumulator
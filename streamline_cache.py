@@ -0,0 +1,175 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+SIDECAR_DIRNAME = ".streamline_cache"
+SIDECAR_VERSION = 1
+
+# Set by configure_streamline_cache(); passed on to worker processes, see data_aggregation._init_worker
+_cache_dir = None
+_write = False
+
+
+def configure_streamline_cache(cache_dir=None, write=True):
+    """
+    Set where load_tractogram_file looks for streamline caches and whether it writes missing ones.
+
+    Parameters:
+        cache_dir (str): Directory holding the caches of all files; by default each cache is kept in a
+            ".streamline_cache" directory next to its tractography file.
+        write (bool): Convert every tractography file loaded without an up-to-date cache.
+    """
+    global _cache_dir, _write
+    _cache_dir = cache_dir
+    _write = write
+
+
+def streamline_cache_settings():
+    """
+    Get the settings of configure_streamline_cache.
+
+    Returns:
+        cache_dir (str or None): Directory holding the caches of all files, None for per-file caches.
+        write (bool): Whether missing caches are written.
+    """
+    return _cache_dir, _write
+
+
+def streamline_cache_paths(tract_path, cache_dir=None):
+    """
+    Get the paths of the sidecar files caching the streamlines of a tractography file.
+
+    Parameters:
+        tract_path (str): Path to the tractography file.
+        cache_dir (str): Directory holding the caches; next to the file if None.
+
+    Returns:
+        paths (dict): "points", "offsets" and "meta" -> path.
+    """
+    tract_path = os.path.abspath(tract_path)
+    if cache_dir is None:
+        prefix = os.path.join(os.path.dirname(tract_path), SIDECAR_DIRNAME, os.path.basename(tract_path))
+    else:
+        # Files of different subjects share their names, so the cache is keyed by the full path
+        digest = hashlib.sha1(tract_path.encode()).hexdigest()[:16]
+        prefix = os.path.join(cache_dir, f"{digest}_{os.path.basename(tract_path)}")
+    return {"points": prefix + ".points.npy", "offsets": prefix + ".offsets.npy", "meta": prefix + ".json"}
+
+
+def _source_meta(tract_path, reference):
+    stat = os.stat(tract_path)
+    return {"version": SIDECAR_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "affine": np.asarray(reference.space_attributes[0], dtype=float).tolist(),
+            "shape": [int(n) for n in reference.shape[:3]]}
+
+
+def _save_npy(path, array):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def write_streamline_cache(tract_path, streamlines, reference, cache_dir=None):
+    """
+    Save the streamlines of a tractography file as a float32 points array and int64 offsets (.npy).
+
+    The metadata file is removed first and renamed into place last, so an
+    interrupted conversion never leaves a cache that looks up to date.
+
+    Parameters:
+        tract_path (str): Path to the tractography file.
+        streamlines (Streamlines): Streamlines of the file in world (RAS+ mm) coordinates.
+        reference (ReferenceImage): Reference the file was loaded with.
+        cache_dir (str): Directory holding the caches; next to the file if None.
+    """
+    from tract_analysis.calculations import flatten_streamlines
+
+    paths = streamline_cache_paths(tract_path, cache_dir)
+    os.makedirs(os.path.dirname(paths["meta"]), exist_ok=True)
+    meta = _source_meta(tract_path, reference)
+    try:
+        os.remove(paths["meta"])
+    except FileNotFoundError:
+        pass
+
+    data, _, lengths = flatten_streamlines(streamlines)
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+    _save_npy(paths["points"], np.ascontiguousarray(data, dtype=np.float32))
+    _save_npy(paths["offsets"], offsets)
+    meta["n_streamlines"] = len(lengths)
+    meta["n_points"] = int(offsets[-1])
+
+    tmp_path = f"{paths['meta']}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, paths["meta"])
+
+
+def read_streamline_cache(tract_path, reference, cache_dir=None):
+    """
+    Open the streamline cache of a tractography file if it is up to date.
+
+    The points are memory-mapped read-only and wrapped as an ArraySequence
+    without copying, so repeated runs and worker processes share the pages
+    of the OS file cache instead of parsing the file again.
+
+    Parameters:
+        tract_path (str): Path to the tractography file.
+        reference (ReferenceImage): Reference the file is loaded with.
+        cache_dir (str): Directory holding the caches; next to the file if None.
+
+    Returns:
+        streamlines (ArraySequence or None): Memory-mapped streamlines, or None if there is no cache or it
+            is out of date.
+    """
+    from tract_analysis.streaming import make_array_sequence
+
+    paths = streamline_cache_paths(tract_path, cache_dir)
+    try:
+        with open(paths["meta"]) as f:
+            meta = json.load(f)
+        source = _source_meta(tract_path, reference)
+        if any(meta.get(key) != value for key, value in source.items()):
+            return None
+        points = np.load(paths["points"], mmap_mode="r")
+        offsets = np.load(paths["offsets"])
+    except (OSError, ValueError):
+        return None
+    if points.shape != (meta["n_points"], 3) or len(offsets) != meta["n_streamlines"] + 1 \
+            or offsets[-1] != meta["n_points"]:
+        return None
+    return make_array_sequence(points, np.diff(offsets))
+
+
+def load_cached_streamlines(tract_path, reference):
+    """
+    Open the streamline cache of a file with the configured settings, see configure_streamline_cache.
+
+    Parameters:
+        tract_path (str): Path to the tractography file.
+        reference (ReferenceImage): Reference the file is loaded with.
+
+    Returns:
+        streamlines (ArraySequence or None): Memory-mapped streamlines, or None if there is no
+            up-to-date cache.
+    """
+    return read_streamline_cache(tract_path, reference, _cache_dir)
+
+
+def store_cached_streamlines(tract_path, streamlines, reference):
+    """
+    Convert a freshly loaded file into a streamline cache if writing caches is configured.
+
+    Parameters:
+        tract_path (str): Path to the tractography file.
+        streamlines (Streamlines): Streamlines of the file in world (RAS+ mm) coordinates.
+        reference (ReferenceImage): Reference the file was loaded with.
+    """
+    if not _write:
+        return
+    try:
+        write_streamline_cache(tract_path, streamlines, reference, _cache_dir)
+    except OSError:
+        pass  # A read-only data directory only loses the speed-up
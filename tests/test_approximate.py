@@ -0,0 +1,96 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from tract_analysis.approximate import subsample_size, subsample_streamlines, accumulation_estimate, \
+    approximate_tract_statistics
+from tract_analysis.benchmarks.synthetic import synthetic_bundle, write_reference
+from tract_analysis.data_aggregation import aggregate_results_to_dataframe
+from tract_analysis.streaming import make_array_sequence
+from tract_analysis.tract_context import TractContext
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+# Largest relative error accepted with a 20% sample: means are sample means, the volume is
+# extrapolated and the surface area is taken from the sample (see approximate_tract_statistics)
+MEAN_ERROR = 0.01
+VOXEL_ERROR = 0.15
+
+
+class TestApproximate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.reference_image = os.path.join(cls.directory, "reference.nii.gz")
+        write_reference(cls.reference_image)
+        data, lengths, _ = synthetic_bundle(4000, 50, "arc", seed=3)
+        cls.streamlines = make_array_sequence(data, lengths)
+
+        context = TractContext(None, cls.reference_image, tractogram=mock_tractogram(cls.streamlines))
+        cls.exact = context.tract_statistics()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_sample_size(self):
+        self.assertEqual(subsample_size(1000, 0.1), 100)
+        self.assertEqual(subsample_size(1000, 250), 250)
+        self.assertEqual(subsample_size(100, 5000), 100)
+        self.assertEqual(subsample_size(10, 0.01), 2)
+        with self.assertRaises(ValueError):
+            subsample_size(10, 0)
+
+    def test_subsample_is_reproducible(self):
+        sample, indices = subsample_streamlines(self.streamlines, 300)
+        again, same_indices = subsample_streamlines(self.streamlines, 300)
+        np.testing.assert_array_equal(indices, same_indices)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        np.testing.assert_array_equal(sample[5], self.streamlines[indices[5]])
+        np.testing.assert_array_equal(sample.get_data(), again.get_data())
+
+    def test_accumulation_estimate(self):
+        # Voxel i is first covered by the streamline of rank i: the coverage grows linearly and is extrapolated
+        self.assertEqual(accumulation_estimate(np.arange(100), 100, 100), 100)
+        self.assertGreater(accumulation_estimate(np.arange(100), 100, 1000), 100)
+        # All voxels covered by the first streamline: nothing left to discover
+        self.assertEqual(accumulation_estimate(np.zeros(50, dtype=np.intp), 100, 1000), 50)
+
+    def test_error_against_exact(self):
+        estimate = approximate_tract_statistics(self.streamlines, self.reference_image, 0.2)
+        self.assertEqual(estimate["Sampled Streamlines"], 800)
+        self.assertEqual(estimate, approximate_tract_statistics(self.streamlines, self.reference_image, 0.2))
+
+        for stat_name, exact_value in self.exact.items():
+            error = abs(estimate[stat_name] / exact_value - 1)
+            tolerance = MEAN_ERROR if stat_name in ("Mean Length", "Mean Span", "Curl") or \
+                stat_name.startswith("End") else VOXEL_ERROR
+            self.assertLess(error, tolerance, stat_name)
+            self.assertLessEqual(estimate[f"{stat_name} CI Low"], estimate[stat_name])
+            self.assertGreaterEqual(estimate[f"{stat_name} CI High"], estimate[stat_name])
+        for stat_name in ("Mean Length", "Mean Span", "Total Volume"):
+            self.assertTrue(estimate[f"{stat_name} CI Low"] <= self.exact[stat_name] <= estimate[f"{stat_name} CI High"],
+                            stat_name)
+
+    def test_aggregator_exports_intervals(self):
+        root_directory = os.path.join(self.directory, "cohort")
+        os.makedirs(root_directory)
+        file_paths = ["AF_L.tck", "AF_R.tck"]
+        reference_image = make_cohort(root_directory, ["sub-01", "sub-02"], file_paths)
+
+        dfs = aggregate_results_to_dataframe(root_directory, file_paths, reference_image, approximate=10,
+                                             stream_chunk_size=7)
+        for stat_name in ("Mean Length", "Mean Length CI Low", "Mean Length CI High", "Sampled Streamlines"):
+            self.assertEqual(dfs[stat_name].shape, (2, 2), stat_name)
+        self.assertTrue((dfs["Sampled Streamlines"] == 10).all().all())
+        self.assertTrue((dfs["Mean Length CI Low"] <= dfs["Mean Length CI High"]).all().all())
+
+
+def mock_tractogram(streamlines):
+    # Minimal stand-in for a loaded StatefulTractogram, which TractContext only reads the streamlines of
+    return type("Tractogram", (), {"streamlines": streamlines})()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@ import unittest
 import numpy as np
 from tract_analysis.calculations import calculate_length, calculate_span, calculate_curl, calculate_surface_volume, \
     calculate_surface_area, calculate_end_surface_area, calculate_radius, calculate_irregularity, calculate_diameter, \
-    calculate_elongation, calculate_tract_statistics
+    calculate_elongation, calculate_tract_statistics, streamline_lengths, streamline_spans, calculate_end_radius, \
+    calculate_end_statistics
+from dipy.tracking.streamline import Streamlines
 
 
 class TestCalculations(unittest.TestCase):
@@ -21,6 +23,23 @@ class TestCalculations(unittest.TestCase):
     def test_calculate_span(self):
         self.assertEqual(self.spans, [np.sqrt(12), np.sqrt(4)])
 
+    def test_streamline_lengths_and_spans_match_per_streamline(self):
+        rng = np.random.default_rng(0)
+        streamlines = Streamlines([rng.random((n, 3)).astype(np.float32) * 50 for n in (2, 1, 17, 5, 40)])
+        expected_lengths = [np.sum(np.linalg.norm(np.diff(s, axis=0), axis=1)) for s in streamlines]
+        expected_spans = [np.linalg.norm(s[0] - s[-1]) for s in streamlines]
+        np.testing.assert_allclose(streamline_lengths(streamlines), expected_lengths, rtol=1e-5)
+        np.testing.assert_allclose(streamline_spans(streamlines), expected_spans, rtol=1e-5)
+
+        # Sliced views reference the parent buffer with non-contiguous offsets
+        view = streamlines[[4, 0, 2]]
+        np.testing.assert_allclose(streamline_lengths(view), [expected_lengths[i] for i in (4, 0, 2)], rtol=1e-5)
+        np.testing.assert_allclose(streamline_spans(view), [expected_spans[i] for i in (4, 0, 2)], rtol=1e-5)
+
+    def test_streamline_lengths_returns_array(self):
+        self.assertIsInstance(streamline_lengths(self.streamlines), np.ndarray)
+        self.assertIsInstance(streamline_spans(self.streamlines), np.ndarray)
+
     def test_calculate_curl(self):
         curl = calculate_curl(self.lengths, self.spans)
         self.assertTrue(isinstance(curl, float))
@@ -45,6 +64,17 @@ class TestCalculations(unittest.TestCase):
         irregularity = calculate_irregularity(1.0, 1.0)
         self.assertEqual(irregularity, np.pi)
 
+    def test_calculate_end_statistics(self):
+        angles = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+        E1 = np.column_stack((np.zeros(8), 2 * np.cos(angles), 2 * np.sin(angles)))
+        self.assertAlmostEqual(calculate_end_radius(E1), 3.0)
+
+        end_stats = calculate_end_statistics(E1, E1 + [40, 0, 0], (12, 0), (2.0, 2.0, 2.0))
+        self.assertEqual(end_stats["End Surface Area 1"], 48.0)
+        self.assertAlmostEqual(end_stats["End Irregularity 1"], np.pi * 9 / 48)
+        self.assertAlmostEqual(end_stats["End Radius 2"], 3.0)
+        self.assertTrue(np.isnan(end_stats["End Irregularity 2"]))
+
     def test_calculate_diameter(self):
         diameter = calculate_diameter(4.0, np.mean(self.lengths))
         self.assertTrue(isinstance(diameter, float))
@@ -0,0 +1,128 @@
+import unittest
+import os
+import socket
+import shutil
+import tempfile
+import threading
+from tract_analysis.daemon import TractDaemon, DaemonClient, is_daemon_running, subject_of
+from tract_analysis.data_aggregation import process_tract_file
+from tract_analysis.result_cache import ResultCache
+from tract_analysis.tests.test_data_aggregation import make_cohort
+from tract_analysis.tests.test_imports import run_python, HEAVY_MODULES
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.root_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root_directory)
+        self.reference_image = make_cohort(self.root_directory, ["sub-01", "sub-02"], ["AF_L.tck", "AF_R.tck"])
+        self.socket_path = os.path.join(self.root_directory, "daemon.sock")
+
+    def start(self, cache=None):
+        daemon = TractDaemon(self.socket_path, cache, self.reference_image)
+        thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+        thread.start()
+        for _ in range(500):
+            if is_daemon_running(self.socket_path):
+                break
+            thread.join(0.01)
+
+        def stop():
+            daemon.shutdown()
+            thread.join(10)
+        self.addCleanup(stop)
+        return daemon
+
+    def tract_path(self, subject, name):
+        return os.path.join(self.root_directory, subject, "tracts", name)
+
+    def test_results_match_batch_run(self):
+        self.start()
+        with DaemonClient(self.socket_path) as client:
+            for subject in ("sub-01", "sub-02"):
+                for name in ("AF_L.tck", "AF_R.tck"):
+                    tract_path = self.tract_path(subject, name)
+                    result = client.process(tract_path, self.reference_image, subject)
+                    expected = process_tract_file((subject, tract_path, self.reference_image,
+                                                   {"stream_chunk_size": None}))
+                    self.assertEqual(result[:2], (subject, tract_path))
+                    self.assertIsNone(result[3])
+                    self.assertEqual(result[2], expected[2])
+
+            status = client.status()
+            self.assertEqual(status["jobs"], 4)
+            self.assertEqual(status["references"], 1)
+
+    def test_options_and_errors(self):
+        self.start()
+        tract_path = self.tract_path("sub-01", "AF_L.tck")
+        with DaemonClient(self.socket_path) as client:
+            _, _, tract_stats, error = client.process(tract_path, self.reference_image,
+                                                      options={"profile_segments": 4, "precision": "float64"})
+            self.assertIsNone(error)
+            self.assertIn("Diameter Profile 04", tract_stats)
+
+            _, _, tract_stats, error = client.process(tract_path + ".missing", self.reference_image)
+            self.assertIsNone(tract_stats)
+            self.assertIsNotNone(error)
+            _, _, _, error = client.process(tract_path, self.reference_image, options={"precision": "float16"})
+            self.assertIn("Unknown precision", error)
+
+            # The connection stays usable after failed jobs and bad requests
+            self.assertIn("Unknown command", client.request({"command": "nothing"})["error"])
+            self.assertEqual(client.status()["jobs"], 3)
+
+    def test_result_cache(self):
+        cache = ResultCache(os.path.join(self.root_directory, "cache"))
+        self.start(cache)
+        tract_path = self.tract_path("sub-02", "AF_R.tck")
+        with DaemonClient(self.socket_path) as client:
+            first = client.process(tract_path, self.reference_image)
+            second = client.process(tract_path, self.reference_image)
+        self.assertEqual(first, second)
+        self.assertEqual(cache.hits, 1)
+
+    def test_stale_socket_and_shutdown(self):
+        # A socket file left by a daemon that died is replaced
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        daemon = self.start()
+        self.assertTrue(is_daemon_running(self.socket_path))
+        with self.assertRaises(RuntimeError):
+            TractDaemon(self.socket_path).serve_forever()
+
+        with DaemonClient(self.socket_path) as client:
+            client.shutdown()
+        for _ in range(500):
+            if not os.path.exists(self.socket_path):
+                break
+            threading.Event().wait(0.01)
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertFalse(is_daemon_running(self.socket_path))
+        self.assertEqual(daemon.n_jobs, 0)
+
+    def test_subject_of(self):
+        tract_path = self.tract_path("sub-01", "AF_L.tck")
+        self.assertEqual(subject_of(tract_path, self.root_directory), "sub-01")
+        self.assertEqual(subject_of(tract_path), "tracts")
+
+    def test_client_is_lightweight(self):
+        modules = run_python("import sys, json\n"
+                             "from tract_analysis.daemon import DaemonClient\n"
+                             "print(json.dumps(sorted(sys.modules)))")
+        self.assertFalse({name.split(".")[0] for name in modules} & set(HEAVY_MODULES))
+
+    def test_submit_command(self):
+        self.start()
+        tract_paths = [self.tract_path("sub-01", "AF_L.tck"), self.tract_path("sub-02", "AF_L.tck")]
+        argv = ["-s", self.socket_path, "-i", self.reference_image, "-r", self.root_directory] + tract_paths
+        output = run_python(f"from tract_analysis.daemon import submit\nsubmit({argv!r})")
+        self.assertEqual(output["subject_id"], "sub-02")
+        self.assertEqual(output["tract_path"], tract_paths[1])
+        self.assertGreater(output["stats"]["Mean Length"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,47 @@
 import unittest
 import os
-from tract_analysis.data_aggregation import aggregate_results_to_dataframe, save_to_excel
+import shutil
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+import nibabel as nib
+from nibabel.streamlines import Tractogram
+from unittest import mock
+from tract_analysis import data_aggregation
+from tract_analysis.data_aggregation import aggregate_results_to_dataframe, save_to_excel, run_jobs, write_results, \
+    worker_pool_options
+from tract_analysis.precision import get_precision, use_precision
+from tract_analysis.streamline_cache import configure_streamline_cache, streamline_cache_settings
+from tract_analysis.result_writers import CsvResultWriter
+from tract_analysis.result_cache import ResultCache
+from tract_analysis.tract_batch import TractBatch
+
+
+def make_bundle(n_streamlines, seed):
+    # Arc-shaped bundle inside a 40 mm cube
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, np.pi, 30)
+    streamlines = []
+    for _ in range(n_streamlines):
+        jitter = rng.normal(0, 1.0, 3)
+        points = np.column_stack((20 + 12 * np.cos(t), 20 + 12 * np.sin(t) - 6, np.full_like(t, 20))) + jitter
+        streamlines.append(points.astype(np.float32))
+    return streamlines
+
+
+def make_cohort(root_directory, subjects, file_names):
+    # Write a reference image and one small bundle per subject and file name
+    reference_image = os.path.join(root_directory, "reference.nii")
+    nib.save(nib.Nifti1Image(np.zeros((20, 20, 20), dtype=np.float32), np.diag([2.0, 2.0, 2.0, 1.0])),
+             reference_image)
+    for s, subject in enumerate(subjects):
+        subject_dir = os.path.join(root_directory, subject, "tracts")
+        os.makedirs(subject_dir)
+        for f, file_name in enumerate(file_names):
+            tractogram = Tractogram(make_bundle(20 + 5 * f, seed=10 * s + f), affine_to_rasmm=np.eye(4))
+            nib.streamlines.save(tractogram, os.path.join(subject_dir, file_name))
+    return reference_image
 
 
 class TestDataAggregation(unittest.TestCase):
@@ -45,5 +86,140 @@ class TestDataAggregation(unittest.TestCase):
         os.remove(output_file)
 
 
+class TestParallelAggregation(unittest.TestCase):
+
+    def setUp(self):
+        self.root_directory = tempfile.mkdtemp()
+        self.file_paths = ["AF_L.tck", "AF_R.tck"]
+        self.reference_image = make_cohort(self.root_directory, ["sub-01", "sub-02", "sub-03"], self.file_paths)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_directory)
+
+    def test_parallel_matches_serial(self):
+        serial = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image)
+        parallel = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image,
+                                                  workers=2, chunk_size=1)
+        self.assertIn("Mean Length", serial)
+        self.assertEqual(list(serial), list(parallel))
+        for stat_name in serial:
+            self.assertTrue(serial[stat_name].equals(parallel[stat_name]))
+
+    def test_per_subject_reference(self):
+        for subject in ["sub-01", "sub-02", "sub-03"]:
+            shutil.copy(self.reference_image, os.path.join(self.root_directory, subject, f"{subject}_T1w.nii"))
+        shared = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image)
+        per_subject = aggregate_results_to_dataframe(self.root_directory, self.file_paths,
+                                                     reference_pattern="*_T1w.nii")
+        self.assertTrue(shared["Total Volume"].equals(per_subject["Total Volume"]))
+
+    def test_pattern_columns(self):
+        explicit = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image)
+        pattern = aggregate_results_to_dataframe(self.root_directory, ["AF_*.tck"], self.reference_image)
+        self.assertEqual(list(pattern["Mean Length"].columns), self.file_paths)
+        self.assertTrue(explicit["Mean Length"].equals(pattern["Mean Length"]))
+
+        # A copy of a tract elsewhere in the subject leaves that tract out for the subject
+        duplicate = os.path.join(self.root_directory, "sub-01", "old", "AF_R.tck")
+        os.makedirs(os.path.dirname(duplicate))
+        shutil.copy(os.path.join(self.root_directory, "sub-01", "tracts", "AF_R.tck"), duplicate)
+        dfs = aggregate_results_to_dataframe(self.root_directory, ["AF_*.tck"], self.reference_image)
+        self.assertTrue(pd.isna(dfs["Mean Length"].loc["sub-01", "AF_R.tck"]))
+        self.assertFalse(pd.isna(dfs["Mean Length"].loc["sub-02", "AF_R.tck"]))
+
+    def test_streaming_matches_in_memory(self):
+        in_memory = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image)
+        streamed = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image,
+                                                  stream_chunk_size=7)
+        for stat_name in in_memory:
+            if stat_name != "file_paths":
+                np.testing.assert_allclose(streamed[stat_name].values.astype(float),
+                                           in_memory[stat_name].values.astype(float), rtol=1e-6)
+
+    def test_result_cache_skips_unchanged_files(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = ResultCache(cache_dir)
+        first = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image,
+                                               cache=cache)
+        self.assertEqual(cache.misses, 6)
+
+        with mock.patch.object(data_aggregation, "process_tract_file",
+                               wraps=data_aggregation.process_tract_file) as process:
+            second = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image,
+                                                    cache=cache)
+        self.assertEqual(process.call_count, 0)
+        self.assertEqual(cache.hits, 6)
+        for stat_name in first:
+            self.assertTrue(first[stat_name].equals(second[stat_name]))
+
+    def test_write_results_matches_aggregate(self):
+        dfs = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image)
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        output_file = os.path.join(output_dir, "results.csv")
+        with CsvResultWriter(output_file) as writer:
+            errors = write_results(self.root_directory, self.file_paths, writer, self.reference_image)
+        self.assertEqual(errors, [])
+
+        tidy = pd.read_csv(output_file)
+        self.assertEqual(len(tidy), 3 * len(self.file_paths) * (len(dfs) - 1))
+        for row in tidy.itertuples():
+            self.assertAlmostEqual(dfs[row.metric].loc[row.subject, row.tract], row.value)
+
+    def test_batched_matches_per_file(self):
+        per_file = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image)
+        batched = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image,
+                                                 workers=2, batch_tracts=True)
+        self.assertEqual(list(per_file), list(batched))
+        for stat_name in per_file:
+            if stat_name != "file_paths":
+                np.testing.assert_allclose(batched[stat_name].values.astype(float),
+                                           per_file[stat_name].values.astype(float), rtol=1e-12)
+
+    def test_batch_isolates_failed_files(self):
+        jobs = [("sub-01", os.path.join(self.root_directory, "sub-01", "tracts", name), self.reference_image,
+                 {"batch_tracts": True}) for name in ["AF_L.tck", "missing.tck", "AF_R.tck"]]
+        results = run_jobs(jobs)
+        self.assertEqual([tract_path for _, tract_path, _, _ in results], [job[1] for job in jobs])
+        self.assertIsNotNone(results[0][2])
+        self.assertIsNone(results[1][2])
+        self.assertIn("Traceback", results[1][3])
+        self.assertIsNotNone(results[2][2])
+
+    def test_batch_isolates_failed_statistics(self):
+        jobs = [("sub-01", os.path.join(self.root_directory, "sub-01", "tracts", name), self.reference_image,
+                 {"batch_tracts": True}) for name in self.file_paths]
+        tract_statistics_of = TractBatch.tract_statistics_of
+
+        def fail_first(batch, tract):
+            if tract == 0:
+                raise ValueError("no endpoints")
+            return tract_statistics_of(batch, tract)
+        with mock.patch.object(TractBatch, "tract_statistics_of", fail_first):
+            results = run_jobs(jobs)
+        self.assertIsNone(results[0][2])
+        self.assertIn("no endpoints", results[0][3])
+        self.assertEqual(results[1][2], run_jobs(jobs[1:])[0][2])
+
+    def test_spawned_workers_get_settings(self):
+        cache_dir = os.path.join(self.root_directory, "streamline_cache")
+        configure_streamline_cache(cache_dir, write=True)
+        self.addCleanup(configure_streamline_cache, None, False)
+        with use_precision("float32"):
+            options = worker_pool_options()
+        context = multiprocessing.get_context("spawn")
+        with data_aggregation.ProcessPoolExecutor(max_workers=1, mp_context=context, **options) as executor:
+            self.assertEqual(executor.submit(get_precision).result(), "float32")
+            self.assertEqual(executor.submit(streamline_cache_settings).result(), (cache_dir, True))
+
+    def test_run_jobs_captures_errors(self):
+        jobs = [("sub-01", os.path.join(self.root_directory, "missing.tck"), self.reference_image, {})]
+        subject_id, tract_path, tract_stats, error = run_jobs(jobs)[0]
+        self.assertEqual(subject_id, "sub-01")
+        self.assertIsNone(tract_stats)
+        self.assertIn("Traceback", error)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import os
+import shutil
+import tempfile
+from tract_analysis.file_discovery import scan_files, match_tract_files
+
+
+class TestFileDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for relative_path in ["tracts/AF_L.tck", "tracts/AF_R.tck", "tracts/old/AF_R.tck", "anat/T1w.nii",
+                              "tracts/CST_L.tck"]:
+            path = os.path.join(self.tmp_dir, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "a").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_scan_files(self):
+        index = scan_files(self.tmp_dir)
+        self.assertEqual(set(index), {"AF_L.tck", "AF_R.tck", "T1w.nii", "CST_L.tck"})
+        self.assertEqual(index["AF_R.tck"], sorted([os.path.join(self.tmp_dir, "tracts", "AF_R.tck"),
+                                                    os.path.join(self.tmp_dir, "tracts", "old", "AF_R.tck")]))
+
+    def test_match_tract_files(self):
+        index = scan_files(self.tmp_dir)
+        matches, missing, ambiguous = match_tract_files(index, ["AF_L.tck", "AF_R.tck", "UF_L.tck"])
+        self.assertEqual(matches["AF_L.tck"], os.path.join(self.tmp_dir, "tracts", "AF_L.tck"))
+        self.assertEqual(missing, ["UF_L.tck"])
+        self.assertEqual(list(ambiguous), ["AF_R.tck"])
+        # A name found at several paths is reported, not resolved to one of them
+        self.assertNotIn("AF_R.tck", matches)
+
+    def test_match_patterns(self):
+        index = scan_files(self.tmp_dir)
+        matches, missing, ambiguous = match_tract_files(index, ["CST_*.tck", r"re:AF_L\.tck", "re:UF_.*"])
+        self.assertEqual(matches, {"CST_L.tck": os.path.join(self.tmp_dir, "tracts", "CST_L.tck"),
+                                   "AF_L.tck": os.path.join(self.tmp_dir, "tracts", "AF_L.tck")})
+        self.assertEqual(missing, ["re:UF_.*"])
+        self.assertEqual(ambiguous, {})
+
+    def test_pattern_expands_to_every_match(self):
+        open(os.path.join(self.tmp_dir, "tracts", "CST_R.tck"), "a").close()
+        index = scan_files(self.tmp_dir)
+        matches, missing, ambiguous = match_tract_files(index, ["CST_*.tck", "AF_*.tck"])
+        self.assertEqual(list(matches), ["CST_L.tck", "CST_R.tck", "AF_L.tck"])
+        self.assertEqual(matches["CST_R.tck"], os.path.join(self.tmp_dir, "tracts", "CST_R.tck"))
+        self.assertEqual(missing, [])
+        self.assertEqual(list(ambiguous), ["AF_R.tck"])
+
+
+if __name__ == '__main__':
+    unittest.main()
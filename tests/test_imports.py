@@ -0,0 +1,64 @@
+import unittest
+import os
+import sys
+import json
+import subprocess
+import tract_analysis
+
+# Dependencies that must not be imported until a code path needs them
+HEAVY_MODULES = ("numpy", "scipy", "dipy", "sklearn", "pandas", "nibabel")
+
+# Generous wall-time budget of `import tract_analysis`; eager imports took over a second
+IMPORT_BUDGET = 0.5
+
+
+def run_python(code):
+    # Run code in a fresh interpreter that can import the package, returning its JSON output
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(tract_analysis.__file__))))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class TestImports(unittest.TestCase):
+
+    def test_package_import_is_lazy(self):
+        output = run_python(
+            "import sys, json, time\n"
+            "start = time.perf_counter()\n"
+            "import tract_analysis\n"
+            "elapsed = time.perf_counter() - start\n"
+            "print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))")
+        loaded = {name.split(".")[0] for name in output["modules"]}
+        self.assertFalse(loaded & set(HEAVY_MODULES))
+        self.assertEqual([name for name in output["modules"] if name.startswith("tract_analysis.")], [])
+        self.assertLess(output["elapsed"], IMPORT_BUDGET)
+
+    def test_cli_help_is_lazy(self):
+        output = run_python(
+            "import sys, json, runpy, contextlib, io\n"
+            "sys.argv = ['main', '--help']\n"
+            "with contextlib.redirect_stdout(io.StringIO()):\n"
+            "    try:\n"
+            "        runpy.run_module('tract_analysis.main', run_name='__main__')\n"
+            "    except SystemExit:\n"
+            "        pass\n"
+            "print(json.dumps(sorted(sys.modules)))")
+        loaded = {name.split(".")[0] for name in output}
+        self.assertFalse(loaded & {"scipy", "dipy", "sklearn", "pandas", "nibabel"})
+
+    def test_public_api_resolves(self):
+        self.assertEqual(set(tract_analysis.__all__), set(tract_analysis._EXPORTS))
+        for name in tract_analysis.__all__:
+            self.assertTrue(callable(getattr(tract_analysis, name)), name)
+        self.assertIn("TractContext", dir(tract_analysis))
+        with self.assertRaises(AttributeError):
+            tract_analysis.not_a_function
+
+    def test_star_import(self):
+        namespace = {}
+        exec("from tract_analysis import *", namespace)
+        self.assertTrue(set(tract_analysis.__all__) <= set(namespace))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from tract_analysis import data_aggregation
+from tract_analysis.data_aggregation import aggregate_results_to_dataframe, discover_jobs, iter_results
+from tract_analysis.job_journal import JobJournal
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+
+class TestJobJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.root_directory = tempfile.mkdtemp()
+        self.file_paths = ["AF_L.tck", "AF_R.tck"]
+        self.reference_image = make_cohort(self.root_directory, ["sub-01", "sub-02", "sub-03"], self.file_paths)
+        self.journal_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.journal_dir, "run.journal.jsonl")
+        self.tract_path = os.path.join(self.root_directory, "sub-01", "tracts", "AF_L.tck")
+        self.job = ("sub-01", self.tract_path, self.reference_image, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.root_directory)
+        shutil.rmtree(self.journal_dir)
+
+    def test_records_survive_truncated_line(self):
+        with JobJournal(self.journal_path) as journal:
+            journal.record(self.job, ("sub-01", self.tract_path, {"Curl": 2.5}, None))
+        with open(self.journal_path, "a") as f:
+            f.write('{"key": "interrupted')
+
+        # A record appended after the partial line survives later resumes
+        other_path = os.path.join(self.root_directory, "sub-02", "tracts", "AF_L.tck")
+        other_job = ("sub-02", other_path, self.reference_image, {})
+        with JobJournal(self.journal_path, resume=True) as journal:
+            self.assertEqual(journal.result(self.job), ("sub-01", self.tract_path, {"Curl": 2.5}, None))
+            journal.record(other_job, ("sub-02", other_path, {"Curl": 3.0}, None))
+        with JobJournal(self.journal_path, resume=True):
+            pass
+        with JobJournal(self.journal_path, resume=True) as journal:
+            self.assertEqual(journal.result(self.job), ("sub-01", self.tract_path, {"Curl": 2.5}, None))
+            self.assertEqual(journal.result(other_job), ("sub-02", other_path, {"Curl": 3.0}, None))
+        self.assertEqual(len(JobJournal.load(self.journal_path)), 2)
+        with JobJournal(self.journal_path) as journal:
+            self.assertIsNone(journal.result(self.job))
+        self.assertEqual(os.path.getsize(self.journal_path), 0)
+
+    def test_failed_jobs_are_retried(self):
+        with JobJournal(self.journal_path) as journal:
+            journal.record(self.job, ("sub-01", self.tract_path, None, "Traceback: boom"))
+        with JobJournal(self.journal_path, resume=True) as journal:
+            self.assertIsNone(journal.result(self.job))
+            self.assertEqual([record["error"] for record in journal.failed()], ["Traceback: boom"])
+        with JobJournal(self.journal_path, resume=True, retry_failed=False) as journal:
+            self.assertEqual(journal.result(self.job)[3], "Traceback: boom")
+
+    def test_changed_file_is_rerun(self):
+        with JobJournal(self.journal_path) as journal:
+            journal.record(self.job, ("sub-01", self.tract_path, {"Curl": 2.5}, None))
+        with open(self.tract_path, "ab") as f:
+            f.write(b"\0")
+        with JobJournal(self.journal_path, resume=True) as journal:
+            self.assertIsNone(journal.result(self.job))
+
+    def test_resume_after_interruption(self):
+        complete = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image)
+
+        # Interrupt a run after two jobs
+        _, jobs = discover_jobs(self.root_directory, self.file_paths, self.reference_image,
+                                options={"stream_chunk_size": None})
+        with JobJournal(self.journal_path) as journal:
+            results = iter_results(jobs, journal=journal)
+            next(results)
+            next(results)
+            results.close()
+
+        with mock.patch.object(data_aggregation, "process_tract_file",
+                               wraps=data_aggregation.process_tract_file) as process:
+            with JobJournal(self.journal_path, resume=True) as journal:
+                resumed = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image,
+                                                         journal=journal)
+        self.assertEqual(process.call_count, len(jobs) - 2)
+        self.assertEqual(list(complete), list(resumed))
+        for stat_name in complete:
+            self.assertTrue(complete[stat_name].equals(resumed[stat_name]), stat_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
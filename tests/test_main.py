@@ -1,11 +1,37 @@
-import unittest
-import subprocess
-
-class TestMain(unittest.TestCase):
-
-    def test_main_help(self):
-        result = subprocess.run(["python", "tract_analysis/main.py", "--help"], stdout=subprocess.PIPE)
-        self.assertIn(b"usage", result.stdout)
-
-if __name__ == '__main__':
-    unittest.main()
+import unittest
+import os
+import shutil
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from io import StringIO
+from tract_analysis.main import main
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+class TestMain(unittest.TestCase):
+
+    def test_main_help(self):
+        result = subprocess.run(["python", "tract_analysis/main.py", "--help"], stdout=subprocess.PIPE)
+        self.assertIn(b"usage", result.stdout)
+
+    def test_journal_is_opt_in(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        root_directory = os.path.join(directory, "root")
+        os.makedirs(root_directory)
+        reference_image = make_cohort(root_directory, ["sub-01"], ["AF_L.tck"])
+        output_file = os.path.join(directory, "out.csv")
+        argv = ["-r", root_directory, "-f", "AF_L.tck", "-i", reference_image, "-o", output_file]
+
+        with redirect_stdout(StringIO()):
+            main(argv)
+        self.assertTrue(os.path.isfile(output_file))
+        self.assertEqual(sorted(os.listdir(directory)), ["out.csv", "root"])
+
+        journal_path = os.path.join(directory, "run.jsonl")
+        with redirect_stdout(StringIO()):
+            main(argv + ["--journal", journal_path])
+        self.assertTrue(os.path.isfile(journal_path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import nibabel as nib
+from dipy.tracking.streamline import Streamlines
+from tract_analysis.calculations import streamline_lengths, streamline_spans
+from tract_analysis.data_aggregation import aggregate_results_to_dataframe
+from tract_analysis.precision import set_precision, get_precision, use_precision, compute_dtype
+from tract_analysis.tractogram_processing import two_means_labels
+from tract_analysis.utils import voxelise_streamlines, _streamline_samples
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+# Documented bound on the relative error of float32 lengths, spans and means
+RELATIVE_ERROR_BOUND = 1e-6
+
+
+class TestPrecision(unittest.TestCase):
+
+    def setUp(self):
+        # Long, dense streamlines far from the origin, the worst case for float32 coordinates
+        rng = np.random.default_rng(0)
+        steps = rng.normal(0, 0.5, (200, 500, 3))
+        self.streamlines = Streamlines([(900 + np.cumsum(s, axis=0)).astype(np.float32) for s in steps])
+
+        # Reference grid of 2 mm voxels covering the streamlines
+        self.directory = tempfile.mkdtemp()
+        self.reference_image = os.path.join(self.directory, "reference.nii")
+        affine = np.diag([2.0, 2.0, 2.0, 1.0])
+        affine[:3, 3] = 800
+        nib.save(nib.Nifti1Image(np.zeros((100, 100, 100), dtype=np.float32), affine), self.reference_image)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_select_precision(self):
+        self.assertEqual(get_precision(), "float64")
+        with use_precision("float32"):
+            self.assertEqual(compute_dtype(), np.float32)
+        self.assertEqual(compute_dtype(), np.float64)
+        with self.assertRaises(ValueError):
+            set_precision("float16")
+
+    def test_lengths_and_spans_within_error_bound(self):
+        exact_lengths = streamline_lengths(self.streamlines)
+        exact_spans = streamline_spans(self.streamlines)
+        with use_precision("float32"):
+            lengths = streamline_lengths(self.streamlines)
+            spans = streamline_spans(self.streamlines)
+
+        self.assertEqual(lengths.dtype, np.float64)
+        np.testing.assert_allclose(lengths, exact_lengths, rtol=RELATIVE_ERROR_BOUND)
+        np.testing.assert_allclose(spans, exact_spans, rtol=RELATIVE_ERROR_BOUND)
+        self.assertAlmostEqual(lengths.mean() / exact_lengths.mean(), 1, delta=RELATIVE_ERROR_BOUND)
+
+    def test_endpoint_clustering_agrees(self):
+        endpoints = np.concatenate([self.streamlines.get_data()[:100], self.streamlines.get_data()[-100:]])
+        with use_precision("float32"):
+            labels = two_means_labels(endpoints)
+        np.testing.assert_array_equal(labels, two_means_labels(endpoints))
+
+    def test_volumes_follow_policy(self):
+        exact_count, exact_voxels = voxelise_streamlines(self.streamlines, self.reference_image)
+        with use_precision("float32"):
+            count, voxels = voxelise_streamlines(self.streamlines, self.reference_image)
+        self.assertEqual(exact_voxels.dtype, np.float64)
+        self.assertEqual(voxels.dtype, np.float32)
+        self.assertEqual(count, exact_count)
+
+    def test_samples_follow_policy(self):
+        points = np.array([[0.2, 0.2, 0.2], [3.7, 1.1, 0.4]], dtype=np.float32)
+        offsets, counts = np.array([0]), np.array([2])
+        samples, _ = _streamline_samples(points, offsets, counts, 4)
+        self.assertEqual(samples.dtype, np.float64)
+        with use_precision("float32"):
+            samples32, _ = _streamline_samples(points, offsets, counts, 4)
+        self.assertEqual(samples32.dtype, np.float32)
+        np.testing.assert_allclose(samples32[0], samples[0], atol=1e-6)
+
+    def test_tract_statistics_agree(self):
+        root_directory = os.path.join(self.directory, "cohort")
+        os.makedirs(root_directory)
+        file_paths = ["AF_L.tck", "AF_R.tck"]
+        reference_image = make_cohort(root_directory, ["sub-01", "sub-02"], file_paths)
+
+        exact = aggregate_results_to_dataframe(root_directory, file_paths, reference_image)
+        single = aggregate_results_to_dataframe(root_directory, file_paths, reference_image, precision="float32")
+        self.assertEqual(get_precision(), "float64")
+        for stat_name in exact:
+            if stat_name == "file_paths":
+                continue
+            np.testing.assert_allclose(single[stat_name].to_numpy(float), exact[stat_name].to_numpy(float),
+                                       rtol=1e-5, err_msg=stat_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import threading
+from tract_analysis.data_aggregation import aggregate_results_to_dataframe, discover_jobs, iter_jobs
+from tract_analysis.prefetch import iter_prefetched
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_order_and_backpressure(self):
+        lock = threading.Lock()
+        held = {"now": 0, "max": 0}
+
+        def load(task):
+            time.sleep(0.001 * (task % 4))
+            with lock:
+                held["now"] += 1
+                held["max"] = max(held["max"], held["now"])
+            return task * 10
+
+        consumed = []
+        for task, loaded, error in iter_prefetched(range(30), load, threads=3, depth=4):
+            self.assertIsNone(error)
+            consumed.append(loaded)
+            time.sleep(0.002)
+            with lock:
+                held["now"] -= 1
+        self.assertEqual(consumed, [task * 10 for task in range(30)])
+        self.assertLessEqual(held["max"], 4)
+
+    def test_load_errors_are_yielded(self):
+        def load(task):
+            if task == 2:
+                raise OSError("unreadable")
+            return task
+
+        results = list(iter_prefetched(range(5), load, threads=2))
+        self.assertEqual([loaded for _, loaded, _ in results], [0, 1, None, 3, 4])
+        self.assertIn("OSError: unreadable", results[2][2])
+
+    def test_early_stop_cancels_pending_loads(self):
+        loaded = []
+        results = iter_prefetched(range(100), lambda task: loaded.append(task) or task, threads=1, depth=3)
+        next(results)
+        results.close()
+        self.assertLessEqual(len(loaded), 4)
+
+    def test_loading_overlaps_processing(self):
+        loaded = [threading.Event() for _ in range(6)]
+
+        def load(task):
+            loaded[task].set()
+            return task
+
+        for task, _, _ in iter_prefetched(range(6), load, threads=1):
+            # The next task loads while this one is still being processed
+            if task + 1 < len(loaded):
+                self.assertTrue(loaded[task + 1].wait(10), task)
+
+    def test_prefetched_jobs_match_serial(self):
+        root_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root_directory)
+        file_paths = ["AF_L.tck", "AF_R.tck", "CST_L.tck"]
+        reference_image = make_cohort(root_directory, ["sub-01", "sub-02", "sub-03"], file_paths)
+        broken_path = os.path.join(root_directory, "sub-02", "tracts", "AF_R.tck")
+        with open(broken_path, "w") as f:
+            f.write("not a tractogram")
+
+        serial = aggregate_results_to_dataframe(root_directory, file_paths, reference_image)
+        prefetched = aggregate_results_to_dataframe(root_directory, file_paths, reference_image, prefetch=2)
+        self.assertEqual(list(serial), list(prefetched))
+        for stat_name in serial:
+            self.assertTrue(serial[stat_name].equals(prefetched[stat_name]), stat_name)
+
+        _, jobs = discover_jobs(root_directory, file_paths, reference_image, options={"stream_chunk_size": 7})
+        results = list(iter_jobs(jobs, prefetch=2, prefetch_depth=2))
+        self.assertEqual([result[:2] for result in results], [job[:2] for job in jobs])
+        self.assertEqual([error is not None for *_, error in results], [job[1] == broken_path for job in jobs])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from tract_analysis import profiling
+from tract_analysis.profiling import Profiler, stage, profiled, active_profiler
+from tract_analysis.data_aggregation import run_jobs
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.root_directory = tempfile.mkdtemp()
+        self.reference_image = make_cohort(self.root_directory, ["subject1", "subject2"], ["AF_L.tck"])
+        self.jobs = [(subject, os.path.join(self.root_directory, subject, "tracts", "AF_L.tck"),
+                      self.reference_image, {}) for subject in ["subject1", "subject2"]]
+
+    def tearDown(self):
+        shutil.rmtree(self.root_directory)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(active_profiler())
+        self.assertIs(stage("load"), profiling._NULL_STAGE)
+        self.assertEqual(profiled("double")(lambda x: 2 * x)(21), 42)
+
+    def test_records_stages_per_job(self):
+        with Profiler() as profiler:
+            self.assertIs(active_profiler(), profiler)
+            results = run_jobs(self.jobs)
+        self.assertIsNone(active_profiler())
+        self.assertTrue(all(error is None for *_, error in results))
+
+        names = {event["name"] for event in profiler.events}
+        self.assertTrue({"job", "load", "cluster_endpoints", "voxelise", "surface_area",
+                         "tract_statistics"} <= names)
+        jobs = [event for event in profiler.events if event["name"] == "job"]
+        self.assertEqual([event["subject"] for event in jobs], ["subject1", "subject2"])
+        for event in profiler.events:
+            self.assertEqual(event["tract"], "AF_L.tck")
+            self.assertGreaterEqual(event["wall"], 0)
+            self.assertGreaterEqual(event["cpu"], 0)
+
+        # Every stage lies within the wall time of its job
+        job_wall = {event["subject"]: event["wall"] for event in jobs}
+        for event in profiler.events:
+            self.assertLessEqual(event["wall"], job_wall[event["subject"]] + 1e-6)
+
+    def test_collects_worker_events(self):
+        with Profiler() as profiler:
+            run_jobs(self.jobs, workers=2, chunk_size=1)
+        jobs = [event for event in profiler.events if event["name"] == "job"]
+        self.assertEqual(sorted(event["subject"] for event in jobs), ["subject1", "subject2"])
+        self.assertNotIn(os.getpid(), {event["pid"] for event in jobs})
+
+    def test_exports(self):
+        with Profiler() as profiler:
+            run_jobs(self.jobs[:1])
+
+        jsonl_path = os.path.join(self.root_directory, "profile.jsonl")
+        profiler.write_jsonl(jsonl_path)
+        with open(jsonl_path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual(events, profiler.events)
+
+        trace_path = os.path.join(self.root_directory, "profile.trace.json")
+        profiler.write_chrome_trace(trace_path)
+        with open(trace_path) as f:
+            trace = json.load(f)
+        self.assertEqual(len(trace["traceEvents"]), len(profiler.events))
+        self.assertTrue(all(event["ph"] == "X" and event["dur"] >= 0 for event in trace["traceEvents"]))
+
+        summary = profiler.summary()
+        self.assertEqual(summary["job"]["count"], 1)
+        self.assertIn("load", profiler.format_summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import nibabel as nib
+from tract_analysis.reference_registry import ReferenceImage, ReferenceRegistry, get_reference
+
+
+class TestReferenceRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.default_image = os.path.join(self.tmp_dir, "template.nii")
+        nib.save(nib.Nifti1Image(np.zeros((10, 12, 14), dtype=np.float32), np.diag([2.0, 2.0, 2.0, 1.0])),
+                 self.default_image)
+
+        # Subject with its own reference in a nested directory, subject without one
+        self.subject_with_reference = os.path.join(self.tmp_dir, "sub-01")
+        os.makedirs(os.path.join(self.subject_with_reference, "anat"))
+        self.subject_image = os.path.join(self.subject_with_reference, "anat", "sub-01_T1w.nii")
+        nib.save(nib.Nifti1Image(np.zeros((5, 5, 5), dtype=np.float32), np.diag([1.25, 1.25, 1.25, 1.0])),
+                 self.subject_image)
+        self.subject_without_reference = os.path.join(self.tmp_dir, "sub-02")
+        os.makedirs(self.subject_without_reference)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_reference_image_attributes(self):
+        reference = ReferenceImage(self.default_image)
+        self.assertEqual(reference.shape, (10, 12, 14))
+        self.assertEqual(reference.zooms, (2.0, 2.0, 2.0))
+        np.testing.assert_array_equal(reference.affine, np.diag([2.0, 2.0, 2.0, 1.0]))
+        self.assertEqual(reference.space_attributes[3], "RAS")
+
+    def test_get_caches_headers(self):
+        registry = ReferenceRegistry()
+        self.assertIs(registry.get(self.default_image), registry.get(self.default_image))
+        self.assertEqual(len(registry), 1)
+
+    def test_get_reloads_replaced_file(self):
+        registry = ReferenceRegistry()
+        before = registry.get(self.default_image)
+        nib.save(nib.Nifti1Image(np.zeros((8, 8, 8), dtype=np.float32), np.diag([3.0, 3.0, 3.0, 1.0])),
+                 self.default_image)
+        after = registry.get(self.default_image)
+        self.assertIsNot(before, after)
+        self.assertEqual(after.shape, (8, 8, 8))
+        self.assertEqual(after.zooms, (3.0, 3.0, 3.0))
+        self.assertEqual(len(registry), 1)
+
+    def test_lru_eviction(self):
+        registry = ReferenceRegistry(max_size=1)
+        first = registry.get(self.default_image)
+        registry.get(self.subject_image)
+        self.assertEqual(len(registry), 1)
+        self.assertIsNot(registry.get(self.default_image), first)
+
+    def test_resolve_per_subject(self):
+        registry = ReferenceRegistry(pattern="*_T1w.nii", default=self.default_image)
+        self.assertEqual(registry.resolve(self.subject_with_reference).shape, (5, 5, 5))
+        self.assertEqual(registry.resolve(self.subject_without_reference).shape, (10, 12, 14))
+
+    def test_resolve_without_match_or_default(self):
+        registry = ReferenceRegistry(pattern="*_T1w.nii")
+        with self.assertRaises(FileNotFoundError):
+            registry.resolve(self.subject_without_reference)
+
+    def test_resolve_ambiguous(self):
+        shutil.copy(self.subject_image, os.path.join(self.subject_with_reference, "sub-01_run-2_T1w.nii"))
+        registry = ReferenceRegistry(pattern="*_T1w.nii")
+        with self.assertRaises(ValueError):
+            registry.resolve(self.subject_with_reference)
+
+    def test_get_reference(self):
+        reference = get_reference(self.default_image)
+        self.assertIs(get_reference(reference), reference)
+        self.assertIs(get_reference(self.default_image), reference)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import nibabel as nib
+from tract_analysis.result_cache import ResultCache, file_content_hash
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        self.reference_image = os.path.join(self.tmp_dir, "reference.nii")
+        nib.save(nib.Nifti1Image(np.zeros((4, 4, 4), dtype=np.float32), np.eye(4)), self.reference_image)
+        self.tract_path = os.path.join(self.tmp_dir, "tract.tck")
+        with open(self.tract_path, "wb") as f:
+            f.write(b"streamlines")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_put_get(self):
+        cache = ResultCache(self.cache_dir)
+        key = cache.key(self.tract_path, self.reference_image)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {"Mean Length": 1.5}, arrays={"lengths": np.array([1.0, 2.0])})
+        self.assertEqual(cache.get(key), {"Mean Length": 1.5})
+        np.testing.assert_array_equal(cache.get_arrays(key)["lengths"], [1.0, 2.0])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIn("1 hits, 1 misses", cache.report())
+
+    def test_key_changes_with_content_and_options(self):
+        cache = ResultCache(self.cache_dir)
+        key = cache.key(self.tract_path, self.reference_image)
+        self.assertNotEqual(key, cache.key(self.tract_path, self.reference_image, {"stream_chunk_size": 10}))
+        with open(self.tract_path, "ab") as f:
+            f.write(b"more")
+        self.assertNotEqual(key, cache.key(self.tract_path, self.reference_image))
+
+    def test_file_index_is_persisted(self):
+        cache = ResultCache(self.cache_dir)
+        digest = cache.file_hash(self.tract_path)
+        self.assertEqual(digest, file_content_hash(self.tract_path))
+        cache.save_index()
+        self.assertEqual(len(ResultCache(self.cache_dir)._file_index), 1)
+
+    def test_file_index_keeps_one_entry_per_path(self):
+        cache = ResultCache(self.cache_dir)
+        first = cache.file_hash(self.tract_path)
+        with open(self.tract_path, "ab") as f:
+            f.write(b"more")
+        self.assertNotEqual(cache.file_hash(self.tract_path), first)
+        self.assertEqual(len(cache._file_index), 1)
+
+        # Files that are gone leave the index on eviction
+        os.remove(self.tract_path)
+        cache.evict()
+        self.assertEqual(cache._file_index, {})
+        self.assertEqual(ResultCache(self.cache_dir)._file_index, {})
+
+    def test_evict(self):
+        cache = ResultCache(self.cache_dir)
+        for i in range(3):
+            cache.put(f"key{i}", {"value": i})
+        old = time.time() - 3600
+        os.utime(os.path.join(self.cache_dir, "entries", "key0.json"), (old, old))
+        self.assertEqual(cache.evict(max_age=60), 1)
+        self.assertIsNone(cache.get("key0"))
+        self.assertEqual(cache.evict(max_bytes=0), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
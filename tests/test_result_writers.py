@@ -0,0 +1,82 @@
+import unittest
+import importlib.util
+import os
+import shutil
+import tempfile
+import pandas as pd
+from tract_analysis.result_writers import tidy_rows, rows_to_dataframes, infer_format, get_result_writer, \
+    ResultWriter, CsvResultWriter, TIDY_COLUMNS
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+class TestResultWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rows = (tidy_rows("sub-01", "/data/sub-01/AF_L.tck", {"Mean Length": 80.0, "Curl": 1.2}, "/ref.nii")
+                     + tidy_rows("sub-02", "/data/sub-02/AF_L.tck", {"Mean Length": 85.0, "Curl": 1.3}, "/ref.nii"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_tidy_rows(self):
+        self.assertEqual(len(self.rows), 4)
+        self.assertEqual(set(self.rows[0]), set(TIDY_COLUMNS))
+        self.assertEqual(self.rows[0]["tract"], "AF_L.tck")
+
+    def test_rows_to_dataframes(self):
+        dfs = rows_to_dataframes(self.rows)
+        self.assertEqual(list(dfs), ["file_paths", "Mean Length", "Curl"])
+        self.assertEqual(dfs["Mean Length"].loc["sub-02", "AF_L.tck"], 85.0)
+
+    def test_infer_format(self):
+        self.assertEqual(infer_format("out.CSV"), "csv")
+        self.assertEqual(infer_format("out.parquet"), "parquet")
+        self.assertEqual(infer_format("out.xlsx"), "excel")
+        with self.assertRaises(ValueError):
+            infer_format("out.txt")
+
+    def test_incomplete_writer_cannot_be_created(self):
+        class NoWrite(ResultWriter):
+            pass
+        with self.assertRaises(TypeError):
+            NoWrite(os.path.join(self.tmp_dir, "results.out"))
+
+    def test_csv_writer_is_incremental(self):
+        output_file = os.path.join(self.tmp_dir, "results.csv")
+        with CsvResultWriter(output_file) as writer:
+            writer.write(self.rows[:2])
+            self.assertEqual(len(pd.read_csv(output_file)), 2)
+            writer.write(self.rows[2:])
+        df = pd.read_csv(output_file)
+        self.assertEqual(list(df.columns), TIDY_COLUMNS)
+        self.assertEqual(len(df), 4)
+
+    def _round_trip(self, extension, read):
+        output_file = os.path.join(self.tmp_dir, "results" + extension)
+        with get_result_writer(output_file) as writer:
+            writer.write(self.rows[:1])
+            writer.write(self.rows[1:])
+        df = read(output_file)
+        self.assertEqual(len(df), 4)
+        self.assertEqual(df["value"].tolist(), [row["value"] for row in self.rows])
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_parquet_writer(self):
+        self._round_trip(".parquet", pd.read_parquet)
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_feather_writer(self):
+        self._round_trip(".feather", pd.read_feather)
+
+    def test_excel_writer(self):
+        output_file = os.path.join(self.tmp_dir, "results.xlsx")
+        with get_result_writer(output_file) as writer:
+            writer.write(self.rows)
+        sheets = pd.read_excel(output_file, sheet_name=None, index_col=0)
+        self.assertEqual(list(sheets), ["file_paths", "Mean Length", "Curl"])
+
+
+if __name__ == '__main__':
+    unittest.main()
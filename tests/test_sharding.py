@@ -0,0 +1,123 @@
+import unittest
+import csv
+import math
+import os
+import shutil
+import tempfile
+from tract_analysis.data_aggregation import aggregate_results_to_dataframe, discover_jobs, write_results
+from tract_analysis.result_writers import CsvResultWriter, rows_to_dataframes
+from tract_analysis.sharding import parse_shard, assign_shards, shard_jobs, merge_shards
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+
+class TestSharding(unittest.TestCase):
+
+    def setUp(self):
+        self.root_directory = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+        self.file_paths = ["AF_L.tck", "AF_R.tck", "CST_L.tck"]
+        self.subjects = ["sub-01", "sub-02", "sub-03", "sub-04"]
+        self.reference_image = make_cohort(self.root_directory, self.subjects, self.file_paths)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_directory)
+        shutil.rmtree(self.output_dir)
+
+    def run_shards(self, count):
+        shard_files = []
+        for index in range(count):
+            shard_file = os.path.join(self.output_dir, f"shard_{index}.csv")
+            with CsvResultWriter(shard_file) as writer:
+                write_results(self.root_directory, self.file_paths, writer, self.reference_image,
+                              shard=(index, count))
+            shard_files.append(shard_file)
+        return shard_files
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("3/10"), (3, 10))
+        for text in ["10/10", "-1/4", "1", "a/b", "0/0"]:
+            with self.assertRaises(ValueError):
+                parse_shard(text)
+
+    def test_assignment_is_deterministic_and_balanced(self):
+        _, jobs = discover_jobs(self.root_directory, self.file_paths, self.reference_image)
+        shards = assign_shards(jobs, 3)
+        self.assertEqual(shards, assign_shards(list(jobs), 3))
+        self.assertEqual(sorted(job for index in range(3) for job in shard_jobs(jobs, index, 3)), sorted(jobs))
+
+        sizes = [os.path.getsize(job[1]) for job in jobs]
+        loads = [sum(size for size, shard in zip(sizes, shards) if shard == index) for index in range(3)]
+        self.assertLessEqual(max(loads) - min(loads), max(sizes))
+
+    def test_merge_matches_single_node(self):
+        single = aggregate_results_to_dataframe(self.root_directory, self.file_paths, self.reference_image)
+        rows, file_paths, errors = merge_shards(self.run_shards(3))
+        self.assertEqual(errors, [])
+
+        merged = rows_to_dataframes(rows)
+        merged["file_paths"] = file_paths
+        self.assertEqual(list(single), list(merged))
+        for stat_name in single:
+            self.assertTrue(single[stat_name].equals(merged[stat_name]), stat_name)
+
+    def test_merge_keeps_missing_values(self):
+        shard_files = self.run_shards(2)
+        # A metric that could not be computed is written as nan
+        with open(shard_files[0], newline="") as f:
+            rows = list(csv.DictReader(f))
+        rows[0]["value"] = "nan"
+        with open(shard_files[0], "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+        merged, _, _ = merge_shards(shard_files)
+        self.assertTrue(all(isinstance(row["value"], float) for row in merged))
+        missing = [row for row in merged if math.isnan(row["value"])]
+        self.assertEqual([(row["subject"], row["metric"]) for row in missing],
+                         [(rows[0]["subject"], rows[0]["metric"])])
+        dfs = rows_to_dataframes(merged)
+        self.assertTrue(dfs[rows[0]["metric"]].isna().values.any())
+
+    def test_missing_and_duplicate_shards(self):
+        shard_files = self.run_shards(3)
+        with self.assertRaisesRegex(ValueError, "Missing shards \\[1\\]"):
+            merge_shards([shard_files[0], shard_files[2]])
+        with self.assertRaisesRegex(ValueError, "Duplicate shards"):
+            merge_shards(shard_files + [shard_files[1]])
+
+        # A shard without its manifest did not finish
+        os.remove(shard_files[2] + ".shard.json")
+        with self.assertRaisesRegex(ValueError, "did not finish"):
+            merge_shards(shard_files)
+
+    def test_files_changed_between_shards(self):
+        _, jobs = discover_jobs(self.root_directory, self.file_paths, self.reference_image)
+        before = assign_shards(jobs, 2)
+        first = os.path.join(self.output_dir, "shard_0.csv")
+        with CsvResultWriter(first) as writer:
+            write_results(self.root_directory, self.file_paths, writer, self.reference_image, shard=(0, 2))
+
+        # The smallest file grows before the second shard starts, which changes the balanced split
+        smallest = min(jobs, key=lambda job: os.path.getsize(job[1]))[1]
+        with open(smallest, "ab") as f:
+            f.write(b"\0" * 100000)
+        self.assertNotEqual(assign_shards(jobs, 2), before)
+        second = os.path.join(self.output_dir, "shard_1.csv")
+        with CsvResultWriter(second) as writer:
+            write_results(self.root_directory, self.file_paths, writer, self.reference_image, shard=(1, 2))
+        with self.assertRaisesRegex(ValueError, "split the jobs differently"):
+            merge_shards([first, second])
+
+    def test_truncated_shard_output(self):
+        shard_files = self.run_shards(2)
+        with open(shard_files[1]) as f:
+            lines = f.readlines()
+        with open(shard_files[1], "w") as f:
+            f.writelines(lines[:-3])
+        with self.assertRaisesRegex(ValueError, "incomplete"):
+            merge_shards(shard_files)
+
+
+if __name__ == '__main__':
+    unittest.main()
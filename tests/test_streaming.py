@@ -0,0 +1,53 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import nibabel as nib
+from nibabel.streamlines import Tractogram
+from tract_analysis.streaming import iter_tck_chunks, stream_tract_statistics, make_array_sequence
+from tract_analysis.tract_context import TractContext
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.reference_image = os.path.join(self.tmp_dir, "reference.nii")
+        nib.save(nib.Nifti1Image(np.zeros((20, 20, 20), dtype=np.float32), np.diag([2.0, 2.0, 2.0, 1.0])),
+                 self.reference_image)
+        rng = np.random.default_rng(2)
+        self.streamlines = [(rng.random((n, 3)) * 30 + 5).astype(np.float32) for n in rng.integers(1, 40, 57)]
+        self.tract_path = os.path.join(self.tmp_dir, "tract.tck")
+        nib.streamlines.save(Tractogram(self.streamlines, affine_to_rasmm=np.eye(4)), self.tract_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_iter_tck_chunks(self):
+        # Small read buffers force streamlines to straddle buffer boundaries
+        chunks = list(iter_tck_chunks(self.tract_path, chunk_size=10, buffer_points=13))
+        self.assertEqual([len(chunk) for chunk in chunks], [10] * 5 + [7])
+        streamlines = [s for chunk in chunks for s in chunk]
+        self.assertEqual(len(streamlines), len(self.streamlines))
+        for read, written in zip(streamlines, self.streamlines):
+            np.testing.assert_array_equal(read, written)
+
+    def test_make_array_sequence(self):
+        data = np.arange(15, dtype=np.float32).reshape(5, 3)
+        streamlines = make_array_sequence(data, [2, 3])
+        np.testing.assert_array_equal(streamlines[1], data[2:])
+
+    def test_stream_tract_statistics_matches_in_memory(self):
+        tract_stats, accumulator = stream_tract_statistics(self.tract_path, self.reference_image, chunk_size=8)
+        expected = TractContext(self.tract_path, self.reference_image).tract_statistics()
+        for stat_name, stat_value in expected.items():
+            self.assertAlmostEqual(tract_stats[stat_name], stat_value, places=4)
+        first, last = accumulator.endpoints
+        self.assertEqual(len(first), len(self.streamlines))
+        E1, E2 = accumulator.surface_endpoints()
+        self.assertEqual(len(E1) + len(E2), 2 * len(self.streamlines))
+
+
+if __name__ == '__main__':
+    unittest.main()
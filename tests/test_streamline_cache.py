@@ -0,0 +1,96 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+import numpy as np
+from dipy.io.streamline import load_tractogram
+from tract_analysis import streaming
+from tract_analysis.file_discovery import scan_files
+from tract_analysis.reference_registry import get_reference
+from tract_analysis.streaming import stream_tract_statistics
+from tract_analysis.streamline_cache import configure_streamline_cache, streamline_cache_paths, \
+    read_streamline_cache, write_streamline_cache
+from tract_analysis.tractogram_processing import load_tractogram_file
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+
+class TestStreamlineCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root_directory = tempfile.mkdtemp()
+        self.reference_image = make_cohort(self.root_directory, ["sub-01"], ["AF_L.tck"])
+        self.reference = get_reference(self.reference_image)
+        self.tract_path = os.path.join(self.root_directory, "sub-01", "tracts", "AF_L.tck")
+        configure_streamline_cache(write=True)
+
+    def tearDown(self):
+        configure_streamline_cache(write=False)
+        shutil.rmtree(self.root_directory)
+
+    def assertSameStreamlines(self, streamlines, expected):
+        self.assertEqual(len(streamlines), len(expected))
+        for streamline, expected_streamline in zip(streamlines, expected):
+            np.testing.assert_array_equal(streamline, expected_streamline)
+
+    def test_round_trip_is_memory_mapped(self):
+        expected = load_tractogram(self.tract_path, self.reference.header).streamlines
+        load_tractogram_file(self.tract_path, self.reference)
+        self.assertTrue(os.path.isfile(streamline_cache_paths(self.tract_path)["meta"]))
+
+        cached = load_tractogram_file(self.tract_path, self.reference)
+        self.assertSameStreamlines(cached.streamlines, expected)
+        self.assertIsInstance(cached.streamlines._data, np.memmap)
+        self.assertEqual(cached.streamlines._data.dtype, np.float32)
+
+        # The cache is not copied on the way into the tractogram
+        points = np.load(streamline_cache_paths(self.tract_path)["points"], mmap_mode="r")
+        self.assertEqual(cached.streamlines._data.filename, points.filename)
+        # The full dipy tractogram is still available, as a copy
+        self.assertSameStreamlines(cached.to_stateful().streamlines, expected)
+
+    def test_changed_file_invalidates_cache(self):
+        load_tractogram_file(self.tract_path, self.reference)
+        self.assertIsNotNone(read_streamline_cache(self.tract_path, self.reference))
+
+        os.utime(self.tract_path, ns=(0, 0))
+        self.assertIsNone(read_streamline_cache(self.tract_path, self.reference))
+        # The next load parses the file again and refreshes the cache
+        load_tractogram_file(self.tract_path, self.reference)
+        self.assertIsNotNone(read_streamline_cache(self.tract_path, self.reference))
+
+    def test_incomplete_cache_is_ignored(self):
+        streamlines = load_tractogram_file(self.tract_path, self.reference).streamlines
+        paths = streamline_cache_paths(self.tract_path)
+        with open(paths["points"], "r+b") as f:
+            f.truncate(os.path.getsize(paths["points"]) // 2)
+        self.assertIsNone(read_streamline_cache(self.tract_path, self.reference))
+
+        write_streamline_cache(self.tract_path, streamlines, self.reference)
+        os.remove(paths["meta"])
+        self.assertIsNone(read_streamline_cache(self.tract_path, self.reference))
+
+    def test_cache_directory_and_streaming(self):
+        cache_dir = os.path.join(self.root_directory, "cache")
+        configure_streamline_cache(cache_dir, write=True)
+        expected, _ = stream_tract_statistics(self.tract_path, self.reference, chunk_size=7)
+        load_tractogram_file(self.tract_path, self.reference)
+        self.assertEqual(len(os.listdir(cache_dir)), 3)
+        self.assertFalse(os.path.exists(os.path.dirname(streamline_cache_paths(self.tract_path)["meta"])))
+
+        # The chunks come from the memory-mapped cache, not from parsing the file
+        configure_streamline_cache(cache_dir, write=False)
+        with mock.patch.object(streaming, "iter_tck_chunks", side_effect=AssertionError("parsed the file")):
+            tract_stats, _ = stream_tract_statistics(self.tract_path, self.reference, chunk_size=7)
+        for stat_name, stat_value in expected.items():
+            self.assertAlmostEqual(tract_stats[stat_name], stat_value, places=4)
+
+    def test_discovery_skips_cache(self):
+        load_tractogram_file(self.tract_path, self.reference)
+        index = scan_files(self.root_directory)
+        self.assertEqual(index["AF_L.tck"], [self.tract_path])
+        self.assertFalse(any(name.endswith(".npy") for name in index))
+
+
+if __name__ == '__main__':
+    unittest.main()
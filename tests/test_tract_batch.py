@@ -0,0 +1,64 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from tract_analysis.calculations import streamline_lengths, streamline_spans, calculate_curl
+from tract_analysis.tract_batch import TractBatch, grouped_mean
+from tract_analysis.tract_context import TractContext
+from tract_analysis.tests.test_data_aggregation import make_bundle, make_cohort
+
+
+class TestTractBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.root_directory = tempfile.mkdtemp()
+        self.file_paths = ["AF_L.tck", "AF_R.tck", "CST_L.tck"]
+        self.reference_image = make_cohort(self.root_directory, ["sub-01"], self.file_paths)
+        self.tract_paths = [os.path.join(self.root_directory, "sub-01", "tracts", name) for name in self.file_paths]
+        self.tracts = [make_bundle(n, seed=n) for n in (12, 1, 30)]
+
+    def tearDown(self):
+        shutil.rmtree(self.root_directory)
+
+    def test_grouped_mean(self):
+        values = np.array([1.0, 2.0, 3.0, 10.0])
+        means = grouped_mean(values, np.array([0, 0, 0, 2]), 3)
+        np.testing.assert_allclose(means[[0, 2]], [2.0, 10.0])
+        self.assertTrue(np.isnan(means[1]))
+
+    def test_matches_per_tract_arrays(self):
+        batch = TractBatch.from_streamlines(self.tracts, names=["a", "b", "c"])
+        self.assertEqual(batch.n_tracts, 3)
+        np.testing.assert_array_equal(batch.streamline_counts, [12, 1, 30])
+        np.testing.assert_array_equal(batch.tract_ids[:13], [0] * 12 + [1])
+
+        for tract, streamlines in enumerate(self.tracts):
+            view = batch.tract_streamlines(tract)
+            self.assertEqual(len(view), len(streamlines))
+            np.testing.assert_array_equal(view[0], streamlines[0])
+
+            lengths = streamline_lengths(streamlines)
+            spans = streamline_spans(streamlines)
+            in_tract = batch.tract_ids == tract
+            np.testing.assert_allclose(batch.lengths[in_tract], lengths, rtol=1e-12)
+            np.testing.assert_allclose(batch.spans[in_tract], spans, rtol=1e-12)
+            self.assertAlmostEqual(batch.mean_lengths[tract], np.mean(lengths), places=9)
+            self.assertAlmostEqual(batch.curls[tract], calculate_curl(lengths, spans), places=9)
+
+    def test_statistics_match_tract_context(self):
+        batch = TractBatch.from_files(self.tract_paths, self.reference_image)
+        self.assertEqual(batch.names, self.file_paths)
+        for tract_path, batch_stats in zip(self.tract_paths, batch.tract_statistics()):
+            context_stats = TractContext(tract_path, self.reference_image).tract_statistics()
+            self.assertEqual(list(batch_stats), list(context_stats))
+            for stat_name, value in context_stats.items():
+                self.assertAlmostEqual(batch_stats[stat_name], value, places=9)
+
+    def test_voxel_statistics_need_reference(self):
+        with self.assertRaises(ValueError):
+            TractBatch.from_streamlines(self.tracts).tract_statistics()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+import numpy as np
+import nibabel as nib
+from nibabel.streamlines import Tractogram
+from tract_analysis import tractogram_processing
+from tract_analysis.calculations import calculate_length, calculate_span, calculate_tract_statistics, \
+    calculate_end_statistics
+from tract_analysis.tract_context import TractContext
+from tract_analysis.utils import voxelise_tractogram
+
+
+class TestTractContext(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.reference_image = os.path.join(self.tmp_dir, "reference.nii")
+        nib.save(nib.Nifti1Image(np.zeros((20, 20, 20), dtype=np.float32), np.diag([2.0, 2.0, 2.0, 1.0])),
+                 self.reference_image)
+        rng = np.random.default_rng(1)
+        t = np.linspace(0, np.pi, 25)
+        self.streamlines = [(np.column_stack((20 + 12 * np.cos(t), 14 + 12 * np.sin(t), np.full_like(t, 20)))
+                             + rng.normal(0, 1.0, 3)).astype(np.float32) for _ in range(15)]
+        self.tract_path = os.path.join(self.tmp_dir, "tract.tck")
+        nib.streamlines.save(Tractogram(self.streamlines, affine_to_rasmm=np.eye(4)), self.tract_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_loads_once(self):
+        with mock.patch.object(tractogram_processing, "load_tractogram",
+                               wraps=tractogram_processing.load_tractogram) as load:
+            context = TractContext(self.tract_path, self.reference_image)
+            context.surface_endpoints
+            context.tract_statistics()
+        self.assertEqual(load.call_count, 1)
+
+    def test_matches_separate_stages(self):
+        context = TractContext(self.tract_path, self.reference_image)
+        N, voxels_data = voxelise_tractogram(self.tract_path, self.reference_image)
+        lengths = calculate_length(self.streamlines)
+        spans = calculate_span(self.streamlines)
+        expected = calculate_tract_statistics(lengths, spans, (2.0, 2.0, 2.0), N, voxels_data)
+        E1, E2 = context.surface_endpoints
+        end_voxel_counts = [len(np.unique(np.floor(E / 2.0 + 0.5), axis=0)) for E in (E1, E2)]
+        expected.update(calculate_end_statistics(E1, E2, end_voxel_counts, (2.0, 2.0, 2.0)))
+        self.assertEqual(sorted(context.tract_statistics()), sorted(expected))
+        for stat_name, stat_value in context.tract_statistics().items():
+            self.assertAlmostEqual(stat_value, expected[stat_name], places=4)
+
+    def test_cached_arrays(self):
+        context = TractContext(self.tract_path, self.reference_image)
+        self.assertIs(context.lengths, context.lengths)
+        first, last = context.endpoints
+        np.testing.assert_allclose(first, [s[0] for s in self.streamlines], atol=1e-4)
+        np.testing.assert_allclose(last, [s[-1] for s in self.streamlines], atol=1e-4)
+        E1, E2 = context.surface_endpoints
+        self.assertEqual(len(E1) + len(E2), 2 * len(self.streamlines))
+        # The derived arrays view the one packed buffer
+        self.assertIs(context.streamlines._data, context.flat_buffers[0])
+        np.testing.assert_allclose(context.spans, np.linalg.norm(first - last, axis=1), rtol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import shutil
+import tempfile
+import numpy as np
+from dipy.tracking.streamline import Streamlines, set_number_of_points
+from tract_analysis.data_aggregation import aggregate_results_to_dataframe
+from tract_analysis.precision import use_precision
+from tract_analysis.streaming import make_array_sequence
+from tract_analysis.tract_profiles import resample_streamlines, orient_streamlines, profile_metrics, tract_profile, \
+    profile_statistics
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+
+def make_tube(n_streamlines, radius, seed=0):
+    # Straight streamlines from x = -10 to x = 10 on a circle of the given radius, half of them reversed
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, n_streamlines, endpoint=False)
+    streamlines = []
+    for i, angle in enumerate(angles):
+        x = np.sort(rng.uniform(-10, 10, rng.integers(5, 40)))
+        x[0], x[-1] = -10, 10
+        points = np.column_stack((x, np.full_like(x, radius * np.cos(angle)), np.full_like(x, radius * np.sin(angle))))
+        streamlines.append(points[::-1] if i % 2 else points)
+    return Streamlines(streamlines)
+
+
+class TestTractProfiles(unittest.TestCase):
+
+    def test_resampling_matches_dipy(self):
+        rng = np.random.default_rng(1)
+        streamlines = Streamlines([np.cumsum(rng.normal(0, 1, (n, 3)), axis=0) for n in rng.integers(2, 60, 300)])
+        resampled = resample_streamlines(streamlines, 12)
+        expected = np.array([set_number_of_points(s, 12) for s in streamlines])
+        self.assertEqual(resampled.shape, (300, 12, 3))
+        np.testing.assert_allclose(resampled, expected, atol=1e-9)
+
+        with use_precision("float32"):
+            single = resample_streamlines(streamlines, 12)
+        self.assertEqual(single.dtype, np.float32)
+        np.testing.assert_allclose(single, expected, atol=1e-4)
+
+    def test_degenerate_streamlines(self):
+        points = [np.zeros((0, 3)), np.ones((1, 3)), np.ones((3, 3)), [[0, 0, 0], [0, 0, 0], [2, 0, 0], [2, 0, 0]]]
+        streamlines = make_array_sequence(np.concatenate(points).astype(np.float32), [len(p) for p in points])
+        resampled = resample_streamlines(streamlines, 3)
+        self.assertTrue(np.isnan(resampled[0]).all())
+        np.testing.assert_array_equal(resampled[1], np.ones((3, 3)))
+        np.testing.assert_array_equal(resampled[2], np.ones((3, 3)))
+        np.testing.assert_array_equal(resampled[3], [[0, 0, 0], [1, 0, 0], [2, 0, 0]])
+        with self.assertRaises(ValueError):
+            resample_streamlines(streamlines, 1)
+
+    def test_orientation(self):
+        resampled = resample_streamlines(make_tube(10, 3.0), 5)
+        flipped = orient_streamlines(resampled, np.array([[-10.0, 0, 0]]), np.array([[10.0, 0, 0]]))
+        np.testing.assert_array_equal(flipped, np.arange(10) % 2 == 1)
+        np.testing.assert_allclose(resampled[:, 0, 0], -10)
+        np.testing.assert_allclose(resampled[:, -1, 0], 10)
+
+    def test_straight_tube_profile(self):
+        profile = tract_profile(make_tube(40, 3.0), 4, np.array([[-10.0, 0, 0]]), np.array([[10.0, 0, 0]]))
+        self.assertEqual(sorted(profile), ["Curvature", "Diameter", "Span"])
+        np.testing.assert_allclose(profile["Span"], 5.0)
+        np.testing.assert_allclose(profile["Diameter"], 6.0)
+        np.testing.assert_allclose(profile["Curvature"], 0.0, atol=1e-12)
+
+    def test_arc_curvature(self):
+        t = np.linspace(0, np.pi, 200)
+        arc = np.column_stack((20 * np.cos(t), 20 * np.sin(t), np.zeros_like(t)))
+        profile = profile_metrics(resample_streamlines(Streamlines([arc, arc + [0, 0, 1]]), 41))
+        np.testing.assert_allclose(profile["Curvature"], 1 / 20, rtol=1e-3)
+        np.testing.assert_allclose(profile["Diameter"], 1.0, rtol=1e-3)
+
+        statistics = profile_statistics(profile)
+        self.assertEqual(len(statistics), 3 * 40)
+        self.assertAlmostEqual(statistics["Curvature Profile 01"], profile["Curvature"][0])
+
+    def test_aggregator_exports_profiles(self):
+        root_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root_directory)
+        file_paths = ["AF_L.tck", "AF_R.tck"]
+        reference_image = make_cohort(root_directory, ["sub-01", "sub-02"], file_paths)
+
+        dfs = aggregate_results_to_dataframe(root_directory, file_paths, reference_image, profile_segments=5)
+        batched = aggregate_results_to_dataframe(root_directory, file_paths, reference_image, profile_segments=5,
+                                                 batch_tracts=True)
+        for name in ("Span", "Diameter", "Curvature"):
+            for segment in range(1, 6):
+                stat_name = f"{name} Profile {segment:02d}"
+                self.assertEqual(dfs[stat_name].shape, (2, 2))
+                np.testing.assert_allclose(batched[stat_name].to_numpy(float), dfs[stat_name].to_numpy(float))
+        self.assertNotIn("Span Profile 01", aggregate_results_to_dataframe(root_directory, file_paths,
+                                                                           reference_image))
+
+
+if __name__ == '__main__':
+    unittest.main()
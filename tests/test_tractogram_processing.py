@@ -1,7 +1,7 @@
 import unittest
 import numpy as np
 from tract_analysis.tractogram_processing import load_tractogram_file, calculate_voxel_spacing, determine_surface_end, \
-    cluster_endpoints
+    cluster_endpoints, cluster_endpoint_array, two_means_labels, streamline_endpoints
 
 
 class TestTractogramProcessing(unittest.TestCase):
@@ -38,6 +38,35 @@ class TestTractogramProcessing(unittest.TestCase):
         self.assertTrue(isinstance(E1, np.ndarray))
         self.assertTrue(isinstance(E2, np.ndarray))
 
+    def test_streamline_endpoints(self):
+        streamlines = [np.array([[0, 0, 0], [1, 1, 1], [2, 2, 2]]), np.array([[5, 5, 5], [6, 6, 6]])]
+        np.testing.assert_array_equal(streamline_endpoints(streamlines),
+                                      [[0, 0, 0], [5, 5, 5], [2, 2, 2], [6, 6, 6]])
+
+    def test_two_means_agrees_with_kmeans(self):
+        rng = np.random.default_rng(0)
+        endpoints = np.vstack((rng.normal([0, 0, 0], 3, (500, 3)), rng.normal([40, 10, 0], 3, (400, 3))))
+        labels = two_means_labels(endpoints)
+        self.assertEqual(sorted(np.bincount(labels)), [400, 500])
+        E1, E2 = cluster_endpoint_array(endpoints, method="kmeans")
+        F1, F2 = cluster_endpoint_array(endpoints)
+        self.assertEqual({len(E1), len(E2)}, {len(F1), len(F2)})
+
+    def test_two_means_is_deterministic(self):
+        rng = np.random.default_rng(1)
+        endpoints = rng.normal(0, 10, (1000, 3))
+        np.testing.assert_array_equal(two_means_labels(endpoints), two_means_labels(endpoints.copy()))
+
+    def test_two_means_subsample(self):
+        rng = np.random.default_rng(2)
+        endpoints = np.vstack((rng.normal([0, 0, 0], 2, (3000, 3)), rng.normal([0, 30, 0], 2, (3000, 3))))
+        np.testing.assert_array_equal(two_means_labels(endpoints, sample_size=200), two_means_labels(endpoints))
+
+    def test_two_means_degenerate(self):
+        self.assertEqual(len(two_means_labels(np.zeros((1, 3)))), 1)
+        labels = two_means_labels(np.ones((10, 3)))
+        self.assertEqual(len(labels), 10)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,21 +1,102 @@
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
-from tract_analysis.utils import voxelise_tractogram, calculate_surface_volume, calculate_surface_area, \
-    calculate_end_surface_area, calculate_radius, calculate_irregularity
+import nibabel as nib
+from nibabel.streamlines import Tractogram
+from tract_analysis.calculations import calculate_tract_statistics
+from tract_analysis.utils import voxelise_tractogram, voxelise_tractogram_tckmap, compute_track_density, \
+    compute_voxel_grid, VoxelGrid, calculate_surface_volume, calculate_surface_area, calculate_end_surface_area, calculate_radius, \
+    calculate_irregularity, streamline_chunks, sorted_counts, merge_sparse_density
 
 
 class TestUtils(unittest.TestCase):
 
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.affine = np.diag([2.0, 2.0, 2.0, 1.0])
+        self.reference_image = os.path.join(self.tmp_dir, "reference.nii")
+        nib.save(nib.Nifti1Image(np.zeros((10, 10, 10), dtype=np.float32), self.affine), self.reference_image)
+
+        # Streamlines in world (mm) coordinates
+        self.streamlines = [np.array([[0, 4, 4], [18, 4, 4]], dtype=np.float32),
+                            np.array([[0, 4, 4], [8, 4, 4], [8, 12, 4]], dtype=np.float32),
+                            np.array([[10, 10, 10]], dtype=np.float32)]
+        self.tract_path = os.path.join(self.tmp_dir, "tract.tck")
+        nib.streamlines.save(Tractogram(self.streamlines, affine_to_rasmm=np.eye(4)), self.tract_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_compute_track_density(self):
+        density = compute_track_density(self.streamlines, self.affine, (10, 10, 10))
+        # Straight streamline along x crosses every voxel of row (y=2, z=2) once
+        self.assertTrue(np.all(density[:, 2, 2] >= 1))
+        # Voxels shared by the first two streamlines are counted once per streamline
+        np.testing.assert_array_equal(density[:5, 2, 2], [2, 2, 2, 2, 2])
+        np.testing.assert_array_equal(density[4, 2:7, 2], [2, 1, 1, 1, 1])
+        self.assertEqual(density[5, 5, 5], 1)
+        self.assertEqual(density.sum(), 10 + 9 + 1)
+
+    def test_compute_track_density_chunked(self):
+        density = compute_track_density(self.streamlines, self.affine, (10, 10, 10))
+        chunked = compute_track_density(self.streamlines, self.affine, (10, 10, 10), chunk_points=1)
+        np.testing.assert_array_equal(density, chunked)
+
+    def test_streamline_chunks(self):
+        counts = np.array([3, 5, 2, 9, 1, 1])
+        chunks = list(streamline_chunks(counts, 6))
+        self.assertEqual(chunks, [(0, 1), (1, 2), (2, 3), (3, 4), (4, 6)])
+        self.assertEqual(list(streamline_chunks(counts, 100)), [(0, 6)])
+
+    def test_sorted_counts(self):
+        values = np.array([7, 3, 7, 1, 3, 7])
+        unique, counts = sorted_counts(values)
+        np.testing.assert_array_equal(unique, [1, 3, 7])
+        np.testing.assert_array_equal(counts, [1, 2, 3])
+        linear_indices, counts = merge_sparse_density([(np.array([1, 5]), np.array([2, 1])),
+                                                       (np.array([5, 9]), np.array([4, 1]))])
+        np.testing.assert_array_equal(linear_indices, [1, 5, 9])
+        np.testing.assert_array_equal(counts, [2, 5, 1])
+
+    def test_voxel_grid_is_cropped(self):
+        grid = compute_voxel_grid(self.streamlines, self.reference_image)
+        dense = compute_track_density(self.streamlines, self.affine, (10, 10, 10))
+        self.assertEqual(grid.offset, (0, 2, 2))
+        self.assertEqual(grid.data.shape, (10, 5, 4))
+        self.assertEqual(grid.voxel_count, np.count_nonzero(dense))
+        np.testing.assert_array_equal(grid.to_dense(), dense)
+
+        coordinates, counts = grid.coordinates()
+        np.testing.assert_array_equal(coordinates, np.argwhere(dense))
+        np.testing.assert_array_equal(counts, dense[dense > 0])
+
+    def test_voxel_grid_metrics_match_dense(self):
+        lengths, spans = [18.0, 16.0, 0.0], [18.0, 11.3, 0.0]
+        _, dense = voxelise_tractogram(self.tract_path, self.reference_image)
+        N, cropped = voxelise_tractogram(self.tract_path, self.reference_image, cropped=True)
+        self.assertLess(cropped.size, dense.size)
+        self.assertEqual(calculate_tract_statistics(lengths, spans, (2.0, 2.0, 2.0), N, dense),
+                         calculate_tract_statistics(lengths, spans, (2.0, 2.0, 2.0), N, cropped))
+
+    def test_voxel_grid_empty(self):
+        grid = VoxelGrid.from_sparse(np.empty(0, dtype=np.intp), np.empty(0), (10, 10, 10))
+        self.assertEqual(grid.voxel_count, 0)
+        self.assertEqual(grid.to_dense().sum(), 0)
+
     def test_voxelise_tractogram(self):
-        # Mock paths for testing
-        tract_path = "mock_tractogram.tck"
-        reference_image = "mock_reference_image.nii"
+        voxel_count, voxels_data = voxelise_tractogram(self.tract_path, self.reference_image)
+        self.assertEqual(voxel_count, 10 + 4 + 1)
+        self.assertIsInstance(voxels_data, np.ndarray)
+        self.assertEqual(voxels_data.shape, (10, 10, 10))
 
-        # This function would require actual files, skipping actual call
-        # voxel_count, voxels_data = voxelise_tractogram(tract_path, reference_image)
-        # self.assertIsInstance(voxel_count, int)
-        # self.assertIsInstance(voxels_data, np.ndarray)
-        pass
+    @unittest.skipIf(shutil.which("tckmap") is None, "MRtrix3 tckmap is not installed")
+    def test_voxelise_tractogram_matches_tckmap(self):
+        voxel_count, voxels_data = voxelise_tractogram(self.tract_path, self.reference_image)
+        tckmap_count, tckmap_data = voxelise_tractogram_tckmap(self.tract_path, self.reference_image)
+        self.assertEqual(voxel_count, tckmap_count)
+        np.testing.assert_array_equal(voxels_data, tckmap_data)
 
     def test_calculate_surface_volume(self):
         surface_volume = calculate_surface_volume(4, 1.0)
@@ -27,8 +108,14 @@ class TestUtils(unittest.TestCase):
         surface_area = calculate_surface_area(voxels_data, voxel_spacing)
         self.assertTrue(isinstance(surface_area, float))
 
+    def test_count_point_voxels(self):
+        grid = compute_voxel_grid(self.streamlines, self.reference_image)
+        # Two points in voxel (0, 2, 2), one in (4, 2, 2) and one outside the cropped box
+        points = np.array([[0, 4, 4], [0.5, 4.2, 3.9], [8, 4, 4], [18, 18, 18]], dtype=np.float32)
+        self.assertEqual(grid.count_point_voxels(points, self.affine), 2)
+
     def test_calculate_end_surface_area(self):
-        surface_area = calculate_end_surface_area(4, (1.0, 1.0, 1.0))I
+        surface_area = calculate_end_surface_area(4, (1.0, 1.0, 1.0))
         self.assertEqual(surface_area, 1.0)
 
     def test_calculate_radius(self):
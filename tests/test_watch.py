@@ -0,0 +1,148 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from tract_analysis.data_aggregation import process_tract_file, iter_results
+from tract_analysis.result_writers import read_tidy_rows
+from tract_analysis.watch import SettleTracker, InotifyWatcher, PollingWatcher, open_folder_watcher, watch_results
+from tract_analysis.tests.test_data_aggregation import make_cohort
+
+
+def wait_for(condition, timeout=20.0):
+    # Poll a condition until it holds or the timeout expires
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.root_directory = os.path.join(self.directory, "root")
+        os.makedirs(self.root_directory)
+        self.reference_image = make_cohort(self.root_directory, ["sub-01"], ["AF_L.tck", "AF_R.tck"])
+        # Complete files to copy into the watched tree later
+        self.source_directory = os.path.join(self.directory, "source")
+        os.makedirs(self.source_directory)
+        make_cohort(self.source_directory, ["sub-02"], ["AF_L.tck", "AF_R.tck"])
+        self.output_file = os.path.join(self.directory, "out.csv")
+
+    def start(self, polling, settle=1.0):
+        stop = threading.Event()
+        thread = threading.Thread(target=watch_results,
+                                  args=(self.root_directory, ["AF_L.tck", "AF_R.tck"], self.output_file,
+                                        self.reference_image),
+                                  kwargs={"settle": settle, "interval": 0.1, "polling": polling, "stop": stop},
+                                  daemon=True)
+        thread.start()
+
+        def finish():
+            stop.set()
+            thread.join(20)
+        self.addCleanup(finish)
+
+    def files_in_output(self):
+        if not os.path.exists(self.output_file):
+            return set()
+        return {(row["subject"], row["tract"]) for row in read_tidy_rows(self.output_file)}
+
+    def check_incremental_updates(self, polling):
+        self.start(polling)
+        self.assertTrue(wait_for(lambda: self.files_in_output() == {("sub-01", "AF_L.tck"), ("sub-01", "AF_R.tck")}))
+
+        # A file written in two steps, the second within the settle time, is only processed once complete
+        source = os.path.join(self.source_directory, "sub-02", "tracts", "AF_L.tck")
+        with open(source, "rb") as f:
+            content = f.read()
+        target_directory = os.path.join(self.root_directory, "sub-02", "tracts")
+        os.makedirs(target_directory)
+        target = os.path.join(target_directory, "AF_L.tck")
+        with open(target, "wb") as f:
+            f.write(content[:len(content) // 2])
+        time.sleep(0.5)
+        self.assertNotIn(("sub-02", "AF_L.tck"), self.files_in_output())
+        with open(target, "wb") as f:
+            f.write(content)
+        self.assertTrue(wait_for(lambda: ("sub-02", "AF_L.tck") in self.files_in_output()))
+
+        expected = process_tract_file(("sub-02", target, self.reference_image, {"stream_chunk_size": None}))[2]
+        rows = [row for row in read_tidy_rows(self.output_file) if row["subject"] == "sub-02"]
+        self.assertEqual({row["metric"]: row["value"] for row in rows}, expected)
+
+        # Modified files are processed again and removed files leave the output
+        modified = os.path.join(self.root_directory, "sub-01", "tracts", "AF_R.tck")
+        shutil.copyfile(os.path.join(self.source_directory, "sub-02", "tracts", "AF_R.tck"), modified)
+        expected = process_tract_file(("sub-01", modified, self.reference_image, {"stream_chunk_size": None}))[2]
+        self.assertTrue(wait_for(lambda: {row["metric"]: row["value"] for row in read_tidy_rows(self.output_file)
+                                          if row["tract_path"] == modified} == expected))
+        os.remove(os.path.join(self.root_directory, "sub-01", "tracts", "AF_L.tck"))
+        self.assertTrue(wait_for(lambda: self.files_in_output() == {("sub-01", "AF_R.tck"), ("sub-02", "AF_L.tck")}))
+
+    def test_polling(self):
+        self.check_incremental_updates(polling=True)
+
+    def test_inotify(self):
+        watcher = open_folder_watcher(self.root_directory)
+        watcher.close()
+        if not isinstance(watcher, InotifyWatcher):
+            self.skipTest("inotify is not available")
+        self.check_incremental_updates(polling=False)
+
+    def test_prefetch_options_are_used(self):
+        stop = threading.Event()
+        calls = []
+
+        def record(jobs, *args):
+            calls.append(args)
+            stop.set()
+            return iter_results(jobs, *args)
+        with mock.patch("tract_analysis.watch.iter_results", record):
+            watch_results(self.root_directory, ["AF_L.tck", "AF_R.tck"], self.output_file, self.reference_image,
+                          prefetch=2, prefetch_depth=3, settle=0, interval=0.1, polling=True, stop=stop)
+        self.assertEqual(calls[0][-2:], (2, 3))
+        self.assertEqual(self.files_in_output(), {("sub-01", "AF_L.tck"), ("sub-01", "AF_R.tck")})
+
+    def test_inotify_reports_subjects(self):
+        try:
+            watcher = InotifyWatcher(self.root_directory)
+        except OSError:
+            self.skipTest("inotify is not available")
+        self.addCleanup(watcher.close)
+        self.assertEqual(watcher.wait(0.05), set())
+
+        os.makedirs(os.path.join(self.root_directory, "sub-03", "tracts"))
+        self.assertEqual(watcher.wait(0.2), {"sub-03"})
+        # The new directories are watched too
+        with open(os.path.join(self.root_directory, "sub-03", "tracts", "AF_L.tck"), "wb") as f:
+            f.write(b"partial")
+        with open(os.path.join(self.root_directory, "sub-01", "tracts", "AF_L.tck"), "ab") as f:
+            f.write(b"appended")
+        self.assertEqual(watcher.wait(0.2), {"sub-01", "sub-03"})
+        self.assertIsNone(PollingWatcher(self.root_directory).wait(0))
+
+    def test_settle_tracker(self):
+        tracker = SettleTracker(settle=5.0)
+        # Complete files settle at once, files written a moment ago wait
+        self.assertTrue(tracker.settled("old", (10, 90e9), now=100.0))
+        self.assertFalse(tracker.settled("new", (10, 99e9), now=100.0))
+        self.assertIn("new", tracker)
+        self.assertFalse(tracker.settled("new", (20, 102e9), now=102.0))
+        self.assertFalse(tracker.settled("new", (20, 102e9), now=106.0))
+        self.assertTrue(tracker.settled("new", (20, 102e9), now=107.0))
+        self.assertNotIn("new", tracker)
+        # A change observed later restarts the wait, even if the mtime is old (e.g. preserved by a copy)
+        self.assertFalse(tracker.settled("copy", (10, 99e9), now=100.0))
+        self.assertFalse(tracker.settled("copy", (30, 50e9), now=101.0))
+        self.assertTrue(tracker.settled("copy", (30, 50e9), now=106.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import os
+from functools import cached_property
+import numpy as np
+from tract_analysis.calculations import flatten_streamlines, streamline_lengths, streamline_spans, \
+    calculate_tract_statistics_from_summary, calculate_end_statistics
+from tract_analysis.reference_registry import get_reference
+from tract_analysis.streaming import make_array_sequence
+from tract_analysis.tractogram_processing import load_tractogram_file, cluster_endpoints, determine_surface_end
+from tract_analysis.utils import compute_voxel_grid
+
+
+def grouped_mean(values, group_ids, n_groups):
+    """
+    Mean of the values of each group, in one pass.
+
+    Parameters:
+        values (ndarray): Value of each element.
+        group_ids (ndarray): Group index of each element.
+        n_groups (int): Number of groups.
+
+    Returns:
+        means (ndarray): Mean of each group (float64), NaN for empty groups.
+    """
+    sums = np.bincount(group_ids, weights=values, minlength=n_groups)
+    counts = np.bincount(group_ids, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+class TractBatch:
+    """
+    Several tracts sharing one reference space, concatenated into one flat point buffer.
+
+    Streamlines are stored tract after tract, so each tract is a contiguous
+    range of streamlines given by ``tract_offsets``. Per-streamline arrays
+    (lengths, spans) are computed for all tracts in a single pass and reduced
+    per tract with grouped sums over the tract IDs.
+
+    Parameters:
+        data (ndarray): (n_points, 3) packed points of all streamlines in world (RAS+ mm) coordinates.
+        counts (ndarray): Number of points of each streamline.
+        tract_offsets (ndarray): Index of the first streamline of each tract, followed by the total
+            number of streamlines (n_tracts + 1 values).
+        names (list): Name of each tract.
+        reference_image (str or ReferenceImage): Reference image shared by the tracts; needed for
+            the voxel-based statistics.
+    """
+
+    def __init__(self, data, counts, tract_offsets, names=None, reference_image=None):
+        self.data = data
+        self.counts = np.asarray(counts, dtype=np.intp)
+        self.tract_offsets = np.asarray(tract_offsets, dtype=np.intp)
+        self.names = list(names) if names is not None else [str(i) for i in range(self.n_tracts)]
+        self.reference = get_reference(reference_image) if reference_image is not None else None
+        self._surface_endpoints = {}
+
+    @classmethod
+    def from_streamlines(cls, tracts, names=None, reference_image=None):
+        """
+        Concatenate the streamlines of several tracts.
+
+        Parameters:
+            tracts (list): Streamlines of each tract.
+            names (list): Name of each tract.
+            reference_image (str or ReferenceImage): Reference image shared by the tracts.
+
+        Returns:
+            batch (TractBatch): Batch of the tracts.
+        """
+        buffers = [flatten_streamlines(streamlines) for streamlines in tracts]
+        data = np.concatenate([data for data, _, _ in buffers]) if buffers else np.empty((0, 3), np.float32)
+        counts = np.concatenate([counts for _, _, counts in buffers]) if buffers else np.empty(0, np.intp)
+        tract_offsets = np.concatenate(([0], np.cumsum([len(counts) for _, _, counts in buffers])))
+        return cls(data, counts, tract_offsets, names, reference_image)
+
+    @classmethod
+    def from_files(cls, tract_paths, reference_image):
+        """
+        Load several tractography files sharing one reference image into a batch.
+
+        Parameters:
+            tract_paths (list): Paths to the tractography files.
+            reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+
+        Returns:
+            batch (TractBatch): Batch of the tracts, named by file base name.
+        """
+        reference = get_reference(reference_image)
+        tracts = [load_tractogram_file(tract_path, reference).streamlines for tract_path in tract_paths]
+        return cls.from_streamlines(tracts, [os.path.basename(path) for path in tract_paths], reference)
+
+    @property
+    def n_tracts(self):
+        return len(self.tract_offsets) - 1
+
+    @cached_property
+    def streamline_counts(self):
+        """Number of streamlines of each tract."""
+        return np.diff(self.tract_offsets)
+
+    @cached_property
+    def tract_ids(self):
+        """Tract index of each streamline."""
+        return np.repeat(np.arange(self.n_tracts), self.streamline_counts)
+
+    @cached_property
+    def point_offsets(self):
+        """Index of the first point of each tract in the flat buffer, followed by the number of points."""
+        return np.concatenate(([0], np.cumsum(self.counts)))[self.tract_offsets]
+
+    @cached_property
+    def streamlines(self):
+        """All streamlines of the batch as one ArraySequence viewing the flat buffer."""
+        return make_array_sequence(self.data, self.counts)
+
+    def tract_streamlines(self, tract):
+        """
+        Streamlines of one tract, viewing the flat buffer.
+
+        Parameters:
+            tract (int): Index of the tract.
+
+        Returns:
+            streamlines (ArraySequence): Streamlines of the tract.
+        """
+        first, last = self.tract_offsets[tract], self.tract_offsets[tract + 1]
+        points = self.data[self.point_offsets[tract]:self.point_offsets[tract + 1]]
+        return make_array_sequence(points, self.counts[first:last])
+
+    @cached_property
+    def lengths(self):
+        """Length of every streamline of every tract."""
+        return streamline_lengths(self.streamlines)
+
+    @cached_property
+    def spans(self):
+        """Span of every streamline of every tract."""
+        return streamline_spans(self.streamlines)
+
+    @cached_property
+    def mean_lengths(self):
+        return grouped_mean(self.lengths, self.tract_ids, self.n_tracts)
+
+    @cached_property
+    def mean_spans(self):
+        return grouped_mean(self.spans, self.tract_ids, self.n_tracts)
+
+    @property
+    def curls(self):
+        """Curl of each tract, as calculate_curl."""
+        return (self.mean_lengths / self.mean_spans) * 2
+
+    def voxel_grid(self, tract):
+        """Cropped track density grid of one tract."""
+        if self.reference is None:
+            raise ValueError("A reference image is needed for the voxel-based statistics.")
+        return compute_voxel_grid(self.tract_streamlines(tract), self.reference)
+
+    def surface_endpoints(self, tract):
+        """(E1, E2) endpoint clusters of one tract, ordered by determine_surface_end."""
+        if tract not in self._surface_endpoints:
+            self._surface_endpoints[tract] = determine_surface_end(*cluster_endpoints(self.tract_streamlines(tract)))
+        return self._surface_endpoints[tract]
+
+    def tract_statistics_of(self, tract):
+        """
+        Calculate the tract statistics of one tract.
+
+        Parameters:
+            tract (int): Index of the tract.
+
+        Returns:
+            tract_stats (dict): Statistics of calculate_tract_statistics and calculate_end_statistics.
+        """
+        grid = self.voxel_grid(tract)
+        tract_stats = calculate_tract_statistics_from_summary(self.mean_lengths[tract], self.mean_spans[tract],
+                                                              self.reference.zooms, grid.voxel_count, grid.data)
+        E1, E2 = self.surface_endpoints(tract)
+        end_voxel_counts = (grid.count_point_voxels(E1, self.reference.affine),
+                            grid.count_point_voxels(E2, self.reference.affine))
+        tract_stats.update(calculate_end_statistics(E1, E2, end_voxel_counts, self.reference.zooms))
+        return tract_stats
+
+    def tract_statistics(self):
+        """
+        Calculate the tract statistics of every tract.
+
+        Returns:
+            tract_stats (list): One dictionary per tract, in batch order, as returned by tract_statistics_of.
+        """
+        return [self.tract_statistics_of(tract) for tract in range(self.n_tracts)]
@@ -0,0 +1,107 @@
+from functools import cached_property
+import numpy as np
+from tract_analysis.calculations import flatten_streamlines, streamline_lengths, streamline_spans, \
+    calculate_tract_statistics, calculate_end_statistics
+from tract_analysis.reference_registry import get_reference
+from tract_analysis.streaming import make_array_sequence
+from tract_analysis.tract_profiles import tract_profile
+from tract_analysis.tractogram_processing import load_tractogram_file, cluster_endpoint_array, determine_surface_end
+from tract_analysis.utils import compute_voxel_grid
+
+
+class TractContext:
+    """
+    A tractogram loaded once, with the arrays derived from it computed on first use and reused.
+
+    Every stage of the per-file pipeline (clustering, lengths and spans,
+    voxelization and statistics) reads from the same context, so a file is
+    read from disk exactly once and its streamlines are packed into one
+    flat buffer exactly once.
+
+    Parameters:
+        tract_path (str): Path to the tractography file.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+        tractogram (StatefulTractogram): The file already loaded; it is loaded here if None.
+    """
+
+    def __init__(self, tract_path, reference_image, tractogram=None):
+        self.tract_path = tract_path
+        self.reference = get_reference(reference_image)
+        if tractogram is None:
+            tractogram = load_tractogram_file(tract_path, self.reference)
+        self.tractogram = tractogram
+
+    @cached_property
+    def streamlines(self):
+        """Streamlines viewing the packed buffer, which the derived arrays reuse without repacking."""
+        data, _, counts = self.flat_buffers
+        return make_array_sequence(data, counts)
+
+    @property
+    def voxel_spacing(self):
+        return self.reference.zooms
+
+    @cached_property
+    def flat_buffers(self):
+        """(data, offsets, lengths) of the packed streamline buffer."""
+        return flatten_streamlines(self.tractogram.streamlines)
+
+    @cached_property
+    def lengths(self):
+        return streamline_lengths(self.streamlines)
+
+    @cached_property
+    def spans(self):
+        return streamline_spans(self.streamlines)
+
+    @cached_property
+    def endpoints(self):
+        """(first, last) points of every streamline, gathered from the flat buffer."""
+        data, offsets, counts = self.flat_buffers
+        return data[offsets], data[offsets + counts - 1]
+
+    @cached_property
+    def surface_endpoints(self):
+        """(E1, E2) endpoint clusters, ordered by determine_surface_end."""
+        E1, E2 = cluster_endpoint_array(np.concatenate(self.endpoints))
+        return determine_surface_end(E1, E2)
+
+    @cached_property
+    def voxel_grid(self):
+        """Track density map cropped to the bounding box of the bundle."""
+        return compute_voxel_grid(self.streamlines, self.reference)
+
+    @cached_property
+    def end_voxel_counts(self):
+        """Number of voxels of the cropped grid covered by the E1 and by the E2 endpoints."""
+        return tuple(self.voxel_grid.count_point_voxels(E, self.reference.affine) for E in self.surface_endpoints)
+
+    @property
+    def voxels(self):
+        """(voxel_count, voxels_data) of the cropped track density map."""
+        return self.voxel_grid.voxel_count, self.voxel_grid.data
+
+    def tract_profile(self, n_segments=20):
+        """
+        Compute the along-tract profile, oriented by the cached surface endpoints.
+
+        Parameters:
+            n_segments (int): Number of segments along the tract.
+
+        Returns:
+            profile (dict): Metric name -> (n_segments,) array, see tract_profiles.profile_metrics.
+        """
+        return tract_profile(self.streamlines, n_segments, *self.surface_endpoints)
+
+    def tract_statistics(self):
+        """
+        Calculate the tract statistics from the cached arrays.
+
+        Returns:
+            tract_stats (dict): Dictionary containing the computed statistics.
+        """
+        N, voxels_data = self.voxels
+        tract_stats = calculate_tract_statistics(self.lengths, self.spans, self.voxel_spacing, N, voxels_data)
+        tract_stats.update(calculate_end_statistics(*self.surface_endpoints, self.end_voxel_counts,
+                                                    self.voxel_spacing))
+        return tract_stats
@@ -0,0 +1,170 @@
+import numpy as np
+from tract_analysis.calculations import flatten_streamlines
+from tract_analysis.precision import compute_dtype
+from tract_analysis.profiling import profiled
+from tract_analysis.tractogram_processing import cluster_endpoints, determine_surface_end
+
+# Along-tract metrics computed per segment by profile_metrics
+PROFILE_METRICS = ("Span", "Diameter", "Curvature")
+
+
+@profiled("resample")
+def resample_streamlines(streamlines, n_points):
+    """
+    Resample every streamline to ``n_points`` points equally spaced along its arc length, in one pass.
+
+    The arc length is accumulated over the whole flat buffer, with a gap of
+    one between consecutive streamlines, so it increases through the buffer
+    and each streamline occupies its own range of it. The target arc lengths
+    of all streamlines are sorted as well, so a single ``np.interp`` of the
+    point indices (whose search resumes from the previous target) locates
+    them all in linear time as fractional buffer positions, which are then
+    interpolated along their segments.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines of the tract.
+        n_points (int): Number of points of each resampled streamline (at least 2).
+
+    Returns:
+        resampled (ndarray): (n_streamlines, n_points, 3) points in the dtype of the precision policy.
+            Streamlines of zero length repeat their first point; empty streamlines are NaN.
+    """
+    if n_points < 2:
+        raise ValueError("Streamlines are resampled to at least 2 points.")
+    data, offsets, counts = flatten_streamlines(streamlines)
+    dtype = compute_dtype()
+    resampled = np.full((len(counts), n_points, 3), np.nan, dtype=dtype)
+    defined = np.flatnonzero(counts > 0)
+    if len(defined) == 0:
+        return resampled
+
+    # Segment i leads from point i to point i + 1 (zero after the last point); arc lengths in float64
+    segments = np.zeros(data.shape, dtype=dtype)
+    np.subtract(data[1:], data[:-1], out=segments[:-1], dtype=dtype)
+    steps = np.empty(len(data), dtype=np.float64)
+    steps[0] = 0.0
+    steps[1:] = np.sqrt(np.einsum("ij,ij->i", segments[:-1], segments[:-1]))
+    steps[offsets[defined]] = 1.0
+    arc = np.cumsum(steps)
+
+    # The end targets are set exactly so that rounding never reaches into the gaps
+    first, last = arc[offsets[defined]], arc[offsets[defined] + counts[defined] - 1]
+    targets = first[:, None] + (last - first)[:, None] * np.linspace(0.0, 1.0, n_points)
+    targets[:, 0], targets[:, -1] = first, last
+    positions = np.interp(targets.ravel(), arc, np.arange(len(data), dtype=np.float64))
+
+    starts = positions.astype(np.intp)
+    weights = (positions - starts).astype(dtype)
+    points = np.take(data, starts, axis=0).astype(dtype, copy=False)
+    points += np.take(segments, starts, axis=0) * weights[:, None]
+    points = points.reshape(len(defined), n_points, 3)
+    if len(defined) == len(counts):
+        return points
+    resampled[defined] = points
+    return resampled
+
+
+def orient_streamlines(resampled, E1, E2):
+    """
+    Flip the resampled streamlines in place so that they all run from the E1 end to the E2 end.
+
+    Parameters:
+        resampled (ndarray): (n_streamlines, n_points, 3) resampled streamlines.
+        E1 (ndarray): Endpoints of the first surface end, see determine_surface_end.
+        E2 (ndarray): Endpoints of the second surface end.
+
+    Returns:
+        flipped (ndarray): Boolean mask of the streamlines that were reversed.
+    """
+    E1_mean = np.mean(E1, axis=0, dtype=np.float64)
+    E2_mean = np.mean(E2, axis=0, dtype=np.float64)
+    first, last = resampled[:, 0], resampled[:, -1]
+    kept = np.linalg.norm(first - E1_mean, axis=1) + np.linalg.norm(last - E2_mean, axis=1)
+    reversed_ = np.linalg.norm(first - E2_mean, axis=1) + np.linalg.norm(last - E1_mean, axis=1)
+    flipped = reversed_ < kept
+    resampled[flipped] = resampled[flipped, ::-1]
+    return flipped
+
+
+def profile_metrics(resampled):
+    """
+    Compute the along-tract metrics of each segment of oriented, resampled streamlines.
+
+    Segment s joins points s and s + 1 of every streamline. Per segment:
+    "Span" is the mean distance between the two points, "Diameter" is twice
+    the mean distance of the segment midpoints from the bundle's central axis
+    (their centroid, along the mean segment direction), and "Curvature" is
+    the mean turning angle between consecutive segments of a streamline per
+    unit length (rad/mm) at the inner points bounding the segment.
+
+    Parameters:
+        resampled (ndarray): (n_streamlines, n_points, 3) oriented, resampled streamlines.
+
+    Returns:
+        profile (dict): Metric name -> (n_points - 1,) float64 array, NaN where no streamline is defined.
+    """
+    points = resampled[~np.isnan(resampled[:, 0, 0])]
+    n_segments = resampled.shape[1] - 1
+    if len(points) == 0:
+        return {name: np.full(n_segments, np.nan) for name in PROFILE_METRICS}
+
+    chords = points[:, 1:] - points[:, :-1]
+    chord_lengths = np.linalg.norm(chords, axis=2)
+    span = chord_lengths.mean(axis=0, dtype=np.float64)
+
+    midpoints = (points[:, 1:] + points[:, :-1]) / 2
+    centers = midpoints.mean(axis=0, dtype=np.float64)
+    axes = chords.mean(axis=0, dtype=np.float64)
+    axes /= np.maximum(np.linalg.norm(axes, axis=1, keepdims=True), np.finfo(np.float64).tiny)
+    offsets = midpoints - centers.astype(points.dtype)
+    radial = offsets - np.einsum("nsk,sk->ns", offsets, axes)[:, :, None] * axes
+    diameter = 2 * np.linalg.norm(radial, axis=2).mean(axis=0, dtype=np.float64)
+
+    # Turning angle between consecutive chords per unit length at each inner point, averaged over
+    # the (one or two) inner points bounding each segment
+    turns = np.arctan2(np.linalg.norm(np.cross(chords[:, :-1], chords[:, 1:]), axis=2),
+                       np.einsum("nsk,nsk->ns", chords[:, :-1], chords[:, 1:]))
+    spacing = (chord_lengths[:, :-1] + chord_lengths[:, 1:]) / 2
+    bends = np.full((len(points), n_segments + 1), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bends[:, 1:-1] = np.where(spacing > 0, turns / spacing, np.nan)
+    bounding = np.stack((bends[:, :-1], bends[:, 1:]))
+    defined = ~np.isnan(bounding)
+    with np.errstate(invalid="ignore"):
+        curvature = np.where(defined, bounding, 0).sum(axis=(0, 1)) / defined.sum(axis=(0, 1))
+
+    return {"Span": span, "Diameter": diameter, "Curvature": curvature}
+
+
+def tract_profile(streamlines, n_segments=20, E1=None, E2=None):
+    """
+    Compute the along-tract profile of a bundle: resample, orient and measure every segment.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines of the tract.
+        n_segments (int): Number of segments along the tract.
+        E1 (ndarray): Endpoints of the first surface end; clustered from the streamlines if None.
+        E2 (ndarray): Endpoints of the second surface end.
+
+    Returns:
+        profile (dict): Metric name -> (n_segments,) float64 array, see profile_metrics.
+    """
+    if E1 is None or E2 is None:
+        E1, E2 = determine_surface_end(*cluster_endpoints(streamlines))
+    resampled = resample_streamlines(streamlines, n_segments + 1)
+    orient_streamlines(resampled, E1, E2)
+    return profile_metrics(resampled)
+
+
+def profile_statistics(profile):
+    """
+    Flatten a tract profile into named scalar statistics, e.g. "Diameter Profile 01".
+
+    Parameters:
+        profile (dict): Metric name -> (n_segments,) array, as returned by tract_profile.
+
+    Returns:
+        tract_stats (dict): One value per metric and segment, numbered from the E1 end.
+    """
+    return {f"{name} Profile {segment + 1:02d}": float(value)
+            for name, values in profile.items() for segment, value in enumerate(values)}
@@ -1,21 +1,66 @@
-import nibabel as nib
+from dipy.io.stateful_tractogram import StatefulTractogram, Space
 from dipy.io.streamline import load_tractogram
 from dipy.tracking.streamline import Streamlines
-from sklearn.cluster import KMeans
 import numpy as np
+from tract_analysis.calculations import flatten_streamlines
+from tract_analysis.precision import as_compute
+from tract_analysis.profiling import profiled
+from tract_analysis.reference_registry import get_reference
+from tract_analysis.streamline_cache import load_cached_streamlines, store_cached_streamlines
 
+class MappedTractogram:
+    """
+    Streamlines memory-mapped from a streamline cache, with their reference image.
+
+    StatefulTractogram copies the streamlines it is given, which would read
+    the whole memory map; the pipeline only needs the streamlines, so cached
+    files are returned as this lighter object instead.
+
+    Parameters:
+        streamlines (ArraySequence): Streamlines in world (RAS+ mm) coordinates.
+        reference (ReferenceImage): Reference image of the tractogram.
+    """
+
+    space = Space.RASMM
+
+    def __init__(self, streamlines, reference):
+        self.streamlines = streamlines
+        self.reference = reference
+
+    def to_stateful(self):
+        """
+        Build a StatefulTractogram of the streamlines, copying them into memory.
+
+        Returns:
+            tractogram (StatefulTractogram): Tractogram in RASMM space.
+        """
+        return StatefulTractogram(self.streamlines, self.reference.header, Space.RASMM)
+
+
+@profiled("load")
 def load_tractogram_file(tract_path, reference_image):
     """
     Load the tractogram file.
 
+    An up-to-date streamline cache of the file (see streamline_cache) is
+    memory-mapped instead of parsing the file and returned as a
+    MappedTractogram; otherwise the file is loaded with dipy and converted
+    into a cache if writing caches is configured.
+
     Parameters:
         tract_path (str): Path to the tractography file.
-        reference_image (str): Path to the reference image file.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
 
     Returns:
-        tractogram: Loaded tractogram.
+        tractogram (StatefulTractogram or MappedTractogram): Loaded tractogram, with its streamlines
+            in world (RAS+ mm) coordinates.
     """
-    tractogram = load_tractogram(tract_path, reference_image)
+    reference = get_reference(reference_image)
+    streamlines = load_cached_streamlines(tract_path, reference)
+    if streamlines is not None:
+        return MappedTractogram(streamlines, reference)
+    tractogram = load_tractogram(tract_path, reference.header)
+    store_cached_streamlines(tract_path, tractogram.streamlines, reference)
     return tractogram
 
 def calculate_voxel_spacing(reference_image):
@@ -23,14 +68,12 @@ def calculate_voxel_spacing(reference_image):
     Calculate the voxel spacing of the reference image.
 
     Parameters:
-        reference_image (str): Path to the reference image file.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
 
     Returns:
         voxel_spacing (tuple): Spacing of the voxels in x, y, and z directions.
     """
-    img = nib.load(reference_image)
-    voxel_spacing = img.header.get_zooms()[:3]
-    return voxel_spacing
+    return get_reference(reference_image).zooms
 
 def determine_surface_end(E1, E2):
     """
@@ -44,39 +87,139 @@ def determine_surface_end(E1, E2):
         E1 (ndarray): First set of endpoints.
         E2 (ndarray): Second set of endpoints.
     """
-    E1_mean = np.mean(E1, axis=0)
-    E2_mean = np.mean(E2, axis=0)
+    E1_mean = np.mean(E1, axis=0, dtype=np.float64)
+    E2_mean = np.mean(E2, axis=0, dtype=np.float64)
     largest_diff_dim = np.argmax(np.abs(E1_mean - E2_mean))
     if E1_mean[largest_diff_dim] > E2_mean[largest_diff_dim]:
         return E1, E2
     else:
         return E2, E1
 
-def cluster_endpoints(streamlines):
+def two_means_labels(points, max_iter=20, sample_size=None, seed=0):
     """
-    Cluster the endpoints of the streamlines into two groups.
+    Split points into two clusters with a deterministic, vectorized 2-means.
+
+    The clusters are seeded by splitting the points at their centroid along
+    the principal axis, then refined with Lloyd iterations. With two
+    centroids, the assignment step is a single projection onto the line
+    joining them. If sample_size is given, the centroids are fitted on a
+    reproducible random subsample and every point is then assigned to the
+    nearest one.
 
     Parameters:
-        streamlines (Streamlines): Streamlines of the tract.
+        points (ndarray): (n, 3) array of point coordinates.
+        max_iter (int): Maximum number of Lloyd iterations.
+        sample_size (int): Number of points used to fit the centroids; all points if None.
+        seed (int): Seed of the subsample selection.
+
+    Returns:
+        labels (ndarray): Cluster label (0 or 1) of each point.
+    """
+    points = as_compute(points)
+    if len(points) < 2:
+        return np.zeros(len(points), dtype=np.intp)
+
+    fit_points = points
+    if sample_size is not None and len(points) > sample_size:
+        rng = np.random.default_rng(seed)
+        fit_points = points[np.sort(rng.choice(len(points), sample_size, replace=False))]
+
+    # Seed with the split along the principal axis, oriented so that its largest component is positive
+    center = fit_points.mean(axis=0, dtype=np.float64).astype(points.dtype)
+    centered = fit_points - center
+    _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+    axis = eigenvectors[:, -1]
+    axis *= np.sign(axis[np.argmax(np.abs(axis))])
+    labels = centered @ axis > 0
+
+    # Lloyd iterations: a point is closer to c1 than to c0 iff p . (c1 - c0) > (|c1|^2 - |c0|^2) / 2
+    total = fit_points.sum(axis=0, dtype=np.float64)
+    for _ in range(max_iter):
+        n1 = np.count_nonzero(labels)
+        if n1 == 0 or n1 == len(labels):
+            break
+        sum1 = labels.astype(np.float64) @ fit_points
+        c0, c1 = (total - sum1) / (len(labels) - n1), sum1 / n1
+        new_labels = fit_points @ (c1 - c0).astype(points.dtype) > (c1 @ c1 - c0 @ c0) / 2
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    if fit_points is not points:
+        n1 = np.count_nonzero(labels)
+        if n1 == 0 or n1 == len(labels):
+            labels = (points - center) @ axis > 0
+        else:
+            sum1 = labels.astype(np.float64) @ fit_points
+            c0, c1 = (total - sum1) / (len(labels) - n1), sum1 / n1
+            labels = points @ (c1 - c0).astype(points.dtype) > (c1 @ c1 - c0 @ c0) / 2
+
+    return labels.astype(np.intp)
+
+@profiled("cluster_endpoints")
+def cluster_endpoint_array(endpoints, method="two_means", sample_size=None):
+    """
+    Cluster endpoint coordinates into two groups.
+
+    Parameters:
+        endpoints (ndarray): (n, 3) array of endpoint coordinates.
+        method (str): "two_means" for the deterministic two_means_labels engine,
+            or "kmeans" for scikit-learn KMeans.
+        sample_size (int): Number of endpoints used to fit the two_means centroids; all if None.
 
     Returns:
         E1 (ndarray): First set of endpoints.
         E2 (ndarray): Second set of endpoints.
     """
-    endpoints = np.vstack([s[0] for s in streamlines] + [s[-1] for s in streamlines])
-    kmeans = KMeans(n_clusters=2).fit(endpoints)
-    labels = kmeans.labels_
+    if method == "kmeans":
+        # scikit-learn takes about a second to import, so only load it when asked for
+        from sklearn.cluster import KMeans
+        labels = KMeans(n_clusters=2).fit(endpoints).labels_
+    elif method == "two_means":
+        labels = two_means_labels(endpoints, sample_size=sample_size)
+    else:
+        raise ValueError(f"Unknown clustering method: {method}")
     E1 = endpoints[labels == 0]
     E2 = endpoints[labels == 1]
     return E1, E2
 
+def streamline_endpoints(streamlines):
+    """
+    Get the first and last point of every streamline by indexing the flat buffer.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines of the tract.
+
+    Returns:
+        endpoints (ndarray): (2 * n_streamlines, 3) array with all first points followed by all last points.
+    """
+    data, offsets, counts = flatten_streamlines(streamlines)
+    return np.concatenate((data[offsets], data[offsets + counts - 1]))
+
+def cluster_endpoints(streamlines, method="two_means", sample_size=None):
+    """
+    Cluster the endpoints of the streamlines into two groups.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines of the tract.
+        method (str): Clustering method, see cluster_endpoint_array.
+        sample_size (int): Number of endpoints used to fit the centroids; all if None.
+
+    Returns:
+        E1 (ndarray): First set of endpoints.
+        E2 (ndarray): Second set of endpoints.
+    """
+    endpoints = streamline_endpoints(streamlines)
+    return cluster_endpoint_array(endpoints, method, sample_size)
+
+@profiled("preprocess_tractogram")
 def preprocess_tractogram(tract_path, reference_image):
     """
     Preprocess the tractogram file by loading it and calculating necessary parameters.
 
     Parameters:
         tract_path (str): Path to the tractography file.
-        reference_image (str): Path to the reference image file.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
 
     Returns:
         tractogram: Loaded tractogram.
@@ -84,8 +227,9 @@ def preprocess_tractogram(tract_path, reference_image):
         E1 (ndarray): First set of endpoints.
         E2 (ndarray): Second set of endpoints.
     """
-    tractogram = load_tractogram_file(tract_path, reference_image)
-    voxel_spacing = calculate_voxel_spacing(reference_image)
+    reference = get_reference(reference_image)
+    tractogram = load_tractogram_file(tract_path, reference)
+    voxel_spacing = calculate_voxel_spacing(reference)
     streamlines = tractogram.streamlines
     E1, E2 = cluster_endpoints(streamlines)
     E1, E2 = determine_surface_end(E1, E2)
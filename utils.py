@@ -1,34 +1,425 @@
 import os
+import shutil
+import subprocess
+import tempfile
 import numpy as np
 import nibabel as nib
 from scipy.ndimage import binary_erosion
+from tract_analysis.calculations import flatten_streamlines
+from tract_analysis.precision import as_compute, compute_dtype
+from tract_analysis.profiling import profiled
+from tract_analysis.reference_registry import get_reference
 
 
-def voxelise_tractogram(tract_path, reference_image):
+def _streamline_samples(points, offsets, counts, samples_per_voxel):
+    """
+    Supersample streamline segments given in voxel coordinates.
+
+    Each segment is split into enough sub-steps that consecutive samples are
+    at most ``1 / samples_per_voxel`` voxels apart along every axis, so that
+    voxels crossed by a long segment are not skipped. The samples are built
+    in the compute dtype of the precision policy.
+
+    Parameters:
+        points (ndarray): (n_points, 3) streamline points in voxel coordinates.
+        offsets (ndarray): Index of the first point of each streamline.
+        counts (ndarray): Number of points of each streamline.
+        samples_per_voxel (int): Number of samples per voxel length.
+
+    Returns:
+        samples (ndarray): (n_samples, 3) sampled points in voxel coordinates, in streamline order.
+        streamline_ids (ndarray): Index of the streamline of each sample.
+    """
+    points = as_compute(points)
+    point_ids = np.repeat(np.arange(len(counts)), counts)
+
+    # Every point starts a segment to the next point, except the last point of each streamline, which
+    # is sampled once on its own
+    vectors = np.zeros_like(points)
+    np.subtract(points[1:], points[:-1], out=vectors[:-1])
+    vectors[(offsets + counts - 1)[counts > 0]] = 0
+    steps = np.maximum(np.ceil(np.abs(vectors).max(axis=1, initial=0) * samples_per_voxel), 1).astype(np.intp)
+
+    point_index = np.repeat(np.arange(len(points)), steps)
+    step_index = np.arange(len(point_index)) - np.repeat(np.cumsum(steps) - steps, steps)
+    fractions = np.divide(step_index, steps[point_index], dtype=points.dtype)
+
+    samples = points[point_index]
+    samples += vectors[point_index] * fractions[:, None]
+    return samples, point_ids[point_index]
+
+
+def streamline_chunks(counts, chunk_points):
+    """
+    Split streamlines into consecutive chunks of at most ``chunk_points`` points.
+
+    Parameters:
+        counts (ndarray): Number of points of each streamline.
+        chunk_points (int): Point budget of a chunk; a longer streamline forms a chunk of its own.
+
+    Yields:
+        start (int): Index of the first streamline of the chunk.
+        stop (int): Index after the last streamline of the chunk.
+    """
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        budget = (ends[start - 1] if start else 0) + chunk_points
+        stop = max(int(np.searchsorted(ends, budget, side="right")), start + 1)
+        yield start, stop
+        start = stop
+
+
+def streamline_voxel_pairs(streamlines, affine, shape, samples_per_voxel=4, chunk_points=50000):
+    """
+    Find the voxels traversed by each streamline, as distinct (streamline, voxel) pairs.
+
+    The streamlines are mapped in chunks of about ``chunk_points`` points,
+    which bounds the memory of the supersampled points. Consecutive samples
+    of a streamline mostly fall in the same voxel, so those repeats are
+    dropped before the pairs are made unique.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines in world (RAS+ mm) coordinates.
+        affine (ndarray): 4x4 voxel-to-world affine of the reference image.
+        shape (tuple): Shape of the reference image.
+        samples_per_voxel (int): Number of segment samples per voxel length.
+        chunk_points (int): Number of streamline points mapped at a time.
+
+    Yields:
+        streamline_ids (ndarray): Index of the streamline of each pair, per chunk of streamlines.
+        linear_indices (ndarray): C-order linear index of the voxel of each pair.
+    """
+    data, offsets, counts = flatten_streamlines(streamlines)
+    shape = tuple(int(n) for n in shape[:3])
+    n_voxels = int(np.prod(shape))
+    world_to_voxel = np.linalg.inv(affine)
+    rotation, translation = as_compute(world_to_voxel[:3, :3].T), as_compute(world_to_voxel[:3, 3])
+
+    for start, stop in streamline_chunks(counts, chunk_points):
+        chunk_counts = counts[start:stop]
+        first = offsets[start]
+        points = as_compute(data[first:first + chunk_counts.sum()]) @ rotation + translation
+        samples, streamline_ids = _streamline_samples(points, offsets[start:stop] - first, chunk_counts,
+                                                      samples_per_voxel)
+
+        samples += 0.5
+        indices = np.floor(samples, out=samples).astype(np.int32)
+        inside = np.all((indices >= 0) & (indices < shape), axis=1)
+        keys = (streamline_ids[inside] + start).astype(np.int64) * n_voxels
+        keys += np.ravel_multi_index(indices[inside].T, shape)
+
+        # Count each (streamline, voxel) pair once; sorting and masking is much faster than np.unique
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+        keys.sort()
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+        yield keys // n_voxels, keys % n_voxels
+
+
+def sparse_track_density(streamlines, affine, shape, samples_per_voxel=4, chunk_points=50000):
+    """
+    Compute the track density of the streamlines as sparse (voxel, count) pairs.
+
+    Every voxel is counted once per streamline traversing it, which is the
+    track density contrast produced by MRtrix ``tckmap``. Only the occupied
+    voxels are ever materialized.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines in world (RAS+ mm) coordinates.
+        affine (ndarray): 4x4 voxel-to-world affine of the reference image.
+        shape (tuple): Shape of the reference image.
+        samples_per_voxel (int): Number of segment samples per voxel length.
+        chunk_points (int): Number of streamline points mapped at a time.
+
+    Returns:
+        linear_indices (ndarray): Sorted C-order linear indices of the occupied voxels.
+        counts (ndarray): Number of streamlines traversing each of those voxels.
+    """
+    pairs = streamline_voxel_pairs(streamlines, affine, shape, samples_per_voxel, chunk_points)
+    return merge_sparse_density([sorted_counts(linear) for _, linear in pairs])
+
+
+def sorted_counts(values, weights=None):
+    """
+    Sort values and count (or sum the weights of) each distinct value.
+
+    Equivalent to ``np.unique(values, return_counts=True)``, which is several
+    times slower on recent numpy versions.
+
+    Parameters:
+        values (ndarray): Integer values.
+        weights (ndarray): Optional weight of each value; counts are summed weights if given.
+
+    Returns:
+        unique (ndarray): Sorted distinct values.
+        counts (ndarray): Number of occurrences (or summed weights) of each of them, as int64.
+    """
+    if weights is None:
+        values = np.sort(values)
+    else:
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], np.asarray(weights)[order]
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else np.empty(0, np.intp)
+    if weights is None:
+        counts = np.diff(np.r_[starts, len(values)])
+    else:
+        counts = np.add.reduceat(weights, starts) if len(starts) else np.empty(0)
+    return values[starts], counts.astype(np.int64)
+
+
+def merge_sparse_density(parts):
+    """
+    Sum several sparse (voxel, count) densities.
+
+    Parameters:
+        parts (list): List of (linear_indices, counts) pairs.
+
+    Returns:
+        linear_indices (ndarray): Sorted linear indices of the occupied voxels.
+        counts (ndarray): Summed counts of those voxels.
+    """
+    if not parts:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+    if len(parts) == 1:
+        return parts[0][0], parts[0][1].astype(np.int64)
+    return sorted_counts(np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]))
+
+
+class VoxelGrid:
+    """
+    Track density cropped to the bounding box of the occupied voxels.
+
+    Volume, surface and erosion computations on ``data`` give the same values
+    as on the full reference-sized volume, since everything outside the box is
+    empty and erosion treats the array border as empty too.
+
+    Attributes:
+        data (ndarray): Cropped uint32 density grid.
+        offset (tuple): Voxel index of ``data[0, 0, 0]`` in the reference grid.
+        shape (tuple): Shape of the full reference grid.
+    """
+
+    def __init__(self, data, offset, shape):
+        self.data = data
+        self.offset = tuple(int(i) for i in offset)
+        self.shape = tuple(int(n) for n in shape)
+
+    @classmethod
+    def from_sparse(cls, linear_indices, counts, shape):
+        """
+        Build a cropped grid from sparse (voxel, count) pairs.
+
+        Parameters:
+            linear_indices (ndarray): C-order linear indices of the occupied voxels.
+            counts (ndarray): Count of each voxel.
+            shape (tuple): Shape of the full reference grid.
+
+        Returns:
+            grid (VoxelGrid): Cropped density grid.
+        """
+        shape = tuple(int(n) for n in shape[:3])
+        if len(linear_indices) == 0:
+            return cls(np.zeros((1, 1, 1), dtype=np.uint32), (0, 0, 0), shape)
+        coordinates = np.stack(np.unravel_index(linear_indices, shape), axis=1)
+        low = coordinates.min(axis=0)
+        data = np.zeros(tuple(coordinates.max(axis=0) - low + 1), dtype=np.uint32)
+        data[tuple((coordinates - low).T)] = counts
+        return cls(data, low, shape)
+
+    @property
+    def voxel_count(self):
+        return int(np.count_nonzero(self.data))
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def coordinates(self):
+        """
+        Get the sparse coordinate form of the grid.
+
+        Returns:
+            coordinates (ndarray): (n, 3) voxel indices of the occupied voxels in the reference grid.
+            counts (ndarray): Density of each of those voxels.
+        """
+        local = np.argwhere(self.data)
+        return local + np.array(self.offset), self.data[tuple(local.T)]
+
+    def count_point_voxels(self, points, affine):
+        """
+        Count the distinct voxels of the grid containing the points, e.g. the endpoints of an end region.
+
+        Parameters:
+            points (ndarray): (n, 3) points in world (RAS+ mm) coordinates.
+            affine (ndarray): 4x4 voxel-to-world affine of the reference image.
+
+        Returns:
+            voxel_count (int): Number of distinct voxels containing at least one point; points outside
+                the cropped box are not counted.
+        """
+        return count_point_voxels(points, affine, self.data.shape, self.offset)
+
+    def to_dense(self, dtype=np.float64):
+        """
+        Expand the grid to the full reference-sized volume.
+
+        Parameters:
+            dtype (dtype): Data type of the returned volume.
+
+        Returns:
+            voxels_data (ndarray): Density on the full reference grid.
+        """
+        dense = np.zeros(self.shape, dtype=dtype)
+        box = tuple(slice(o, o + n) for o, n in zip(self.offset, self.data.shape))
+        dense[box] = self.data
+        return dense
+
+
+@profiled("end_regions")
+def count_point_voxels(points, affine, shape, offset=(0, 0, 0)):
+    """
+    Count the distinct voxels of a grid containing the points.
+
+    The points are mapped to voxels with the rounding of the track density.
+
+    Parameters:
+        points (ndarray): (n, 3) points in world (RAS+ mm) coordinates.
+        affine (ndarray): 4x4 voxel-to-world affine of the reference image.
+        shape (tuple): Shape of the grid.
+        offset (tuple): Voxel index of the first voxel of the grid in the reference grid.
+
+    Returns:
+        voxel_count (int): Number of distinct voxels containing at least one point; points outside
+            the grid are not counted.
+    """
+    world_to_voxel = np.linalg.inv(affine)
+    voxel_points = as_compute(points) @ as_compute(world_to_voxel[:3, :3].T) + as_compute(world_to_voxel[:3, 3])
+    indices = np.floor(voxel_points + 0.5).astype(np.intp) - np.array(offset)
+    inside = np.all((indices >= 0) & (indices < shape[:3]), axis=1)
+    return len(np.unique(np.ravel_multi_index(indices[inside].T, shape[:3])))
+
+
+def accumulate_track_density(density, streamlines, affine, samples_per_voxel=4, chunk_points=50000):
+    """
+    Add the track density of the streamlines to a voxel count grid in place.
+
+    Parameters:
+        density (ndarray): 3D integer count grid with the shape of the reference image.
+        streamlines (Streamlines): Streamlines in world (RAS+ mm) coordinates.
+        affine (ndarray): 4x4 voxel-to-world affine of the reference image.
+        samples_per_voxel (int): Number of segment samples per voxel length.
+        chunk_points (int): Number of streamline points mapped at a time.
+
+    Returns:
+        density (ndarray): The updated count grid.
+    """
+    linear_indices, counts = sparse_track_density(streamlines, affine, density.shape, samples_per_voxel, chunk_points)
+    density[np.unravel_index(linear_indices, density.shape[:3])] += counts.astype(density.dtype)
+    return density
+
+
+def compute_track_density(streamlines, affine, shape, samples_per_voxel=4, chunk_points=50000):
+    """
+    Compute the track density map of the streamlines on a reference grid.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines in world (RAS+ mm) coordinates.
+        affine (ndarray): 4x4 voxel-to-world affine of the reference image.
+        shape (tuple): Shape of the reference image.
+        samples_per_voxel (int): Number of segment samples per voxel length.
+        chunk_points (int): Number of streamline points mapped at a time.
+
+    Returns:
+        density (ndarray): 3D array with the number of streamlines per voxel.
+    """
+    density = np.zeros(tuple(shape[:3]), dtype=np.int64)
+    return accumulate_track_density(density, streamlines, affine, samples_per_voxel, chunk_points)
+
+
+@profiled("voxelise")
+def compute_voxel_grid(streamlines, reference_image, samples_per_voxel=4, chunk_points=50000):
+    """
+    Compute the track density of the streamlines as a cropped VoxelGrid.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines in world (RAS+ mm) coordinates.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+        samples_per_voxel (int): Number of segment samples per voxel length.
+        chunk_points (int): Number of streamline points mapped at a time.
+
+    Returns:
+        grid (VoxelGrid): Density grid cropped to the bounding box of the bundle.
+    """
+    reference = get_reference(reference_image)
+    linear_indices, counts = sparse_track_density(streamlines, reference.affine, reference.shape,
+                                                  samples_per_voxel, chunk_points)
+    return VoxelGrid.from_sparse(linear_indices, counts, reference.shape)
+
+
+def voxelise_streamlines(streamlines, reference_image, cropped=False):
+    """
+    Voxelize already loaded streamlines and calculate the number of non-zero voxels.
+
+    Parameters:
+        streamlines (Streamlines): Streamlines in world (RAS+ mm) coordinates.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+        cropped (bool): Return the density cropped to the bundle's bounding box (uint32) instead of
+            the full reference-sized volume in the dtype of the precision policy. Volume and surface
+            metrics are identical.
+
+    Returns:
+        voxel_count (int): Number of non-zero voxels.
+        voxels_data (ndarray): Voxel data of the tractogram.
+    """
+    grid = compute_voxel_grid(streamlines, reference_image)
+    voxels_data = grid.data if cropped else grid.to_dense(compute_dtype())
+    return grid.voxel_count, voxels_data
+
+
+@profiled("voxelise_tractogram")
+def voxelise_tractogram(tract_path, reference_image, cropped=False):
     """
     Voxelize the tractogram and calculate the number of non-zero voxels.
 
     Parameters:
         tract_path (str): Path to the tractography file.
-        reference_image (str): Path to the reference image file.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+        cropped (bool): Return the density cropped to the bundle's bounding box, see voxelise_streamlines.
 
     Returns:
         voxel_count (int): Number of non-zero voxels.
         voxels_data (ndarray): Voxel data of the tractogram.
     """
-    # Generate voxel data using an external command (tckmap)
-    os.system(f"tckmap -template {reference_image} {tract_path} voxels.nii.gz")
+    from tract_analysis.tractogram_processing import load_tractogram_file
 
-    # Load the generated voxel data
-    voxels_img = nib.load("voxels.nii.gz")
-    voxels_data = voxels_img.get_fdata()
+    reference = get_reference(reference_image)
+    tractogram = load_tractogram_file(tract_path, reference)
+    return voxelise_streamlines(tractogram.streamlines, reference, cropped)
 
-    # Count the number of non-zero voxels
-    voxel_count = np.count_nonzero(voxels_data)
 
-    # Remove the temporary voxel file
-    os.remove("voxels.nii.gz")
+@profiled("tckmap")
+def voxelise_tractogram_tckmap(tract_path, reference_image):
+    """
+    Voxelize the tractogram with MRtrix ``tckmap``, for validating the native voxelizer.
 
+    Parameters:
+        tract_path (str): Path to the tractography file.
+        reference_image (str or ReferenceImage): Path to the reference image file or cached reference.
+
+    Returns:
+        voxel_count (int): Number of non-zero voxels.
+        voxels_data (ndarray): Voxel data of the tractogram.
+    """
+    reference_image = get_reference(reference_image).path
+    if shutil.which("tckmap") is None:
+        raise RuntimeError("tckmap (MRtrix3) is not available on PATH.")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, "voxels.nii")
+        subprocess.run(["tckmap", "-quiet", "-template", reference_image, tract_path, output_path], check=True)
+        voxels_data = np.asanyarray(nib.load(output_path).dataobj).astype(compute_dtype())
+
+    voxel_count = np.count_nonzero(voxels_data)
     return voxel_count, voxels_data
 
 
@@ -0,0 +1,346 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from tract_analysis.data_aggregation import iter_results, job_options
+from tract_analysis.file_discovery import scan_files, match_tract_files
+from tract_analysis.reference_registry import ReferenceRegistry
+from tract_analysis.result_writers import get_result_writer, infer_format, tidy_rows
+from tract_analysis.streamline_cache import SIDECAR_DIRNAME
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """
+    Folder watcher that reports every subject as possibly changed at each interval.
+
+    Parameters:
+        root_directory (str): Path to the root directory containing subject directories.
+    """
+
+    def __init__(self, root_directory):
+        self.root_directory = root_directory
+
+    def wait(self, timeout):
+        """
+        Wait for changes under the root directory.
+
+        Parameters:
+            timeout (float): Seconds to wait.
+
+        Returns:
+            subjects (set or None): Subject directories that changed; None if any subject may have changed.
+        """
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(PollingWatcher):
+    """
+    Folder watcher reporting the subject directories with file system events, using Linux inotify.
+
+    inotify watches are not recursive, so every directory below the root
+    (streamline cache directories excepted) gets its own watch, and new
+    directories are watched as they appear. If the kernel's event queue
+    overflows, every subject is reported.
+
+    Parameters:
+        root_directory (str): Path to the root directory containing subject directories.
+
+    Raises:
+        OSError: If inotify is not available.
+    """
+
+    def __init__(self, root_directory):
+        super().__init__(os.path.abspath(root_directory))
+        library = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}
+        self._add_tree(self.root_directory)
+
+    def _add_tree(self, directory):
+        # Watch a directory and all directories below it
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), WATCH_MASK)
+            if wd < 0:
+                continue  # Removed meanwhile, or unreadable
+            self._directories[wd] = current
+            try:
+                stack.extend(entry.path for entry in os.scandir(current)
+                             if entry.is_dir(follow_symlinks=False) and entry.name != SIDECAR_DIRNAME)
+            except OSError:
+                continue
+
+    def _subject(self, path):
+        relative = os.path.relpath(path, self.root_directory)
+        return None if relative == os.curdir or relative.startswith(os.pardir) else relative.split(os.sep)[0]
+
+    def wait(self, timeout):
+        # Events are collected for the whole timeout, so that a file being written, which sends an event
+        # per write, is rescanned once per interval rather than once per write
+        deadline = time.monotonic() + timeout
+        subjects = set()
+        overflow = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self._fd], [], [], remaining)[0]:
+                return None if overflow else subjects
+            try:
+                buffer = os.read(self._fd, 65536)
+            except BlockingIOError:
+                continue
+            position = 0
+            while position < len(buffer):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, position)
+                name = buffer[position + _EVENT_HEADER.size:position + _EVENT_HEADER.size + length].rstrip(b"\0")
+                position += _EVENT_HEADER.size + length
+                overflow |= bool(mask & IN_Q_OVERFLOW)
+                directory = self._directories.get(wd)
+                if directory is None:
+                    continue
+                if mask & IN_IGNORED:
+                    del self._directories[wd]
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and os.fsdecode(name) != SIDECAR_DIRNAME:
+                    self._add_tree(path)
+                subject = self._subject(path)
+                if subject is not None:
+                    subjects.add(subject)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def open_folder_watcher(root_directory, polling=False):
+    """
+    Watch a root directory with inotify where available, and by polling otherwise.
+
+    Parameters:
+        root_directory (str): Path to the root directory containing subject directories.
+        polling (bool): Always poll, e.g. on network file systems where inotify misses remote writes.
+
+    Returns:
+        watcher (PollingWatcher): InotifyWatcher or PollingWatcher.
+    """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root_directory)
+        except OSError as e:
+            print(f"Warning: inotify unavailable ({e}); polling {root_directory} instead.")
+    return PollingWatcher(root_directory)
+
+
+class SettleTracker:
+    """
+    Debounce files that may still be written: a file is settled once its size and mtime stayed unchanged for a while.
+
+    A file seen for the first time counts as unchanged since its mtime, so
+    files that were already complete are settled at once; once a file has
+    been seen changing, it is only settled ``settle`` seconds after the
+    change was observed.
+
+    Parameters:
+        settle (float): Seconds a file must stay unchanged.
+    """
+
+    def __init__(self, settle=5.0):
+        self.settle = settle
+        self._seen = {}
+
+    def settled(self, path, signature, now=None):
+        """
+        Record the current signature of a file and tell whether it has settled.
+
+        Parameters:
+            path (str): Path to the file.
+            signature (tuple): (size, mtime_ns) of the file.
+            now (float): Current time.time(); read if None.
+
+        Returns:
+            settled (bool): True if the file has not changed for ``settle`` seconds.
+        """
+        now = time.time() if now is None else now
+        seen = self._seen.get(path)
+        if seen is None:
+            # Unchanged since its mtime, unless that lies in the future
+            seen = self._seen[path] = (signature, min(now, signature[1] / 1e9))
+        elif seen[0] != signature:
+            seen = self._seen[path] = (signature, now)
+        if now - seen[1] >= self.settle:
+            del self._seen[path]
+            return True
+        return False
+
+    def forget(self, path):
+        self._seen.pop(path, None)
+
+    def __contains__(self, path):
+        return path in self._seen
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _write_atomically(output_file, output_format, rows):
+    # Write the whole table to a temporary file and rename it over the output, so that readers
+    # never see a partial table
+    root, extension = os.path.splitext(output_file)
+    temporary = f"{root}.partial{extension}"
+    with get_result_writer(temporary, output_format) as writer:
+        writer.write(rows)
+    os.replace(temporary, output_file)
+
+
+def watch_results(root_directory, file_paths, output_file, reference_image=None, format=None, workers=1,
+                  chunk_size=None, reference_pattern=None, stream_chunk_size=None, cache=None, batch_tracts=False,
+                  journal=None, precision=None, profile_segments=None, approximate=None, prefetch=0,
+                  prefetch_depth=None, settle=5.0, interval=2.0, polling=False, stop=None):
+    """
+    Keep the output file up to date while tractography files arrive under the root directory.
+
+    The existing files are processed first; the watcher then reports the
+    subject directories with new, modified or removed files (inotify, or a
+    full rescan every interval when polling), and only those subjects are
+    rescanned. New and modified tract files are processed once they have
+    settled (see SettleTracker), so half-written files are not picked up;
+    the rows of removed files are dropped. After each change, the whole
+    table is rewritten to a temporary file and renamed over the output.
+
+    Parameters:
+        root_directory (str): Path to the root directory containing subject directories.
+        file_paths (list): List of tractography file names (or patterns) to be analyzed.
+        output_file (str): Path to the output file (.csv, .parquet, .feather or .xlsx).
+        reference_image (str): Path to the reference image file.
+        format (str): Output format; inferred from the output file extension if None.
+        workers (int): Number of worker processes used to process the files.
+        chunk_size (int): Number of files dispatched to a worker at a time.
+        reference_pattern (str): Filename glob used to find each subject's own reference image.
+        stream_chunk_size (int): If set, .tck files are read in chunks of this many streamlines.
+        cache (ResultCache): Optional result cache.
+        batch_tracts (bool): Process the ready files of a subject in one batched pass.
+        journal (JobJournal): Optional journal recording every finished job; with a resumed journal,
+            unchanged files are not processed again after a restart.
+        precision (str): Precision policy, see aggregate_results_to_dataframe.
+        profile_segments (int): Number of along-tract profile segments, see aggregate_results_to_dataframe.
+        approximate (float): Sampled fraction or number of streamlines, see aggregate_results_to_dataframe.
+        prefetch (int): Number of prefetching loader threads, see iter_jobs.
+        prefetch_depth (int): Maximum number of loaded tractograms held at a time.
+        settle (float): Seconds a file must stay unchanged before it is processed.
+        interval (float): Seconds between checks for changes.
+        polling (bool): Poll even where inotify is available.
+        stop (Event): Watching stops once this threading.Event is set; otherwise until interrupted.
+
+    Returns:
+        results (dict): (subject_id, tract_path) -> statistics of every file in the output.
+    """
+    if not os.path.isdir(root_directory):
+        raise FileNotFoundError(f"Root directory does not exist: {root_directory}")
+    output_format = format or infer_format(output_file)
+    options = job_options(stream_chunk_size, batch_tracts, precision, profile_segments, approximate)
+    registry = ReferenceRegistry(pattern=reference_pattern, default=reference_image)
+    tracker = SettleTracker(settle)
+
+    subject_files = {}   # Subject -> paths of its matched tract files
+    references = {}      # Subject -> reference image
+    processed = {}       # Tract path -> signature of the file when it was processed
+    results = {}         # (subject, tract path) -> statistics
+    changed = None       # Subjects to rescan; None rescans all of them
+    watcher = open_folder_watcher(root_directory, polling)
+    print(f"Watching {root_directory} ({type(watcher).__name__}); press Ctrl+C to stop.")
+    try:
+        while stop is None or not stop.is_set():
+            if changed is None:
+                changed = {entry.name for entry in os.scandir(root_directory) if entry.is_dir()} | set(subject_files)
+            # Subjects with unsettled files are checked again even without events
+            changed |= {subject for subject, paths in subject_files.items() if any(p in tracker for p in paths)}
+
+            dirty = False
+            jobs = []
+            for subject_id in sorted(changed):
+                subject_path = os.path.join(root_directory, subject_id)
+                file_index = scan_files(subject_path) if os.path.isdir(subject_path) else {}
+                matches, _, _ = match_tract_files(file_index, file_paths)
+                paths = list(matches.values())
+
+                # Drop the rows of files that are gone
+                for tract_path in set(subject_files.get(subject_id, ())) - set(paths):
+                    dirty |= results.pop((subject_id, tract_path), None) is not None
+                    processed.pop(tract_path, None)
+                    tracker.forget(tract_path)
+                subject_files[subject_id] = paths
+                if not paths:
+                    continue
+
+                try:
+                    references[subject_id] = registry.resolve(subject_path, file_index)
+                except Exception as e:
+                    print(f"Error resolving reference image for subject {subject_id}: {e}")
+                    continue
+                now = time.time()
+                for tract_path in paths:
+                    signature = _file_signature(tract_path)
+                    if signature is None or processed.get(tract_path) == signature:
+                        continue
+                    if tracker.settled(tract_path, signature, now):
+                        jobs.append((subject_id, tract_path, references[subject_id], options))
+                        processed[tract_path] = signature
+
+            for subject_id, tract_path, tract_stats, error in iter_results(jobs, workers, chunk_size, cache,
+                                                                             journal, prefetch, prefetch_depth):
+                if error is not None:
+                    print(f"Error processing file {tract_path}: {error.strip().splitlines()[-1]}")
+                    dirty |= results.pop((subject_id, tract_path), None) is not None
+                    continue
+                results[(subject_id, tract_path)] = tract_stats
+                dirty = True
+
+            if dirty:
+                rows = [row for (subject_id, tract_path), tract_stats in sorted(results.items())
+                        for row in tidy_rows(subject_id, tract_path, tract_stats,
+                                             getattr(references[subject_id], "path", None))]
+                _write_atomically(output_file, output_format, rows)
+                print(f"Updated {output_file}: {len(results)} files ({len(jobs)} processed).")
+
+            changed = watcher.wait(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        watcher.close()
+    return results